@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+ActorContext: نقش و محدودهٔ کاربرِ آپدیت جاری، یک بار در هر آپدیت.
+
+قبلاً هر handler چند بار is_admin / is_superadmin / share_scope (→ can_manage_admin ×2 → descendants_of)
+را صدا می‌زد و همان چیزها چند بار از DB خوانده می‌شد. get_actor(context, session, uid) همه را با
+حداکثر ۴ کوئری (نقش/واحدها معمولاً از cache.access) می‌خواند و روی همان CallbackContext (که PTB برای هر آپدیت یک بار می‌سازد) نگه می‌دارد؛
+بعد از آن چک‌های دسترسی در حافظه انجام می‌شوند. معنای چک‌ها همان توابع crud است.
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Optional
+
+from sqlalchemy import literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import AdminTree
+from cache import access
+from crud import unit_subtree_ids
+
+@dataclass
+class ActorContext:
+    user_id: int
+    role: Optional[str] = None                  # Admin.role یا None برای کاربر عادی
+    super_ids: frozenset[int] = frozenset()     # همهٔ سوپرادمین‌ها (برای share_scope با مالکِ سوپر)
+    ancestors: tuple[int, ...] = ()             # نزدیک‌ترین والد اول (مثل crud.ancestors_of)
+    descendants: tuple[int, ...] = ()
+    unit_ids: tuple[int, ...] = ()              # واحدهای متصل (UnitAdmin)؛ اولی = واحد اصلی
+    _unit_scope: Optional[list[int]] = field(default=None, repr=False)
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role is not None
+
+    @property
+    def is_super(self) -> bool:
+        return self.role == "SUPER"
+
+    @property
+    def primary_unit_id(self) -> Optional[int]:
+        return self.unit_ids[0] if self.unit_ids else None
+
+    @property
+    def admin_scope(self) -> list[int]:
+        """خود + زیرمجموعه‌ها (crud.admin_scope_ids)"""
+        return [self.user_id, *self.descendants]
+
+    @property
+    def visible_cluster(self) -> list[int]:
+        """اجداد + خود + زیرمجموعه‌ها (crud.visible_cluster_ids)"""
+        return list(dict.fromkeys([*self.ancestors, self.user_id, *self.descendants]))
+
+    def can_manage_admin(self, target_admin_id: int) -> bool:
+        return target_admin_id == self.user_id or self.is_super or target_admin_id in self.descendants
+
+    def is_managed_by(self, other_admin_id: int) -> bool:
+        """crud.can_manage_admin(other, self) بدون کوئری: other سوپر است یا جزو اجداد من."""
+        return other_admin_id == self.user_id or other_admin_id in self.super_ids or other_admin_id in self.ancestors
+
+    def share_scope(self, other_admin_id: Optional[int]) -> bool:
+        """همان crud.share_scope(session, self, other)"""
+        if other_admin_id is None:
+            return self.is_super
+        return self.can_manage_admin(other_admin_id) or self.is_managed_by(other_admin_id)
+
+    async def unit_scope(self, session: AsyncSession) -> Optional[list[int]]:
+        """
+        واحدهای قابل‌دید: None برای سوپر (بدون محدودیت)، [] اگر واحدی ندارد،
+        وگرنه واحد اصلی + همهٔ زیرواحدها (یک کوئری CTE، memo در همین آپدیت).
+        """
+        if self.is_super:
+            return None
+        if self._unit_scope is None:
+            root = self.primary_unit_id
+            if not root:
+                self._unit_scope = []
+            else:
+                ids = (await session.execute(unit_subtree_ids(root))).scalars().all()
+                self._unit_scope = [root] + [i for i in ids if i != root]
+        return self._unit_scope
+
+
+async def resolve_actor(session: AsyncSession, user_id: int) -> ActorContext:
+    # نقش، سوپرها و واحدها از کش پردازه (cache.access)؛ فقط درخت ادمین‌ها هر بار خوانده می‌شود
+    role = await access.role(session, user_id)
+    super_ids = await access.super_ids(session)
+    if role is None:
+        return ActorContext(user_id=user_id, super_ids=super_ids)
+
+    # اجداد با عمق (برای ترتیب نزدیک‌ترین اول)؛ UNION جلوی حلقهٔ بی‌پایان را می‌گیرد
+    up = select(AdminTree.parent_admin_id.label("aid"), literal(1).label("depth")) \
+        .where(AdminTree.child_admin_id == user_id).cte("admin_up", recursive=True)
+    up = up.union(
+        select(AdminTree.parent_admin_id, up.c.depth + 1)
+        .join(up, AdminTree.child_admin_id == up.c.aid)
+        .where(up.c.depth < 64)
+    )
+    ancestors = [aid for aid, _ in (await session.execute(select(up.c.aid, up.c.depth).order_by(up.c.depth))).all()]
+
+    down = select(AdminTree.child_admin_id.label("aid")) \
+        .where(AdminTree.parent_admin_id == user_id).cte("admin_down", recursive=True)
+    down = down.union(
+        select(AdminTree.child_admin_id).join(down, AdminTree.parent_admin_id == down.c.aid)
+    )
+    descendants = [aid for aid in (await session.execute(select(down.c.aid))).scalars().all() if aid != user_id]
+
+    unit_ids = await access.unit_ids(session, user_id)
+
+    return ActorContext(
+        user_id=user_id, role=role, super_ids=super_ids,
+        ancestors=tuple(dict.fromkeys(ancestors)), descendants=tuple(descendants), unit_ids=tuple(unit_ids),
+    )
+
+
+async def get_actor(context, session: AsyncSession, user_id: int) -> ActorContext:
+    """ActorContext همین آپدیت؛ بار اول از DB و بعد از روی context."""
+    actor = getattr(context, "_actor", None) if context is not None else None
+    if actor is None or actor.user_id != user_id:
+        actor = await resolve_actor(session, user_id)
+        if context is not None:
+            context._actor = actor
+    return actor
+
+def forget_actor(context, *admin_ids: int):
+    """
+    بعد از نوشتن نقش/عضویت: ActorContext همین آپدیت را دور می‌ریزد و ورودی‌های
+    کش پردازه (cache.access) را برای admin_ids (یا همه، اگر خالی) باطل می‌کند.
+    """
+    access.invalidate(*admin_ids)
+    if context is not None and hasattr(context, "_actor"):
+        del context._actor
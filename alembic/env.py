@@ -19,6 +19,19 @@ from database import Base
 import models  # noqa: F401  (صرفاً برای پر کردن Base.metadata)
 target_metadata = Base.metadata
 
+from search import FTS_TABLE
+
+def include_object(obj, name, type_, reflected, compare_to):
+    # جدول مجازی FTS5 و جدول‌های سایه‌اش (_data، _idx، ...) با search.create_search_objects ساخته
+    # می‌شوند و در metadata نیستند؛ بدون این فیلتر autogenerate حذفشان را پیشنهاد می‌دهد
+    if type_ == "table" and name and name.startswith(FTS_TABLE):
+        return False
+    # ایندکس‌های مخصوص یک dialect (مثل trigram ـِ PG با ddl_if) روی dialect دیگر ساخته نمی‌شوند
+    ddl_if = getattr(obj, "_ddl_if", None) if not reflected else None
+    if ddl_if is not None and ddl_if.dialect and ddl_if.dialect != context.get_context().dialect.name:
+        return False
+    return True
+
 def _sync_url(async_url: str) -> str:
     # برای sqlite/pg async => sync
     return re.sub(r'\+asyncpg', '', async_url).replace('aiosqlite', 'pysqlite')
@@ -30,6 +43,7 @@ def run_migrations_offline():
         url=url,
         target_metadata=target_metadata,
         literal_binds=True,
+        include_object=include_object,
         dialect_opts={"paramstyle": "named"},
     )
     with context.begin_transaction():
@@ -43,7 +57,8 @@ def run_migrations_online():
         ini_section, prefix="sqlalchemy.", poolclass=pool.NullPool
     )
     with connectable.connect() as connection:
-        context.configure(connection=connection, target_metadata=target_metadata)
+        context.configure(connection=connection, target_metadata=target_metadata,
+                          include_object=include_object)
         with context.begin_transaction():
             context.run_migrations()
 
@@ -0,0 +1,144 @@
+"""baseline schema
+
+Revision ID: 1f0e6d2a9c41
+Revises:
+Create Date: 2026-10-18 09:00:00.000000
+
+جدول‌ها همان‌طور که قبل از اولین مهاجرت بودند (init_db ـِ نسخهٔ پایه).
+دیتابیسی که با init_db (create_all) ساخته شده همهٔ ستون‌ها/ایندکس‌های مدل فعلی را از قبل دارد؛
+به‌جای upgrade آن را یک بار با `alembic stamp head` علامت بزنید (alembic/README).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1f0e6d2a9c41'
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (جدول، ستون) ـهایی که index=True داشتند؛ نام‌ها مثل create_all: ix_<table>_<column>
+_INDEXED = (
+    ("campaigns", "admin_id"), ("campaigns", "root_campaign_id"), ("campaigns", "unit_id_owner"),
+    ("reports", "user_id"), ("reports", "campaign_id"), ("reports", "platform"), ("reports", "city_id"),
+    ("reports", "unit_id_owner"), ("reports", "submitted_to_campaign_id"), ("reports", "submitted_to_unit_id"),
+    ("report_items", "report_id"),
+    ("report_item_refs", "report_id"), ("report_item_refs", "source_report_item_id"),
+    ("users", "admin_id"),
+    ("cities", "admin_id"),
+    ("units", "parent_id"),
+    ("unit_admins", "admin_id"),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "campaigns",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("name", sa.String(255), nullable=False),
+        sa.Column("hashtag", sa.String(255)),
+        sa.Column("city", sa.String(255)),
+        sa.Column("platforms", sa.Text(), nullable=False),
+        sa.Column("description", sa.Text()),
+        sa.Column("active", sa.Boolean(), nullable=False),
+        sa.Column("created_by", sa.BigInteger()),
+        sa.Column("admin_id", sa.BigInteger()),
+        sa.Column("created_at", sa.String(50), nullable=False),
+        sa.Column("root_campaign_id", sa.Integer()),
+        sa.Column("unit_id_owner", sa.Integer()),
+        sa.Column("config_json", sa.Text()),
+        sa.Column("status", sa.String(32)),
+    )
+    op.create_table(
+        "reports",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("user_id", sa.BigInteger(), nullable=False),
+        sa.Column("campaign_id", sa.Integer(), sa.ForeignKey("campaigns.id"), nullable=False),
+        sa.Column("platform", sa.String(64), nullable=False),
+        sa.Column("created_at", sa.String(50), nullable=False),
+        sa.Column("city_id", sa.Integer()),
+        sa.Column("unit_id_owner", sa.Integer()),
+        sa.Column("submitted_to_campaign_id", sa.Integer()),
+        sa.Column("submitted_to_unit_id", sa.Integer()),
+        sa.Column("summary_json", sa.Text()),
+    )
+    op.create_table(
+        "report_items",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("report_id", sa.Integer(), sa.ForeignKey("reports.id"), nullable=False),
+        sa.Column("file_id", sa.String(256)),
+        sa.Column("file_path", sa.Text(), nullable=False),
+        sa.Column("file_name", sa.String(255), nullable=False),
+        sa.Column("created_at", sa.String(50), nullable=False),
+        sa.Column("platform", sa.String(64), nullable=False),
+    )
+    op.create_table(
+        "report_item_refs",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("report_id", sa.Integer(), sa.ForeignKey("reports.id"), nullable=False),
+        sa.Column("source_report_item_id", sa.Integer(), nullable=False),
+    )
+    op.create_table(
+        "users",
+        sa.Column("user_id", sa.BigInteger(), primary_key=True, autoincrement=False),
+        sa.Column("admin_id", sa.BigInteger(), nullable=False),
+        sa.Column("display_name", sa.String(255)),
+        sa.Column("city_id", sa.Integer()),
+        sa.Column("unit_id_paygah", sa.Integer()),
+    )
+    op.create_table(
+        "cities",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("name", sa.String(255), nullable=False),
+        sa.Column("admin_id", sa.BigInteger(), nullable=False),
+        sa.Column("created_at", sa.String(50), nullable=False),
+    )
+    op.create_table(
+        "admins",
+        sa.Column("admin_id", sa.BigInteger(), primary_key=True, autoincrement=False),
+        sa.Column("role", sa.String(16), nullable=False),
+    )
+    op.create_table(
+        "admin_tree",
+        sa.Column("parent_admin_id", sa.BigInteger(), primary_key=True, autoincrement=False),
+        sa.Column("child_admin_id", sa.BigInteger(), primary_key=True, autoincrement=False),
+        sa.UniqueConstraint("parent_admin_id", "child_admin_id"),
+    )
+    op.create_table(
+        "units",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("name", sa.String(255), nullable=False),
+        sa.Column("type", sa.String(16), nullable=False),
+        sa.Column("parent_id", sa.Integer()),
+        sa.Column("created_at", sa.String(50), nullable=False),
+    )
+    op.create_table(
+        "unit_admins",
+        sa.Column("unit_id", sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column("admin_id", sa.BigInteger(), primary_key=True, autoincrement=False),
+        sa.Column("role", sa.String(16), nullable=False),
+    )
+    op.create_table(
+        "campaign_copies",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("from_campaign_id", sa.Integer(), nullable=False),
+        sa.Column("to_campaign_id", sa.Integer(), nullable=False),
+        sa.Column("from_unit_id", sa.Integer(), nullable=False),
+        sa.Column("to_unit_id", sa.Integer(), nullable=False),
+        sa.Column("copied_by_admin_id", sa.BigInteger(), nullable=False),
+        sa.Column("copied_at", sa.String(50), nullable=False),
+    )
+    for table, col in _INDEXED:
+        op.create_index(f"ix_{table}_{col}", table, [col])
+    op.create_index("idx_units_parent", "units", ["parent_id"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in ("campaign_copies", "unit_admins", "units", "admin_tree", "admins", "cities",
+                  "users", "report_item_refs", "report_items", "reports", "campaigns"):
+        op.drop_table(table)
@@ -0,0 +1,47 @@
+"""campaign full-text search
+
+Revision ID: 5c1e7f0a9d21
+Revises: bea42739352e
+Create Date: 2026-10-18 11:02:17.000000
+
+SQLite: جدول مجازی FTS5 (campaigns_fts) + پر کردن از روی campaigns.
+PostgreSQL: ایندکس GIN روی tsvector نام/شهر/هشتگ/توضیحات.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1e7f0a9d21'
+down_revision: Union[str, Sequence[str], None] = 'bea42739352e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    from search import create_search_objects, campaign_tsvector
+
+    bind = op.get_bind()
+    if bind.dialect.name == "sqlite":
+        create_search_objects(bind)
+    elif bind.dialect.name == "postgresql":
+        campaigns = sa.table("campaigns", sa.column("name"), sa.column("city"),
+                             sa.column("hashtag"), sa.column("description"))
+        c = campaigns.c
+        op.create_index("ix_campaigns_fts", "campaigns",
+                        [campaign_tsvector(c.name, c.city, c.hashtag, c.description)],
+                        postgresql_using="gin")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    from search import FTS_TABLE
+
+    bind = op.get_bind()
+    if bind.dialect.name == "sqlite":
+        op.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    elif bind.dialect.name == "postgresql":
+        op.drop_index("ix_campaigns_fts", table_name="campaigns")
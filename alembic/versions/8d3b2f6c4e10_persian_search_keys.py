@@ -0,0 +1,136 @@
+"""persian normalized search keys
+
+Revision ID: 8d3b2f6c4e10
+Revises: 5c1e7f0a9d21
+Create Date: 2026-10-18 12:20:05.000000
+
+ستون search_key (متن نرمال‌شده با search.normalize_fa) برای units/users/campaigns + پر کردن.
+SQLite: محتوای campaigns_fts با متن نرمال‌شده بازسازی می‌شود.
+PostgreSQL: pg_trgm + ایندکس trigram روی units/users، و ایندکس tsvector کمپین روی search_key.
+ایندکس B-tree ساده ندارد: contains (LIKE '%q%') از آن استفاده نمی‌کند.
+"""
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d3b2f6c4e10'
+down_revision: Union[str, Sequence[str], None] = '5c1e7f0a9d21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_SOURCES = {
+    "units": ("name",),
+    "users": ("display_name",),
+    "campaigns": ("name", "city", "hashtag", "description"),
+}
+_PK = {"units": "id", "users": "user_id", "campaigns": "id"}
+
+# کپی ثابتِ search.normalize_fa در زمان این مهاجرت (مهاجرت نباید به کد جاری برنامه وابسته باشد؛
+# تغییر بعدیِ نرمال‌ساز با مهاجرت جدید و پر کردن دوباره اعمال می‌شود)
+_FA_TRANSLATE = str.maketrans({
+    "\u064a": "ی", "\u0649": "ی", "\u06d2": "ی",
+    "\u0643": "ک", "\u06a9": "ک",
+    "\u0629": "ه", "\u06c0": "ه",
+    "\u0623": "ا", "\u0625": "ا", "\u0622": "ا", "\u0671": "ا",
+    "\u0624": "و",
+    "\u0626": "ی",
+    "\u200c": " ", "\u200d": "", "\u200f": "", "\u200e": "",
+    "\u0640": "",
+    **{chr(0x06F0 + i): str(i) for i in range(10)},
+    **{chr(0x0660 + i): str(i) for i in range(10)},
+})
+_DIACRITICS_RE = re.compile("[\u064b-\u065f\u0670\u06d6-\u06ed]")
+_SPACES_RE = re.compile(r"\s+")
+
+_FTS_TABLE = "campaigns_fts"
+_FTS_COLUMNS = ("name", "city", "hashtag", "description")
+
+
+def _normalize(text_) -> str:
+    if not text_:
+        return ""
+    s = _DIACRITICS_RE.sub("", text_.translate(_FA_TRANSLATE))
+    return _SPACES_RE.sub(" ", s.casefold()).strip()
+
+
+def _tsvector(*columns):
+    """همان عبارت search.campaign_tsvector (ایندکس باید دقیقاً با کوئری یکی باشد)."""
+    doc = sa.func.coalesce(columns[0], sa.text("''"))
+    for col in columns[1:]:
+        doc = doc + sa.text("' '") + sa.func.coalesce(col, sa.text("''"))
+    return sa.func.to_tsvector(sa.text("'simple'"), doc)
+
+
+def _rebuild_sqlite_fts(bind):
+    exists = bind.execute(sa.text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:n"),
+                          {"n": _FTS_TABLE}).first()
+    if not exists:
+        return
+    cols = ", ".join(_FTS_COLUMNS)
+    rows = bind.execute(sa.text(f"SELECT id, {cols} FROM campaigns")).all()
+    bind.execute(sa.text(f"DELETE FROM {_FTS_TABLE}"))
+    if rows:
+        params = ", ".join(f":{c}" for c in _FTS_COLUMNS)
+        bind.execute(
+            sa.text(f"INSERT INTO {_FTS_TABLE}(rowid, {cols}) VALUES (:id, {params})"),
+            [{"id": r[0], **{c: _normalize(v) for c, v in zip(_FTS_COLUMNS, r[1:])}} for r in rows],
+        )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    with op.batch_alter_table("units") as batch:
+        batch.add_column(sa.Column("search_key", sa.String(255), nullable=True))
+    with op.batch_alter_table("users") as batch:
+        batch.add_column(sa.Column("search_key", sa.String(255), nullable=True))
+    with op.batch_alter_table("campaigns") as batch:
+        batch.add_column(sa.Column("search_key", sa.Text(), nullable=True))
+
+    for table, cols in _SOURCES.items():
+        pk = _PK[table]
+        t = sa.table(table, sa.column(pk), sa.column("search_key"), *[sa.column(c) for c in cols])
+        rows = bind.execute(sa.select(t.c[pk], *[t.c[c] for c in cols])).all()
+        batch = [{"_pk": row[0], "k": key} for row in rows
+                 if (key := _normalize(" ".join(v for v in row[1:] if v)))]
+        if batch:  # یک executemany برای کل جدول، نه یک رفت‌وبرگشت برای هر ردیف
+            bind.execute(t.update().where(t.c[pk] == sa.bindparam("_pk")).values(search_key=sa.bindparam("k")),
+                         batch)
+
+    if bind.dialect.name == "sqlite":
+        _rebuild_sqlite_fts(bind)
+    elif bind.dialect.name == "postgresql":
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for table in ("units", "users"):
+            op.create_index(f"ix_{table}_search_key_trgm", table, ["search_key"],
+                            postgresql_using="gin", postgresql_ops={"search_key": "gin_trgm_ops"})
+        campaigns = sa.table("campaigns", sa.column("search_key"))
+        op.drop_index("ix_campaigns_fts", table_name="campaigns")
+        op.create_index("ix_campaigns_fts", "campaigns", [_tsvector(campaigns.c.search_key)],
+                        postgresql_using="gin")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql":
+        campaigns = sa.table("campaigns", sa.column("name"), sa.column("city"),
+                             sa.column("hashtag"), sa.column("description"))
+        c = campaigns.c
+        op.drop_index("ix_campaigns_fts", table_name="campaigns")
+        op.create_index("ix_campaigns_fts", "campaigns",
+                        [_tsvector(c.name, c.city, c.hashtag, c.description)],
+                        postgresql_using="gin")
+        for table in ("units", "users"):
+            op.drop_index(f"ix_{table}_search_key_trgm", table_name=table)
+
+    with op.batch_alter_table("campaigns") as batch:
+        batch.drop_column("search_key")
+    with op.batch_alter_table("users") as batch:
+        batch.drop_column("search_key")
+    with op.batch_alter_table("units") as batch:
+        batch.drop_column("search_key")
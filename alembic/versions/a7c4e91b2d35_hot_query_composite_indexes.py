@@ -0,0 +1,43 @@
+"""hot query composite indexes
+
+Revision ID: a7c4e91b2d35
+Revises: 8d3b2f6c4e10
+Create Date: 2026-10-19 09:41:12.000000
+
+ایندکس‌های ترکیبی مطابق کوئری‌های پرتکرار (models.HOT_INDEXES)؛
+قبل/بعد با scripts/bench_indexes.py سنجیده شده.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c4e91b2d35'
+down_revision: Union[str, Sequence[str], None] = '8d3b2f6c4e10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_INDEXES = (
+    ("ix_campaigns_unit_active_id", "campaigns", ["unit_id_owner", "active", sa.text("id DESC")]),
+    ("ix_campaigns_root_unit", "campaigns", ["root_campaign_id", "unit_id_owner"]),
+    ("ix_reports_campaign_unit", "reports", ["campaign_id", "unit_id_owner"]),
+    ("ix_reports_user_campaign_platform_city", "reports", ["user_id", "campaign_id", "platform", "city_id"]),
+    ("ix_report_items_report_file", "report_items", ["report_id", "file_name"]),
+    ("ix_units_type_name", "units", ["type", "name"]),
+    ("ix_units_parent_type_name", "units", ["parent_id", "type", "name"]),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # دیتابیس‌هایی که با init_db (create_all) ساخته شده‌اند این ایندکس‌ها را از قبل دارند
+    for name, table, cols in _INDEXES:
+        op.create_index(name, table, cols, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name, table, _ in reversed(_INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
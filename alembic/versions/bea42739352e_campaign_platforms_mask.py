@@ -0,0 +1,59 @@
+"""campaign platforms bitmask
+
+Revision ID: bea42739352e
+Revises: 1f0e6d2a9c41
+Create Date: 2026-10-18 09:12:40.000000
+
+ستون platforms_mask را اضافه و از روی JSON قبلی پر می‌کند.
+ایندکس ندارد: فیلتر «هرکدام از پلتفرم‌ها» AND بیتی است و B-tree به کارش نمی‌آید.
+"""
+import json
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'bea42739352e'
+down_revision: Union[str, Sequence[str], None] = '1f0e6d2a9c41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# کپی ثابتِ crud.PLATFORM_BITS در زمان این مهاجرت (مهاجرت نباید به کد جاری برنامه وابسته باشد)
+_BITS = {k: 1 << i for i, k in enumerate((
+    "group", "supergroup", "channel", "broadcast", "neighborhood_media",
+    "instagram", "twitter", "telegram", "non_telegram",
+))}
+
+
+def _mask(raw) -> int:
+    try:
+        keys = json.loads(raw or "[]")
+    except ValueError:
+        return 0
+    mask = 0
+    for k in keys if isinstance(keys, list) else []:
+        mask |= _BITS.get(k, 0)
+    return mask
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table("campaigns") as batch:
+        batch.add_column(sa.Column("platforms_mask", sa.Integer(), nullable=False, server_default="0"))
+
+    conn = op.get_bind()
+    campaigns = sa.table("campaigns", sa.column("id", sa.Integer), sa.column("platforms", sa.Text),
+                         sa.column("platforms_mask", sa.Integer))
+    rows = conn.execute(sa.select(campaigns.c.id, campaigns.c.platforms)).all()
+    for cid, raw in rows:
+        mask = _mask(raw)
+        if mask:
+            conn.execute(campaigns.update().where(campaigns.c.id == cid).values(platforms_mask=mask))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("campaigns") as batch:
+        batch.drop_column("platforms_mask")
@@ -0,0 +1,31 @@
+"""campaigns admin/active composite index
+
+Revision ID: c3e58a1f90b7
+Revises: a7c4e91b2d35
+Create Date: 2026-10-19 11:02:37.000000
+
+ایندکس ix_campaigns_admin_active_id برای list_campaigns_for_admin؛
+scan کاملی که scripts/plan_check.py روی campaigns پیدا کرد.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e58a1f90b7'
+down_revision: Union[str, Sequence[str], None] = 'a7c4e91b2d35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index("ix_campaigns_admin_active_id", "campaigns",
+                    ["admin_id", "active", sa.text("id DESC")], if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_campaigns_admin_active_id", table_name="campaigns", if_exists=True)
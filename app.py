@@ -282,12 +282,19 @@ from flows.user_shortcuts import mystats_cmd, myexport_cmd, user_cb
 from flows.newcampaign import newcampaign, build_conversation as build_newcamp_conversation
 from flows.unit_stats_export import unit_stats_export_cb
 from flows.admin_profile import profile_cmd, profile_cb
+from flows.diagnostics import dbstats_cmd, querystats_cmd, slowqueries_cmd, sampleprof_cmd
 
 # --- Core / DB / Models ---
-from database import init_db, SessionLocal
+import jobs
+import loopwatch
+import metrics
+import querystats
+from database import init_db, session_scope, engine, read_engine
 from models import Admin
 from keyboards import user_reply_kb, admin_reply_kb, superadmin_reply_kb, BTN_SA_DASH
-from crud import is_admin, is_superadmin, get_user_admin, list_campaigns_for_admin_units
+from crud import get_user_admin, list_campaigns_for_admin_units, load_unit_index
+from actor import get_actor
+from middleware import UpdateSessionApplication
 from flows.superadmin import dashboard_entry, sa_router, adm_router
 from re import escape as re_escape
 
@@ -297,7 +304,7 @@ DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 # --- Bootstrap helpers ---
 async def bootstrap_admins(hard_admins: set[int]):
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         for aid in hard_admins:
             if not await s.get(Admin, aid):
                 s.add(Admin(admin_id=aid, role="SUPER"))
@@ -328,11 +335,12 @@ def parse_int_set_env(var_name: str, default: str = "") -> set[int]:
 
 # ------------------ Handlers ------------------
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         uid = update.effective_user.id
-        if await is_admin(s, uid):
+        actor = await get_actor(context, s, uid)
+        if actor.is_admin:
             text = "سلام!\n\nاز دکمه‌ها استفاده کن 👇"
-            kb = superadmin_reply_kb() if await is_superadmin(s, uid) else admin_reply_kb()
+            kb = superadmin_reply_kb() if actor.is_super else admin_reply_kb()
             await update.effective_message.reply_text(text, reply_markup=kb)
         else:
             text = "سلام!\n\nبرای ارسال گزارش دکمه زیر را بزن."
@@ -341,17 +349,17 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.effective_message.reply_text(text, reply_markup=user_reply_kb())
 
 async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    async with SessionLocal() as s:
-        kb = superadmin_reply_kb() if await is_superadmin(s, update.effective_user.id) else admin_reply_kb()
+    async with session_scope() as s:
+        kb = superadmin_reply_kb() if (await get_actor(context, s, update.effective_user.id)).is_super else admin_reply_kb()
     await update.effective_message.reply_text(
         "پنل ادمین فعال است. از دکمه‌ها/دستورات استفاده کنید:",
         reply_markup=kb
     )
 
 async def campaigns_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         uid = update.effective_user.id
-        if not await is_admin(s, uid):
+        if not (await get_actor(context, s, uid)).is_admin:
             return
         camps = await list_campaigns_for_admin_units(s, uid, active_only=False)
 
@@ -371,19 +379,30 @@ async def campaigns_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def on_startup(app: Application):
     hard_admins = parse_int_set_env("HARD_ADMINS")
     await init_db()
-    await bootstrap_admins(hard_admins)
+    with querystats.track("startup"):
+        await bootstrap_admins(hard_admins)
+        async with session_scope() as s:
+            await load_unit_index(s)
+    await metrics.start_server(app)  # /metrics اگر METRICS_PORT ست شده
+    loopwatch.start()
+    jobs.start(app)  # workerهای صف خروجی/آمار
+
+async def on_shutdown(app: Application):
+    await jobs.stop()
+    await loopwatch.stop()
+    await metrics.stop_server()
 
 # ------------------ App wiring ------------------
-def main():
-    token = os.getenv("TELEGRAM_TOKEN", "").strip()
-    if not token:
-        print("⚠️ TELEGRAM_TOKEN را در .env تنظیم کنید.")
-        return
-
-    import logging
-    logging.basicConfig(level=logging.INFO)
-
-    app: Application = ApplicationBuilder().token(token).post_init(on_startup).build()
+def build_application(builder: ApplicationBuilder, application_class: type[Application] = UpdateSessionApplication) -> Application:
+    """
+    Application کامل با همهٔ handlerها روی builder داده‌شده (token یا request دلخواه از بیرون).
+    main و scripts/bench_updates.py هر دو از همین استفاده می‌کنند تا گراف handlerها یکی باشد.
+    """
+    app: Application = (
+        builder
+        .application_class(application_class)  # یک session برای هر آپدیت
+        .post_init(on_startup).post_shutdown(on_shutdown).build()
+    )
 
     # 1) گزارش (Conversation) – قبل از بقیه
     app.add_handler(build_report_conversation())
@@ -453,12 +472,32 @@ def main():
         pattern=r"^(sa|adm):unit:(stats|export)(?::.*)?$"
     ))
     app.add_handler(CommandHandler("profile", profile_cmd))
+    app.add_handler(CommandHandler("sampleprof", sampleprof_cmd, block=False))  # چند ثانیه منتظر می‌ماند
+    app.add_handler(CommandHandler("dbstats", dbstats_cmd))
+    app.add_handler(CommandHandler("querystats", querystats_cmd))
+    app.add_handler(CommandHandler("slowqueries", slowqueries_cmd))
     app.add_handler(CallbackQueryHandler(profile_cb, pattern=r"^(sa|adm):profile(?::.*)?$"))
 
     # Routerها در انتها
     app.add_handler(CallbackQueryHandler(sa_router, pattern=r"^sa:"))
     app.add_handler(CallbackQueryHandler(adm_router, pattern=r"^adm:"))
 
+    # شمارش کوئری‌ها به‌ازای هر آپدیت (querystats) و متریک تأخیر هر handler (metrics)
+    querystats.install(engine, read_engine)
+    metrics.instrument_handlers(app)
+    return app
+
+def main():
+    token = os.getenv("TELEGRAM_TOKEN", "").strip()
+    if not token:
+        print("⚠️ TELEGRAM_TOKEN را در .env تنظیم کنید.")
+        return
+
+    import logging
+    logging.basicConfig(level=logging.INFO)
+
+    # MetricsRequest = همان HTTPXRequest پیش‌فرض PTB (pool 256) + زمان/خطای هر متد Bot API
+    app = build_application(ApplicationBuilder().token(token).request(metrics.MetricsRequest(connection_pool_size=256)))
     print("🚀 Bot is running (ORM-ready)…")
     app.run_polling(allowed_updates=Update.ALL_TYPES)
 
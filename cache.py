@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+"""
+کش‌های درون‌پردازه‌ای ربات.
+
+هر جدول یک «نسل» (generation) دارد که با هر flush/commit روی آن جدول یک واحد بالا می‌رود.
+مقدار کش‌شده همراه نسلِ جدول‌های وابسته‌اش ذخیره می‌شود؛ اگر یکی از آن جدول‌ها عوض شده باشد
+مقدار دیگر معتبر نیست. این کش‌ها مال یک پردازه‌اند (ربات polling تک‌پردازه‌ای است)؛
+TTL فقط برای نوشتن‌هایی است که از بیرون ربات (اسکریپت/پنل DB) انجام شود.
+
+کنار نسل‌ها، هر شیء نوشته‌شده چند «برچسب» موجودیت هم دارد (campaign:{id}، unit:{id}، admin:{id})
+که QueryCache با آن‌ها فقط ورودی‌های مربوط به همان موجودیت را دور می‌ریزد.
+"""
+from __future__ import annotations
+import functools
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, NamedTuple, Optional
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.sql.util import find_tables
+
+from models import Admin, Campaign, Report, Unit, UnitAdmin, User
+
+_generations: dict[str, int] = {}
+
+def bump(*tables: str):
+    for t in tables:
+        _generations[t] = _generations.get(t, 0) + 1
+
+def generation(tables: Iterable[str]) -> tuple:
+    return tuple((t, _generations.get(t, 0)) for t in sorted(tables))
+
+
+def _flushed_tables(session: Session) -> set[str]:
+    names = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(type(obj), "__tablename__", None)
+        if table:
+            names.add(table)
+    return names
+
+# کدام ستون‌های هر مدل به کدام برچسب می‌رسند (مقدار فعلی و مقدار قبل از تغییر هر دو)
+_TAG_COLUMNS: dict[type, tuple[tuple[str, str], ...]] = {
+    Campaign: (("campaign", "id"), ("unit", "unit_id_owner"), ("admin", "admin_id")),
+    Unit: (("unit", "id"), ("unit", "parent_id")),
+    UnitAdmin: (("unit", "unit_id"), ("admin", "admin_id")),
+    Admin: (("admin", "admin_id"),),
+    Report: (("campaign", "campaign_id"), ("unit", "unit_id_owner")),
+    User: (("user", "user_id"), ("unit", "unit_id_paygah")),
+}
+_COLLECTION_TAGS = {Unit: "units"}  # لیست‌های «همهٔ واحدها» (سوپرادمین)
+
+def entity_tags(obj) -> set[str]:
+    cols = _TAG_COLUMNS.get(type(obj))
+    if not cols:
+        return set()
+    tags = set()
+    state = inspect(obj)
+    for prefix, attr in cols:
+        hist = state.attrs[attr].history
+        for v in (*hist.unchanged, *hist.added, *hist.deleted):
+            if v is not None:
+                tags.add(f"{prefix}:{v}")
+    if type(obj) in _COLLECTION_TAGS:
+        tags.add(_COLLECTION_TAGS[type(obj)])
+    return tags
+
+def _flushed_tags(session: Session) -> set[str]:
+    tags = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        tags |= entity_tags(obj)
+    return tags
+
+@event.listens_for(Session, "after_flush")
+def _on_flush(session, flush_context):
+    tables = _flushed_tables(session)
+    if tables:
+        # هم همین‌جا (برای خواندن‌های همین session) و هم بعد از commit (برای بقیه) نسل عوض می‌شود
+        bump(*tables)
+        session.info.setdefault("_touched_tables", set()).update(tables)
+    tags = _flushed_tags(session)
+    if tags:
+        queries.invalidate(*tags)
+        session.info.setdefault("_touched_tags", set()).update(tags)
+
+@event.listens_for(Session, "after_commit")
+def _on_commit(session):
+    tables = session.info.pop("_touched_tables", None)
+    if tables:
+        bump(*tables)
+    tags = session.info.pop("_touched_tags", None)
+    if tags:
+        queries.invalidate(*tags)
+
+@event.listens_for(Session, "after_rollback")
+def _on_rollback(session):
+    session.info.pop("_touched_tables", None)
+    # ممکن است بین flush و rollback دادهٔ commit‌نشده کش شده باشد
+    tags = session.info.pop("_touched_tags", None)
+    if tags:
+        queries.invalidate(*tags)
+
+@event.listens_for(Session, "do_orm_execute")
+def _on_bulk_write(state):
+    # update()/delete() مستقیم از مسیر flush رد نمی‌شوند
+    if state.is_update or state.is_delete:
+        table = getattr(state.statement, "table", None)
+        if table is not None:
+            bump(table.name)
+            state.session.info.setdefault("_touched_tables", set()).add(table.name)
+            # ردیف‌های درگیر معلوم نیست → هر چیزی که به این جدول برچسب دارد
+            if table.name in _TAGGED_TABLES:
+                queries.clear()
+
+
+class TotalsCache:
+    """
+    کش تعداد کل نتایج لیست‌های صفحه‌بندی‌شده.
+    کلید = متن SQL + پارامترهای statement (پس محدوده/فیلتر/جستجو خودبه‌خود جزو کلید است).
+    """
+
+    def __init__(self, ttl: float = 120.0, maxsize: int = 2048):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: OrderedDict[str, tuple[tuple, float, int]] = OrderedDict()
+
+    @staticmethod
+    def _key(stmt) -> str:
+        compiled = stmt.compile()
+        return repr((str(compiled), sorted(compiled.params.items(), key=lambda kv: kv[0])))
+
+    async def count(self, session, stmt) -> int:
+        """SELECT count(*) روی stmt؛ اگر جدول‌های درگیر از آخرین شمارش عوض نشده باشند از کش."""
+        key = self._key(stmt)
+        tables = {t.name for t in find_tables(stmt, include_joins=True)}
+        gen = generation(tables)  # قبل از کوئری؛ نوشتنِ هم‌زمان، مقدار ذخیره‌شده را باطل می‌کند
+
+        hit = self._data.get(key)
+        now = time.monotonic()
+        if hit and hit[0] == gen and now - hit[1] < self.ttl:
+            self._data.move_to_end(key)
+            return hit[2]
+
+        total = (await session.execute(
+            select(func.count()).select_from(stmt.subquery())
+        )).scalar_one()
+        self._data[key] = (gen, now, total)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+        return total
+
+    def clear(self):
+        self._data.clear()
+
+
+totals = TotalsCache()
+
+
+class AccessCache:
+    """
+    کش Admin.role و عضویت‌های UnitAdmin برای چک‌های دسترسی/مسیریابی (تقریباً هر آپدیت).
+
+    ورودی‌ها تا ttl ثانیه معتبرند، مگر زودتر با invalidate() از مسیرهای نوشتن
+    (/addadmin، /linkadmin، ویزارد واحد، مدیریت ادمین‌های واحد) پاک شوند.
+    نتیجهٔ منفی (کاربر عادی = role None) هم کش می‌شود.
+    """
+
+    def __init__(self, ttl: float = 300.0):
+        self.ttl = ttl
+        self._roles: dict[int, tuple[float, Optional[str]]] = {}
+        self._units: dict[int, tuple[float, tuple[int, ...]]] = {}
+        self._supers: Optional[tuple[float, frozenset[int]]] = None
+
+    def _fresh(self, entry) -> bool:
+        return entry is not None and time.monotonic() - entry[0] < self.ttl
+
+    async def role(self, session, admin_id: int) -> Optional[str]:
+        hit = self._roles.get(admin_id)
+        if self._fresh(hit):
+            return hit[1]
+        role = (await session.execute(
+            select(Admin.role).where(Admin.admin_id == admin_id)
+        )).scalar_one_or_none()
+        self._roles[admin_id] = (time.monotonic(), role)
+        return role
+
+    async def super_ids(self, session) -> frozenset[int]:
+        if self._fresh(self._supers):
+            return self._supers[1]
+        ids = frozenset((await session.execute(
+            select(Admin.admin_id).where(Admin.role == "SUPER")
+        )).scalars().all())
+        self._supers = (time.monotonic(), ids)
+        return ids
+
+    async def unit_ids(self, session, admin_id: int) -> tuple[int, ...]:
+        hit = self._units.get(admin_id)
+        if self._fresh(hit):
+            return hit[1]
+        ids = tuple((await session.execute(
+            select(UnitAdmin.unit_id).where(UnitAdmin.admin_id == admin_id)
+        )).scalars().all())
+        self._units[admin_id] = (time.monotonic(), ids)
+        return ids
+
+    def invalidate(self, *admin_ids: int):
+        """بدون آرگومان همه‌چیز؛ وگرنه فقط همین ادمین‌ها (+ فهرست سوپرها، چون نقش ممکن است عوض شده باشد)."""
+        if not admin_ids:
+            self._roles.clear(); self._units.clear()
+        for aid in admin_ids:
+            self._roles.pop(aid, None)
+            self._units.pop(aid, None)
+        self._supers = None
+
+
+access = AccessCache()
+
+
+_TAGGED_TABLES = {m.__tablename__ for m in _TAG_COLUMNS}
+
+
+def _snapshot(value):
+    """نتیجه را مستقل از session نگه می‌دارد: هر شیء ORM → (کلاس، مقادیر ستون‌ها)."""
+    if isinstance(value, list):
+        return [_snapshot(v) for v in value]
+    state = inspect(value, raiseerr=False)
+    if state is None or not hasattr(state, "mapper"):
+        return value
+    return _Row(type(value), {a.key: getattr(value, a.key) for a in state.mapper.column_attrs})
+
+class _Row(NamedTuple):
+    model: type
+    values: dict
+
+async def _restore(session, value):
+    """شیء کش‌شده را بدون کوئری به session جاری وصل می‌کند (merge با load=False)."""
+    if isinstance(value, list):
+        return [await _restore(session, v) for v in value]
+    if isinstance(value, _Row):
+        model, values = value
+        obj = model(**values)
+        make_transient_to_detached(obj)
+        return await session.merge(obj, load=False)
+    return value
+
+
+class QueryCache:
+    """
+    کش read-through برای توابع خواندنی crud با برچسب موجودیت.
+
+        @queries.cached(lambda result, cid: [f"campaign:{cid}"])
+        async def get_campaign(session, cid): ...
+
+    کلید = نام تابع + آرگومان‌ها (بدون session). برچسب‌ها از روی آرگومان‌ها/نتیجه ساخته می‌شوند و
+    نوشتن روی هر موجودیت (با رویدادهای Session بالا) ورودی‌های همان برچسب را پاک می‌کند.
+    حافظه با LRU محدود است؛ hits/misses/evictions/invalidations در stats().
+
+    مثل TotalsCache، نتیجه‌ای که حین اجرای کوئری‌اش یکی از برچسب‌هایش باطل شده ذخیره نمی‌شود:
+    هر invalidate شمارهٔ ترتیبی می‌گیرد و _store آن را با mark() ـِ قبل از کوئری مقایسه می‌کند.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[tuple, tuple[float, object, frozenset[str]]] = OrderedDict()
+        self._by_tag: dict[str, set[tuple]] = {}
+        self.hits = self.misses = self.evictions = self.invalidations = self.stale = 0
+        self._seq = 0                       # شمارندهٔ invalidate/clear
+        self._tag_seq: dict[str, int] = {}  # برچسب → seq آخرین invalidate
+        self._cleared = 0                   # seq آخرین clear (همهٔ برچسب‌ها)
+
+    def mark(self) -> int:
+        """قبل از اجرای کوئری‌ای که نتیجه‌اش بعداً prime می‌شود صدا بزنید (since=...)."""
+        return self._seq
+
+    def cached(self, tags: Callable[..., Iterable[str]]):
+        def deco(fn):
+            name = f"{fn.__module__}.{fn.__qualname__}"
+
+            def key_of(args, kwargs):
+                return (name, args, tuple(sorted(kwargs.items())))
+
+            def prime(result, *args, since: Optional[int] = None, **kwargs):
+                """
+                نتیجه‌ای را که از مسیر دیگری (مثلاً یک کوئری ترکیبی) به‌دست آمده در کش می‌گذارد.
+                since = mark() ـِ قبل از آن کوئری؛ اگر از آن به بعد برچسبی باطل شده، ذخیره نمی‌شود.
+                """
+                if result is not None:
+                    self._store(key_of(args, kwargs), _snapshot(result), frozenset(tags(result, *args, **kwargs)),
+                                since=since)
+
+            async def peek(session, *args, **kwargs):
+                """(True, نتیجه) اگر در کش هست، وگرنه (False, None)؛ بدون صدا زدن تابع."""
+                key = key_of(args, kwargs)
+                hit = self._data.get(key)
+                if hit and time.monotonic() - hit[0] < self.ttl:
+                    self.hits += 1
+                    self._data.move_to_end(key)
+                    return True, await _restore(session, hit[1])
+                self.misses += 1
+                return False, None
+
+            @functools.wraps(fn)
+            async def wrapper(session, *args, **kwargs):
+                found, value = await peek(session, *args, **kwargs)
+                if found:
+                    return value
+                since = self.mark()
+                result = await fn(session, *args, **kwargs)
+                prime(result, *args, since=since, **kwargs)
+                return result
+
+            wrapper.uncached = fn
+            wrapper.peek = peek
+            wrapper.prime = prime
+            return wrapper
+        return deco
+
+    def _store(self, key, value, tags: frozenset[str], since: Optional[int] = None):
+        if since is not None and (self._cleared > since or any(self._tag_seq.get(t, 0) > since for t in tags)):
+            self.stale += 1  # حین کوئری نوشته شده؛ نتیجه ممکن است قدیمی باشد
+            return
+        self._drop(key)
+        self._data[key] = (time.monotonic(), value, tags)
+        for t in tags:
+            self._by_tag.setdefault(t, set()).add(key)
+        while len(self._data) > self.maxsize:
+            self._drop(next(iter(self._data)))
+            self.evictions += 1
+
+    def _drop(self, key):
+        entry = self._data.pop(key, None)
+        if entry:
+            for t in entry[2]:
+                keys = self._by_tag.get(t)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._by_tag[t]
+
+    def invalidate(self, *tags: str):
+        self._seq += 1
+        if len(self._tag_seq) > 8 * self.maxsize:
+            # جمع‌وجور کردن: معادل یک clear برای کوئری‌های در حال اجرا (محافظه‌کارانه)
+            self._tag_seq.clear()
+            self._cleared = self._seq
+        for t in tags:
+            self._tag_seq[t] = self._seq
+            for key in list(self._by_tag.get(t, ())):
+                self._drop(key)
+                self.invalidations += 1
+
+    def clear(self):
+        self._seq += 1
+        self._cleared = self._seq
+        self._tag_seq.clear()
+        self.invalidations += len(self._data)
+        self._data.clear()
+        self._by_tag.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data), "hits": self.hits, "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "evictions": self.evictions, "invalidations": self.invalidations, "stale": self.stale,
+        }
+
+
+queries = QueryCache()
@@ -9,6 +9,9 @@ from models import (
 )
 from datetime import datetime, timezone
 from keyboards import PLATFORM_KEYS
+from search import search_key_filter, unit_index
+from cache import access, queries
+from database import STREAM_YIELD_PER, on_read_engine
 
 def platforms_to_json(keys: List[str]) -> str:
     return json.dumps([k for k in keys if k in PLATFORM_KEYS], ensure_ascii=False)
@@ -20,16 +23,32 @@ def platforms_from_json(text: str) -> List[str]:
     except Exception:
         return []
 
+# بیت هر پلتفرم = جایگاهش در PLATFORM_KEYS (ترتیب PLATFORMS را عوض نکنید؛ فقط به انتها اضافه کنید)
+PLATFORM_BITS = {k: 1 << i for i, k in enumerate(PLATFORM_KEYS)}
+
+def platforms_to_mask(keys: List[str]) -> int:
+    mask = 0
+    for k in keys or []:
+        mask |= PLATFORM_BITS.get(k, 0)
+    return mask
+
+def platforms_from_mask(mask: int | None) -> List[str]:
+    mask = mask or 0
+    return [k for k in PLATFORM_KEYS if mask & PLATFORM_BITS[k]]
+
+def set_campaign_platforms(camp: Campaign, keys: List[str]):
+    """ستون JSON و بیت‌ماسک پلتفرم‌ها را با هم به‌روز می‌کند."""
+    keys = [k for k in keys if k in PLATFORM_KEYS]
+    camp.platforms = platforms_to_json(keys)
+    camp.platforms_mask = platforms_to_mask(keys)
+
 # --- Admin / Roles ---
 
 async def is_admin(session: AsyncSession, user_id: int) -> bool:
-    q = await session.execute(select(Admin).where(Admin.admin_id == user_id))
-    return q.scalar_one_or_none() is not None
+    return await access.role(session, user_id) is not None
 
 async def is_superadmin(session: AsyncSession, user_id: int) -> bool:
-    q = await session.execute(select(Admin.role).where(Admin.admin_id == user_id))
-    r = q.scalar_one_or_none()
-    return bool(r and r == "SUPER")
+    return await access.role(session, user_id) == "SUPER"
 
 async def ancestors_of(session: AsyncSession, admin_id: int) -> list[int]:
     # ساده: چندکوئری
@@ -101,9 +120,13 @@ async def set_user_name(session: AsyncSession, user_id: int, display_name: str):
     if u:
         u.display_name = display_name
 
-async def list_my_users(session: AsyncSession, admin_id: int) -> list[User]:
-    ids = await visible_cluster_ids(session, admin_id)
-    q = await session.execute(select(User).where(User.admin_id.in_(ids)).order_by(User.user_id))
+async def list_my_users(session: AsyncSession, admin_id: int, search: str | None = None,
+                        *, cluster_ids: list[int] | None = None) -> list[User]:
+    ids = cluster_ids if cluster_ids is not None else await visible_cluster_ids(session, admin_id)
+    stmt = select(User).where(User.admin_id.in_(ids))
+    if search:
+        stmt = stmt.where(search_key_filter(User.search_key, search))
+    q = await session.execute(stmt.order_by(User.user_id))
     return [x for x in q.scalars().all()]
 
 async def del_user(session: AsyncSession, user_id: int, admin_id: int) -> bool:
@@ -131,8 +154,7 @@ async def get_city(session: AsyncSession, city_id: int) -> Optional[City]:
 # --- Units ---
 
 async def get_admin_units(session: AsyncSession, admin_id: int) -> list[int]:
-    q = await session.execute(select(UnitAdmin.unit_id).where(UnitAdmin.admin_id == admin_id))
-    return [x for (x,) in q.all()]
+    return list(await access.unit_ids(session, admin_id))
 
 async def get_primary_unit_for_admin(session: AsyncSession, admin_id: int) -> Optional[int]:
     units = await get_admin_units(session, admin_id)
@@ -153,6 +175,11 @@ async def parent_unit_id(session: AsyncSession, unit_id: int) -> Optional[int]:
     u = await get_unit(session, unit_id)
     return u.parent_id if u else None
 
+async def load_unit_index(session: AsyncSession):
+    """ایندکس فازی نام واحدها (search.unit_index) را از DB پر می‌کند (در on_startup)."""
+    rows = (await session.execute(select(Unit.id, Unit.name, Unit.type, Unit.parent_id))).all()
+    unit_index.rebuild(rows)
+
 # --- Campaigns / Reports ---
 
 async def create_campaign_v2(session: AsyncSession, owner_unit_id: int, owner_admin_id: int,
@@ -162,7 +189,8 @@ async def create_campaign_v2(session: AsyncSession, owner_unit_id: int, owner_ad
     import json
     from utils import now_iso
     camp = Campaign(
-        name=name, hashtag=hashtag, city=city_label, platforms=platforms_to_json(platforms),
+        name=name, hashtag=hashtag, city=city_label,
+        platforms=platforms_to_json(platforms), platforms_mask=platforms_to_mask(platforms),
         description=description, active=True, created_by=owner_admin_id, created_at=now_iso(),
         admin_id=owner_admin_id, root_campaign_id=None, unit_id_owner=owner_unit_id,
         config_json=json.dumps(config, ensure_ascii=False), status='ACTIVE'
@@ -173,12 +201,13 @@ async def create_campaign_v2(session: AsyncSession, owner_unit_id: int, owner_ad
     await session.flush()
     return camp.id
 
+@queries.cached(lambda c, cid: [f"campaign:{cid}"])
 async def get_campaign(session: AsyncSession, cid: int) -> Optional[Campaign]:
     return await session.get(Campaign, cid)
 
-async def list_campaigns_for_admin_units(session: AsyncSession, admin_id: int, active_only: bool=False) -> list[Campaign]:
-    unit_ids = await get_admin_units(session, admin_id)
-    if not unit_ids: return []
+@queries.cached(lambda rows, unit_ids, active_only=False: [f"unit:{u}" for u in unit_ids])
+async def campaigns_owned_by_units(session: AsyncSession, unit_ids: tuple[int, ...], active_only: bool=False) -> list[Campaign]:
+    """کمپین‌های متعلق به این واحدها (جدیدترین اول)؛ کش با برچسب unit:{id}."""
     stmt = select(Campaign).where(Campaign.unit_id_owner.in_(unit_ids))
     if active_only:
         stmt = stmt.where(Campaign.active.is_(True))
@@ -186,6 +215,11 @@ async def list_campaigns_for_admin_units(session: AsyncSession, admin_id: int, a
     q = await session.execute(stmt)
     return [x for x in q.scalars().all()]
 
+async def list_campaigns_for_admin_units(session: AsyncSession, admin_id: int, active_only: bool=False) -> list[Campaign]:
+    unit_ids = await get_admin_units(session, admin_id)
+    if not unit_ids: return []
+    return await campaigns_owned_by_units(session, tuple(sorted(unit_ids)), active_only=active_only)
+
 async def update_campaign_field(session: AsyncSession, campaign_id: int, field: str, value):
     camp = await session.get(Campaign, campaign_id)
     if not camp: return
@@ -234,6 +268,7 @@ async def add_report_item(
     await session.flush()                  # تا item.id پر بشه
     return item.id
 
+@on_read_engine
 async def stats_for_campaign(session: AsyncSession, campaign_id: int) -> list[tuple[str,int]]:
     q = await session.execute(
         select(Report.platform, func.count(ReportItem.id))
@@ -255,6 +290,7 @@ async def stats_for_user_campaign(session: AsyncSession, campaign_id: int, user_
     return [(p, c or 0) for p, c in q.all()]
 
 
+@on_read_engine
 async def stats_by_unit_platform(session, campaign_id: int):
     """
     خروجی: لیستی از دیکشنری‌ها با کلیدهای: unit_id, unit_name, unit_type, platform, count
@@ -354,6 +390,12 @@ async def _descendant_unit_ids(session: AsyncSession, root_id: int) -> list[int]
         queue.extend(child_ids)
     return out
 
+def unit_subtree_ids(root_id: int):
+    """select آی‌دیِ ریشه + همهٔ زیرواحدها با CTE بازگشتی (برای IN داخل همان کوئری)."""
+    tree = select(Unit.id).where(Unit.id == root_id).cte("unit_subtree", recursive=True)
+    tree = tree.union_all(select(Unit.id).join(tree, Unit.parent_id == tree.c.id))
+    return select(tree.c.id)
+
 async def list_campaigns_for_admin_unit_tree(session: AsyncSession, admin_id: int, active_only: bool=False) -> list[Campaign]:
     """اگر سوپر باشد همهٔ کمپین‌ها؛ اگر ادمین معمولی باشد کمپین‌های واحدهای متصل + همهٔ زیرواحدها."""
     # سوپرادمین = همهٔ کمپین‌ها
@@ -445,26 +487,58 @@ async def get_user_unit_id(session: AsyncSession, tg_user_id: int) -> Optional[i
     except Exception:
         return None
 
+def _report_unit_subquery(tg_user_id: int):
+    """(unit_id, parent_id) واحدِ کاربر، با همان منطق get_user_unit_id (پایگاه کاربر، وگرنه واحد اصلی ادمین)."""
+    unit_id = func.coalesce(
+        select(User.unit_id_paygah).where(User.user_id == tg_user_id).scalar_subquery(),
+        select(UnitAdmin.unit_id).where(UnitAdmin.admin_id == tg_user_id).limit(1).scalar_subquery(),
+    )
+    return select(Unit.id.label("unit_id"), Unit.parent_id.label("parent_id")) \
+        .where(Unit.id == unit_id).subquery("me")
+
+@queries.cached(lambda units, tg_user_id: [f"user:{tg_user_id}", f"admin:{tg_user_id}",
+                                           *(f"unit:{u}" for u in units if u)])
+async def get_report_units(session: AsyncSession, tg_user_id: int) -> tuple[Optional[int], Optional[int]]:
+    """(واحد کاربر، واحد والد) با یک کوئری؛ کش با برچسب user/admin/unit."""
+    me = _report_unit_subquery(tg_user_id)
+    row = (await session.execute(select(me.c.unit_id, me.c.parent_id))).first()
+    return (row.unit_id, row.parent_id) if row else (None, None)
+
 async def list_reportable_campaigns_for_user(session: AsyncSession, tg_user_id: int, active_only: bool=True) -> list[Campaign]:
     """
     فقط کمپین‌های «واحد والد» کاربر را برمی‌گرداند تا کاربر/واحدِ زیرمجموعه روی آن‌ها گزارش بدهد.
+    کاربر → واحد → والد → کمپین‌ها در یک کوئری؛ دو کش (واحدهای کاربر و کمپین‌های هر واحد) هم پر می‌شوند
+    تا /report بعدی اصلاً به DB نرود.
     """
-    uid = await get_user_unit_id(session, tg_user_id)
-    if not uid:
-        return []
-    pid = await parent_unit_id(session, uid)
-    if not pid:
-        return []  # اگر والد ندارد، چیزی برای گزارش‌دادن نیست
-    stmt = select(Campaign).where(Campaign.unit_id_owner == pid)
+    found, units = await get_report_units.peek(session, tg_user_id)
+    if found:
+        pid = units[1]
+        if not pid:
+            return []  # اگر والد ندارد، چیزی برای گزارش‌دادن نیست
+        return await campaigns_owned_by_units(session, (pid,), active_only=active_only)
+
+    since = queries.mark()  # نوشتنِ هم‌زمان با این کوئری، prime پایین را بی‌اثر می‌کند
+    me = _report_unit_subquery(tg_user_id)
+    on = [Campaign.unit_id_owner == me.c.parent_id]
     if active_only:
-        stmt = stmt.where(Campaign.active.is_(True))
-    stmt = stmt.order_by(Campaign.id.desc())
-    q = await session.execute(stmt)
-    return [x for x in q.scalars().all()]
+        on.append(Campaign.active.is_(True))
+    rows = (await session.execute(
+        select(me.c.unit_id, me.c.parent_id, Campaign)
+        .select_from(me).outerjoin(Campaign, and_(*on))
+        .order_by(Campaign.id.desc())
+    )).all()
+    unit_id, pid = (rows[0].unit_id, rows[0].parent_id) if rows else (None, None)
+    get_report_units.prime((unit_id, pid), tg_user_id, since=since)
+    if not pid:
+        return []
+    camps = [c for *_, c in rows if c is not None]
+    campaigns_owned_by_units.prime(camps, (pid,), active_only=active_only, since=since)
+    return camps
 
 
 
 
+@queries.cached(lambda units, actor_id: [f"admin:{actor_id}", "units", *(f"unit:{u.id}" for u in units)])
 async def list_units_for_actor(session: AsyncSession, actor_id: int) -> List[Unit]:
     """سوپرادمین: همه واحدها. ادمین: فقط واحدهای متصل به خودش."""
     if await is_superadmin(session, actor_id):
@@ -476,6 +550,7 @@ async def list_units_for_actor(session: AsyncSession, actor_id: int) -> List[Uni
     stmt = select(Unit).where(Unit.id.in_(unit_ids)).order_by(Unit.type, Unit.name)
     return (await session.execute(stmt)).scalars().all()
 
+@queries.cached(lambda camps, unit_id, active_only=True: [f"unit:{unit_id}", *(f"campaign:{c.id}" for c in camps)])
 async def list_campaigns_reported_by_unit(session: AsyncSession, unit_id: int, active_only: bool=True) -> List[Campaign]:
     """فقط کمپین‌هایی که این واحد واقعاً رویشان گزارش ثبت کرده."""
     stmt = (
@@ -489,6 +564,7 @@ async def list_campaigns_reported_by_unit(session: AsyncSession, unit_id: int, a
         stmt = stmt.where(Campaign.active.is_(True))
     return (await session.execute(stmt)).scalars().all()
 
+@on_read_engine
 async def stats_for_unit_campaign(session: AsyncSession, unit_id: int, campaign_id: int) -> List[Tuple[str, int]]:
     """آمار یک واحد در یک کمپین: [(platform, count)]"""
     q = (
@@ -500,6 +576,7 @@ async def stats_for_unit_campaign(session: AsyncSession, unit_id: int, campaign_
     )
     return [(p, c or 0) for p, c in (await session.execute(q)).all()]
 
+@on_read_engine
 async def stats_for_unit_all_campaigns(session: AsyncSession, unit_id: int) -> List[Dict]:
     """
     آمار کلی یک واحد روی همهٔ کمپین‌ها:
@@ -529,30 +606,39 @@ async def stats_for_unit_all_campaigns(session: AsyncSession, unit_id: int) -> L
         for r in rows
     ]
 
-async def fetch_unit_campaign_items(session: AsyncSession, unit_id: int, campaign_id: int):
-    """
-    آیتم‌های فایل برای یک واحد در یک کمپین
-    خروجی: [(file_path, platform, user_id, campaign_id, campaign_name)]
-    """
+def _unit_items_stmt(unit_id: int, campaign_id: int | None = None):
     q = (
         select(ReportItem.file_path, ReportItem.platform, Report.user_id, Campaign.id, Campaign.name)
         .join(Report, ReportItem.report_id == Report.id)
         .join(Campaign, Campaign.id == Report.campaign_id)
-        .where(Report.unit_id_owner == unit_id, Report.campaign_id == campaign_id)
-        .order_by(ReportItem.id)
+        .where(Report.unit_id_owner == unit_id)
+    )
+    if campaign_id is not None:
+        return q.where(Report.campaign_id == campaign_id).order_by(ReportItem.id)
+    return q.order_by(Campaign.id.desc(), ReportItem.id)
+
+@on_read_engine
+async def iter_unit_items(session: AsyncSession, unit_id: int, campaign_id: int | None = None):
+    """
+    مثل fetch_unit_*_items ولی جریانی (server-side cursor، هر بار STREAM_YIELD_PER ردیف)
+    تا خروجی ZIP واحدهای بزرگ کل ردیف‌ها را در حافظه نگه ندارد.
+    """
+    result = await session.stream(
+        _unit_items_stmt(unit_id, campaign_id).execution_options(yield_per=STREAM_YIELD_PER)
     )
-    return [(fp, plat, uid, cid, cname) for fp, plat, uid, cid, cname in (await session.execute(q)).all()]
+    async for fp, plat, uid, cid, cname in result:
+        yield fp, plat, uid, cid, cname
+
+async def fetch_unit_campaign_items(session: AsyncSession, unit_id: int, campaign_id: int):
+    """
+    آیتم‌های فایل برای یک واحد در یک کمپین
+    خروجی: [(file_path, platform, user_id, campaign_id, campaign_name)]
+    """
+    return [row async for row in iter_unit_items(session, unit_id, campaign_id)]
 
 async def fetch_unit_all_items(session: AsyncSession, unit_id: int):
     """
     آیتم‌های فایل برای یک واحد روی همه کمپین‌ها
     خروجی: [(file_path, platform, user_id, campaign_id, campaign_name)]
     """
-    q = (
-        select(ReportItem.file_path, ReportItem.platform, Report.user_id, Campaign.id, Campaign.name)
-        .join(Report, ReportItem.report_id == Report.id)
-        .join(Campaign, Campaign.id == Report.campaign_id)
-        .where(Report.unit_id_owner == unit_id)
-        .order_by(Campaign.id.desc(), ReportItem.id)
-    )
-    return [(fp, plat, uid, cid, cname) for fp, plat, uid, cid, cname in (await session.execute(q)).all()]
+    return [row async for row in iter_unit_items(session, unit_id)]
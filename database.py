@@ -1,7 +1,21 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 import asyncio
+import datetime
+import functools
+import inspect
+import json
+import logging
 import os
+import re
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from typing import Callable, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 from dotenv import load_dotenv
@@ -13,25 +27,367 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///campaign_bot.sqlit
 class Base(DeclarativeBase):
     pass
 
-engine = create_async_engine(
-    DATABASE_URL,
-    echo=False,
-    future=True,
-    pool_pre_ping=True,
-)
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+_url = make_url(DATABASE_URL)
+IS_SQLITE = _url.get_backend_name() == "sqlite"
+IS_POSTGRES = _url.get_backend_name() == "postgresql"
+# پروفایل production برای SQLite فایلی (WAL + pragmaها + صف نویسنده)؛ SQLITE_TUNING=0 خاموشش می‌کند
+SQLITE_TUNED = IS_SQLITE and _url.database not in (None, "", ":memory:") and os.getenv("SQLITE_TUNING", "1") != "0"
+
+# اندازهٔ batch برای خواندن‌های بزرگ با server-side cursor (session.stream / yield_per)
+STREAM_YIELD_PER = _env_int("DB_STREAM_YIELD_PER", 500)
+
+
+def _sqlite_pragmas(read_only: bool) -> tuple[str, ...]:
+    common = (
+        f"PRAGMA mmap_size={_env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)}",
+        f"PRAGMA cache_size={-_env_int('SQLITE_CACHE_KB', 64 * 1024)}",  # منفی = KiB
+        f"PRAGMA busy_timeout={_env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)}",
+        "PRAGMA temp_store=MEMORY",
+    )
+    if read_only:
+        return common + ("PRAGMA query_only=1",)
+    return ("PRAGMA journal_mode=WAL", "PRAGMA synchronous=NORMAL") + common
+
+def _create_engine(url, *, read_only: bool = False, prefix: str = ""):
+    """
+    engine با پروفایل مناسب dialect. prefix برای env جداگانهٔ engine خواندنی
+    (مثلاً READ_PG_POOL_SIZE)؛ اگر ست نشده باشد همان مقدار engine اصلی.
+    """
+    url = make_url(url)
+    env = lambda name, default: _env_int(prefix + name, _env_int(name, default))
+    kw = {}
+    pragmas = ()
+    backend = url.get_backend_name()
+    if backend == "sqlite" and url.database not in (None, "", ":memory:") and os.getenv("SQLITE_TUNING", "1") != "0":
+        # خواننده‌ها در WAL هم‌زمان کار می‌کنند؛ نویسنده یکی است (SQLiteWriterSession)
+        kw = {
+            "poolclass": AsyncAdaptedQueuePool,  # پیش‌فرض aiosqlite NullPool است (هر session اتصال تازه)
+            "pool_size": env("SQLITE_POOL_SIZE", 8),
+            "max_overflow": env("SQLITE_MAX_OVERFLOW", 4),
+            "connect_args": {"timeout": env("SQLITE_BUSY_TIMEOUT_MS", 5000) / 1000},
+        }
+        pragmas = _sqlite_pragmas(read_only)
+    elif backend == "postgresql":
+        # پروفایل PostgreSQL: اندازهٔ pool و کش prepared statement از env.
+        # پشت pgbouncer (transaction mode) هر دو کش باید 0 باشند: PG_STATEMENT_CACHE_SIZE=0
+        stmt_cache = env("PG_STATEMENT_CACHE_SIZE", 256)
+        connect_args = {}
+        if url.get_driver_name() == "asyncpg":
+            # کش سمت SQLAlchemy (prepared statementهای dialect) + کش خود asyncpg
+            url = url.update_query_dict({"prepared_statement_cache_size": str(stmt_cache)})
+            connect_args = {"statement_cache_size": stmt_cache}
+            timeout = os.getenv(prefix + "PG_STATEMENT_TIMEOUT_MS") or os.getenv("PG_STATEMENT_TIMEOUT_MS")
+            if timeout:
+                connect_args["server_settings"] = {"statement_timeout": timeout}
+        kw = {
+            "pool_size": env("PG_POOL_SIZE", 10),
+            "max_overflow": env("PG_MAX_OVERFLOW", 10),
+            "pool_timeout": env("PG_POOL_TIMEOUT", 30),
+            "pool_recycle": env("PG_POOL_RECYCLE", 1800),
+            "pool_use_lifo": True,  # اتصال‌های کم‌استفاده بیکار می‌مانند و recycle می‌شوند
+            "connect_args": connect_args,
+        }
+
+    eng = create_async_engine(url, echo=False, future=True, pool_pre_ping=True, **kw)
+    if pragmas:
+        @event.listens_for(eng.sync_engine, "connect")
+        def _apply_pragmas(dbapi_conn, _record):
+            cur = dbapi_conn.cursor()
+            for pragma in pragmas:
+                cur.execute(pragma)
+            cur.close()
+    return eng
+
+
+engine = _create_engine(_url)
+
+# engine خواندنی برای آمار/خروجی‌های سنگین (crud با @on_read_engine):
+# READ_DATABASE_URL (مثلاً replica)؛ وگرنه برای SQLite فایلی یک pool جدا روی همان فایل با mode=ro؛
+# وگرنه همان engine اصلی.
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL", "").strip()
+if READ_DATABASE_URL:
+    read_engine = _create_engine(READ_DATABASE_URL, read_only=True, prefix="READ_")
+elif SQLITE_TUNED and os.getenv("SQLITE_READ_POOL", "1") != "0":
+    _ro = _url.set(database=f"file:{os.path.abspath(_url.database)}",
+                   query={**_url.query, "mode": "ro", "uri": "true"})
+    read_engine = _create_engine(_ro, read_only=True, prefix="READ_")
+else:
+    read_engine = engine
+
+
+# ---------- slow-query log ----------
+# statementهای کندتر از SLOW_QUERY_MS (0 = خاموش) با پارامترها، زمان، تعداد ردیف و handler/دادهٔ آپدیتی
+# که آن را زده در فایل چرخشی SLOW_QUERY_LOG (JSON هر خط) نوشته می‌شوند؛ خلاصهٔ top-N به‌ازای
+# «شکل» statement در حافظه برای /slowqueries. SLOW_QUERY_PARAMS: redact (پیش‌فرض؛ رشته/بایت‌ها
+# فقط با طولشان) | full | none.
+SLOW_QUERY_MS = _env_int("SLOW_QUERY_MS", 200)
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", "logs/slow_queries.log")
+SLOW_QUERY_PARAMS = os.getenv("SLOW_QUERY_PARAMS", "redact").strip().lower()
+
+_IN_LIST = re.compile(r"\(\s*(\?|%s|%\(\w+\)s|\$\d+|:\w+)(\s*,\s*(\?|%s|%\(\w+\)s|\$\d+|:\w+))+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+@functools.lru_cache(maxsize=2048)
+def statement_shape(statement: str) -> str:
+    """متن statement با IN (?, ?, …) ← IN (…) و فاصله‌های یکدست؛ کلید گروه‌بندی statementها."""
+    return _IN_LIST.sub("(…)", _SPACES.sub(" ", statement).strip())
+
+# منشأ کوئری جاری ({"handler": …, "update": …})؛ querystats.install آن را وصل می‌کند
+_query_origin: Callable[[], dict] = dict
+
+def set_query_origin(fn: Callable[[], dict]):
+    global _query_origin
+    _query_origin = fn
+
+def _redact(value):
+    if SLOW_QUERY_PARAMS == "full" or value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<bytes {len(value)}>"
+    if isinstance(value, str):
+        return f"<str {len(value)}>"
+    return f"<{type(value).__name__}>"
+
+def _loggable_params(parameters, executemany: bool):
+    if SLOW_QUERY_PARAMS == "none":
+        return None
+    if executemany:
+        return f"<executemany {len(parameters)}>"
+    if isinstance(parameters, dict):
+        return {k: _redact(v) for k, v in list(parameters.items())[:50]}
+    return [_redact(v) for v in list(parameters or ())[:50]]
+
+
+class SlowQueryStats:
+    __slots__ = ("count", "total_ms", "max_ms", "rows", "last")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = self.max_ms = 0.0
+        self.rows = None
+        self.last: dict = {}
+
+_slow: dict[str, SlowQueryStats] = {}
+_slow_logger: Optional[logging.Logger] = None
+
+def _slow_query_logger() -> logging.Logger:
+    global _slow_logger
+    if _slow_logger is None:
+        lg = logging.getLogger("slowquery")
+        lg.propagate = False
+        lg.setLevel(logging.INFO)
+        if SLOW_QUERY_LOG:
+            os.makedirs(os.path.dirname(os.path.abspath(SLOW_QUERY_LOG)), exist_ok=True)
+            handler = RotatingFileHandler(
+                SLOW_QUERY_LOG, maxBytes=_env_int("SLOW_QUERY_LOG_MAX_KB", 5120) * 1024,
+                backupCount=_env_int("SLOW_QUERY_LOG_BACKUPS", 3), encoding="utf-8", delay=True,
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            lg.addHandler(handler)
+        _slow_logger = lg
+    return _slow_logger
+
+# زمان شروع روی execution context (نه conn.info): statementی که خطا بدهد به after نمی‌رسد و
+# چیزی روی اتصالِ pool جا نمی‌گذارد
+def _slow_before(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._slow_query_t0 = time.perf_counter()
+
+def _slow_after(conn, cursor, statement, parameters, context, executemany):
+    t0 = getattr(context, "_slow_query_t0", None)
+    if t0 is None:
+        return
+    ms = (time.perf_counter() - t0) * 1000
+    if ms < SLOW_QUERY_MS:
+        return
+    rows = cursor.rowcount
+    if rows is None or rows < 0:
+        buffered = getattr(cursor, "_rows", None)  # adapterهای async ردیف‌ها را از قبل خوانده‌اند
+        rows = len(buffered) if buffered is not None else None
+    entry = {
+        "ts": datetime.datetime.now().isoformat(timespec="seconds"), "ms": round(ms, 1), "rows": rows,
+        "engine": "read" if read_engine is not engine and conn.engine is read_engine.sync_engine else "write",
+        **_query_origin(), "sql": statement, "params": _loggable_params(parameters, executemany),
+    }
+    shape = statement_shape(statement)
+    st = _slow.get(shape)
+    if st is None:
+        st = _slow[shape] = SlowQueryStats()
+    st.count += 1
+    st.total_ms += ms
+    st.max_ms = max(st.max_ms, ms)
+    st.rows = rows
+    st.last = entry
+    try:
+        _slow_query_logger().info(json.dumps(entry, ensure_ascii=False, default=str))
+    except Exception:
+        pass
+
+def slow_query_summary(top: int = 10) -> list[tuple[str, SlowQueryStats]]:
+    """کندترین شکل‌ها بر اساس زمان کل (برای /slowqueries)."""
+    return sorted(_slow.items(), key=lambda kv: -kv[1].total_ms)[:top]
+
+def reset_slow_queries():
+    _slow.clear()
+
+if SLOW_QUERY_MS > 0:
+    for _eng in {id(e): e for e in (engine, read_engine)}.values():
+        event.listen(_eng.sync_engine, "before_cursor_execute", _slow_before)
+        event.listen(_eng.sync_engine, "after_cursor_execute", _slow_after)
+
+
+# SQLite فقط یک نویسنده دارد. به‌جای اینکه دو commit هم‌زمان به "database is locked" بخورند،
+# sessionها از اولین نوشتن (flush/DML) تا commit/rollback در این صف (FIFO) منتظر نوبت می‌مانند.
+# خواندن‌ها قفل نمی‌گیرند (درایور BEGIN را فقط قبل از DML می‌فرستد).
+_writer_lock = asyncio.Lock()
+WRITER_TIMEOUT = _env_int("SQLITE_WRITER_TIMEOUT", 30)
+
+class SQLiteWriterSession(AsyncSession):
+    _holds_writer = False
+
+    async def _acquire_writer(self):
+        if self._holds_writer:
+            return
+        try:
+            await asyncio.wait_for(_writer_lock.acquire(), WRITER_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"SQLite writer queue: no turn after {WRITER_TIMEOUT}s") from None
+        self._holds_writer = True
+
+    def _release_writer(self):
+        if self._holds_writer:
+            self._holds_writer = False
+            _writer_lock.release()
+
+    def _has_pending(self) -> bool:
+        return bool(self.new or self.dirty or self.deleted)
+
+    async def flush(self, objects=None):
+        if self._has_pending():
+            await self._acquire_writer()
+        return await super().flush(objects)
+
+    async def execute(self, statement, *args, **kwargs):
+        if getattr(statement, "is_dml", False):
+            await self._acquire_writer()
+        return await super().execute(statement, *args, **kwargs)
+
+    async def commit(self):
+        if self._has_pending():
+            await self._acquire_writer()
+        try:
+            return await super().commit()
+        finally:
+            self._release_writer()
+
+    async def rollback(self):
+        try:
+            return await super().rollback()
+        finally:
+            self._release_writer()
+
+    async def close(self):
+        try:
+            return await super().close()
+        finally:
+            self._release_writer()
+
+
+def _pool_stats(eng, prefix: str = "") -> dict:
+    pool = eng.pool
+    out = {prefix + "pool": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        fn = getattr(pool, name, None)
+        if callable(fn):
+            out[prefix + name] = fn()
+    return out
+
+def pool_stats() -> dict:
+    """وضعیت pool اتصال‌ها (برای /dbstats)."""
+    out = {"dialect": engine.dialect.name, **_pool_stats(engine)}
+    if read_engine is not engine:
+        out.update(_pool_stats(read_engine, "read_"))
+    if SQLITE_TUNED:
+        out["writer_busy"] = _writer_lock.locked()
+        out["writer_waiting"] = len(getattr(_writer_lock, "_waiters", None) or ())
+    return out
+
 
 SessionLocal: async_sessionmaker[AsyncSession] = async_sessionmaker(
-    bind=engine, expire_on_commit=False, autoflush=False
+    bind=engine, expire_on_commit=False, autoflush=False,
+    class_=SQLiteWriterSession if SQLITE_TUNED else AsyncSession,
+)
+
+ReadSessionLocal: async_sessionmaker[AsyncSession] = async_sessionmaker(
+    bind=read_engine, expire_on_commit=False, autoflush=False,
 )
 
+def on_read_engine(fn):
+    """
+    تابع خواندنی crud را (اگر engine خواندنی جدا داریم) روی session خودِ read_engine اجرا می‌کند؛
+    session ورودی نادیده گرفته می‌شود. فقط برای کوئری‌هایی که تازگیِ لحظه‌ای لازم ندارند
+    (آمار/خروجی) — replica ممکن است کمی عقب باشد.
+    """
+    if inspect.isasyncgenfunction(fn):
+        @functools.wraps(fn)
+        async def gen_wrapper(session, *args, **kwargs):
+            if read_engine is engine:
+                async for row in fn(session, *args, **kwargs):
+                    yield row
+                return
+            async with ReadSessionLocal() as rs:
+                async for row in fn(rs, *args, **kwargs):
+                    yield row
+        return gen_wrapper
+
+    @functools.wraps(fn)
+    async def wrapper(session, *args, **kwargs):
+        if read_engine is engine:
+            return await fn(session, *args, **kwargs)
+        async with ReadSessionLocal() as rs:
+            return await fn(rs, *args, **kwargs)
+    return wrapper
+
+# session مشترک آپدیت جاری (middleware.UpdateSessionApplication آن را ست می‌کند)
+update_session: ContextVar = ContextVar("update_session", default=None)
+
+@asynccontextmanager
+async def session_scope():
+    """
+    داخل پردازش یک آپدیت: همان session مشترک آپدیت (بسته نمی‌شود؛ آخر آپدیت middleware هر چیز
+    commit‌نشده را rollback می‌کند، پس مثل قبل فقط commit صریح ماندگار است).
+    بیرون از آپدیت (startup، job، اسکریپت): یک session تازه مثل SessionLocal().
+    """
+    uow = update_session.get()
+    if uow is None:
+        async with SessionLocal() as session:
+            yield session
+        return
+    session = uow.session
+    try:
+        yield session
+    except BaseException:
+        # مثل بسته شدن session مستقل: تغییرات commit‌نشدهٔ این بلوک دور ریخته می‌شود
+        await session.rollback()
+        raise
+
 async def init_db():
-    # dev-only: ایجاد جداول بر اساس مدل‌ها (برای Production از Alembic استفاده کنید)
+    # dev-only: ایجاد جداول بر اساس مدل‌ها (برای Production از Alembic استفاده کنید؛
+    # دیتابیسی که این‌جا ساخته شده را قبل از اولین upgrade با `alembic stamp head` علامت بزنید)
     from models import (
         Campaign, Report, ReportItem, User, City,
         Admin, AdminTree, Unit, UnitAdmin, CampaignCopy, ReportItemRef
     )
+    from search import create_search_objects
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(create_search_objects)
 
 async def get_session() -> AsyncSession:
     async with SessionLocal() as session:
@@ -4,12 +4,10 @@ import re
 from telegram import Update
 from telegram.ext import ContextTypes
 from telegram.constants import ParseMode
-from database import SessionLocal
+from database import session_scope
 from models import Admin, City, User
-from crud import (
-    is_admin, is_superadmin, set_user_admin, set_user_name, list_my_users, del_user,
-    visible_cluster_ids
-)
+from crud import set_user_admin, set_user_name, list_my_users, del_user
+from actor import get_actor, forget_actor
 
 def _extract_user_id_and_name(update: Update) -> tuple[int|None, str|None]:
     msg = update.effective_message
@@ -23,9 +21,9 @@ def _extract_user_id_and_name(update: Update) -> tuple[int|None, str|None]:
     return uid, name
 
 async def addadmin_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         caller = update.effective_user.id
-        if not await is_superadmin(s, caller):
+        if not (await get_actor(context, s, caller)).is_super:
             return await update.effective_message.reply_text("⛔️ فقط سوپرادمین می‌تواند ادمین جدید اضافه کند.")
         parts = (update.effective_message.text or "").split()
         if len(parts) < 2 or not parts[1].isdigit():
@@ -37,17 +35,18 @@ async def addadmin_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             adm.role = role
         await s.commit()
+    forget_actor(context, uid)
     await update.effective_message.reply_text(f"✅ admin {uid} با نقش «{role}» ثبت/به‌روزرسانی شد.")
 
 async def linkadmin_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         caller = update.effective_user.id
         text = (update.effective_message.text or "")
         nums = re.findall(r"\d+", text)
         if len(nums) == 1:
             parent_id = caller; child_id = int(nums[0])
         elif len(nums) == 2:
-            if not await is_superadmin(s, caller):
+            if not (await get_actor(context, s, caller)).is_super:
                 return await update.effective_message.reply_text("⛔️ فقط سوپرادمین می‌تواند والد دیگری تعیین کند.")
             parent_id = int(nums[0]); child_id = int(nums[1])
         else:
@@ -66,15 +65,20 @@ async def linkadmin_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not await s.get(AdminTree, {"parent_admin_id": parent_id, "child_admin_id": child_id}):
             s.add(AdminTree(parent_admin_id=parent_id, child_admin_id=child_id))
         await s.commit()
+    forget_actor(context, parent_id, child_id)
     await update.effective_message.reply_text(f"✅ لینک والد-فرزند ثبت شد: {parent_id} → {child_id}")
 
 async def myusers_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         admin_id = update.effective_user.id
-        if not await is_admin(s, admin_id):
+        actor = await get_actor(context, s, admin_id)
+        if not actor.is_admin:
             return
-        rows = await list_my_users(s, admin_id)
+        search = " ".join(context.args or []).strip() or None  # /myusers علی → جستجو در نام‌ها
+        rows = await list_my_users(s, admin_id, search, cluster_ids=actor.visible_cluster)
         if not rows:
+            if search:
+                return await update.effective_message.reply_text(f"کاربری با «{search}» پیدا نشد.")
             return await update.effective_message.reply_text("هنوز کاربری اضافه نکرده‌اید.")
         lines = ["👥 لیست کاربرهای شما:"]
         for r in rows:
@@ -87,9 +91,10 @@ async def myusers_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.effective_message.reply_text("\n".join(lines))
 
 async def adduser_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         admin_id = update.effective_user.id
-        if not await is_admin(s, admin_id):
+        actor = await get_actor(context, s, admin_id)
+        if not actor.is_admin:
             return await update.effective_message.reply_text("⛔️ شما ادمین نیستید.")
         uid, name = _extract_user_id_and_name(update)
         if not uid:
@@ -104,9 +109,10 @@ async def adduser_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.effective_message.reply_text(f"✅ کاربر {shown} به زیرمجموعه شما اضافه شد.")
 
 async def renameuser_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         admin_id = update.effective_user.id
-        if not await is_admin(s, admin_id):
+        actor = await get_actor(context, s, admin_id)
+        if not actor.is_admin:
             return await update.effective_message.reply_text("⛔️ شما ادمین نیستید.")
         parts = (update.effective_message.text or "").split(maxsplit=2)
         if len(parts) < 3 or not parts[1].isdigit():
@@ -114,15 +120,16 @@ async def renameuser_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         uid = int(parts[1]); name = parts[2].strip()
         # check cluster
         owner = await s.get(User, uid)
-        if not owner or owner.admin_id not in set(await visible_cluster_ids(s, admin_id)):
+        if not owner or owner.admin_id not in set(actor.visible_cluster):
             return await update.effective_message.reply_text("⛔️ این کاربر در حوزهٔ شما نیست.")
         await set_user_name(s, uid, name); await s.commit()
     await update.effective_message.reply_text(f"✅ نام کاربر {uid} به «{name}» تغییر کرد.")
 
 async def deluser_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         admin_id = update.effective_user.id
-        if not await is_admin(s, admin_id):
+        actor = await get_actor(context, s, admin_id)
+        if not actor.is_admin:
             return await update.effective_message.reply_text("⛔️ شما ادمین نیستید.")
         msg = update.effective_message
         parts = (msg.text or "").split()
@@ -137,7 +144,7 @@ async def deluser_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 parse_mode="Markdown"
             )
         owner = await s.get(User, uid)
-        if not owner or owner.admin_id not in set(await visible_cluster_ids(s, admin_id)):
+        if not owner or owner.admin_id not in set(actor.visible_cluster):
             return await update.effective_message.reply_text("⛔️ این کاربر در حوزهٔ شما نیست.")
         ok = await del_user(s, uid, owner.admin_id); await s.commit()
     await update.effective_message.reply_text("✅ حذف شد." if ok else "یافت نشد.")
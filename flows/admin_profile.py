@@ -4,12 +4,12 @@ from typing import List, Tuple
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from sqlalchemy import select, func
-from database import SessionLocal
+from database import session_scope
 from models import Admin, Unit, UnitAdmin, AdminTree, User, Campaign
 from keyboards import UNIT_TYPE_LABELS
+from actor import get_actor
 from crud import (
-    is_admin, is_superadmin, get_primary_unit_for_admin,
-    get_admin_units, list_campaigns_for_admin_units,
+    get_primary_unit_for_admin, get_admin_units, list_campaigns_for_admin_units,
 )
 
 # ----- helpers -----
@@ -112,11 +112,12 @@ async def _build_profile_text(session, admin_id: int) -> str:
 async def profile_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """ /profile """
     uid = update.effective_user.id
-    async with SessionLocal() as s:
-        if not await is_admin(s, uid):
+    async with session_scope() as s:
+        actor = await get_actor(context, s, uid)
+        if not actor.is_admin:
             return await update.effective_message.reply_text("فقط ادمین‌ها پروفایل دارند.")
         text = await _build_profile_text(s, uid)
-        prefix = "sa:profile" if await is_superadmin(s, uid) else "adm:profile"
+        prefix = "sa:profile" if actor.is_super else "adm:profile"
     await update.effective_message.reply_text(text, reply_markup=_profile_kb(prefix))
 
 async def profile_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -127,8 +128,8 @@ async def profile_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     action = parts[2] if len(parts) >= 3 else None
 
     uid = q.from_user.id
-    async with SessionLocal() as s:
-        if not await is_admin(s, uid):
+    async with session_scope() as s:
+        if not (await get_actor(context, s, uid)).is_admin:
             return await q.edit_message_text("اجازه ندارید.")
         prefix = f"{role}:profile"
 
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""دستورهای عیب‌یابی/کارایی (فقط سوپرادمین)."""
+from __future__ import annotations
+import io
+import time
+
+from telegram import InputFile, Update
+from telegram.ext import ContextTypes
+
+from database import session_scope, pool_stats, slow_query_summary, reset_slow_queries, SLOW_QUERY_MS, SLOW_QUERY_LOG
+from actor import get_actor
+from cache import queries, totals
+import jobs
+import querystats
+import sampler
+
+
+def _fmt(d: dict) -> str:
+    return "\n".join(f"• {k}: {v}" for k, v in d.items())
+
+async def dbstats_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ /dbstats — وضعیت pool اتصال‌ها و کش‌ها """
+    async with session_scope() as s:
+        if not (await get_actor(context, s, update.effective_user.id)).is_super:
+            return await update.effective_message.reply_text("⛔️ فقط سوپرادمین.")
+    text = (
+        "🗄 Pool اتصال‌ها\n" + _fmt(pool_stats()) +
+        "\n\n🧠 کش کوئری‌ها\n" + _fmt(queries.stats()) +
+        f"\n\n🔢 کش شمارش لیست‌ها: {len(totals._data)} ورودی" +
+        "\n\n🧵 صف کارهای پس‌زمینه\n" + _fmt(jobs.manager.stats())
+    )
+    await update.effective_message.reply_text(text)
+
+async def querystats_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ /querystats [reset] — کوئری‌ها و زمان DB به‌ازای handler، تکرارهای N+1 و آپدیت‌های سنگین اخیر """
+    async with session_scope() as s:
+        if not (await get_actor(context, s, update.effective_user.id)).is_super:
+            return await update.effective_message.reply_text("⛔️ فقط سوپرادمین.")
+    if context.args and context.args[0] == "reset":
+        querystats.reset()
+        return await update.effective_message.reply_text("♻️ آمار کوئری‌ها صفر شد.")
+
+    sm = querystats.summary()
+    th = sm["thresholds"]
+    lines = [f"🧮 کوئری‌ها به‌ازای handler (هشدار: >{th['count']} کوئری، >{th['db_ms']}ms، تکرار >{th['repeat']})"]
+    for name, st in sm["handlers"]:
+        lines.append(
+            f"• {name}: {st.updates} آپدیت، میانگین {st.queries / st.updates:.1f} (حداکثر {st.max_queries}) کوئری، "
+            f"DB {st.db_ms / st.updates:.1f}ms (حداکثر {st.max_db_ms:.0f})"
+            + (f"، N+1 در {st.n_plus_one}" if st.n_plus_one else "")
+        )
+    if sm["repeats"]:
+        lines.append("\n🔁 statementهای تکراری (N+1)")
+        lines += [f"• {n}× {name}: {sh[:160]}" for (name, sh), n in sm["repeats"]]
+    if sm["offenders"]:
+        lines.append("\n🐢 آپدیت‌های بالای آستانه")
+        lines += [f"• {time.strftime('%H:%M:%S', time.localtime(at))} {name}: " + " | ".join(r[:160] for r in reasons)
+                  for at, name, _count, _ms, reasons in reversed(sm["offenders"])]
+    if len(lines) == 1:
+        lines.append("(هنوز آپدیتی ثبت نشده)")
+    await update.effective_message.reply_text("\n".join(lines)[:4000])
+
+async def slowqueries_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """ /slowqueries [reset] — کندترین statementها (بالای SLOW_QUERY_MS) با آخرین handler/آپدیت و پارامترها """
+    async with session_scope() as s:
+        if not (await get_actor(context, s, update.effective_user.id)).is_super:
+            return await update.effective_message.reply_text("⛔️ فقط سوپرادمین.")
+    if SLOW_QUERY_MS <= 0:
+        return await update.effective_message.reply_text("slow-query log خاموش است (SLOW_QUERY_MS=0).")
+    if context.args and context.args[0] == "reset":
+        reset_slow_queries()
+        return await update.effective_message.reply_text("♻️ خلاصهٔ کوئری‌های کند صفر شد.")
+
+    rows = slow_query_summary()
+    if not rows:
+        return await update.effective_message.reply_text(f"🐌 کوئری کندتر از {SLOW_QUERY_MS}ms ثبت نشده.")
+    lines = [f"🐌 کوئری‌های کند (>{SLOW_QUERY_MS}ms) — فایل: {SLOW_QUERY_LOG or '—'}"]
+    for i, (shape, st) in enumerate(rows, 1):
+        last = st.last
+        lines.append(
+            f"\n{i}) {st.count}× کل {st.total_ms:.0f}ms، حداکثر {st.max_ms:.0f}ms، ردیف‌ها {st.rows if st.rows is not None else '?'}\n"
+            f"   ↳ {last.get('handler') or '—'} [{last.get('update') or '—'}] {last.get('ts', '')}\n"
+            f"   {shape[:300]}"
+            + (f"\n   params: {str(last['params'])[:200]}" if last.get("params") is not None else "")
+        )
+    await update.effective_message.reply_text("\n".join(lines)[:4000])
+
+PROFILE_DEFAULT_SECONDS, PROFILE_MAX_SECONDS = 30, 300
+
+async def sampleprof_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /sampleprof [ثانیه] — پروفایل نمونه‌بردار event loop روی ترافیک واقعی؛ خروجی collapsed stacks
+    (flamegraph.pl / speedscope) به‌صورت فایل. با block=False ثبت می‌شود تا بقیهٔ آپدیت‌ها در این مدت اجرا شوند.
+    """
+    async with session_scope() as s:
+        if not (await get_actor(context, s, update.effective_user.id)).is_super:
+            return await update.effective_message.reply_text("⛔️ فقط سوپرادمین.")
+        # اتصال/تراکنش خواندنی در طول نمونه‌برداری باز نماند (idle in transaction روی PG، snapshot روی WAL)
+        await s.close()
+    try:
+        seconds = int(context.args[0]) if context.args else PROFILE_DEFAULT_SECONDS
+    except ValueError:
+        return await update.effective_message.reply_text("فرمت: /sampleprof [ثانیه]")
+    seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+
+    await update.effective_message.reply_text(f"⏱ نمونه‌برداری {seconds} ثانیه‌ای شروع شد…")
+    prof = await sampler.profile_loop(seconds)
+    if prof is None:
+        return await update.effective_message.reply_text("⏳ یک نمونه‌برداری دیگر در جریان است.")
+    if not prof.samples:
+        return await update.effective_message.reply_text("نمونه‌ای گرفته نشد.")
+
+    busy = prof.samples - prof.stacks.get("loop;(idle)", 0)
+    lines = [f"📊 {prof.samples} نمونه در {seconds}s؛ loop مشغول در {busy * 100 / prof.samples:.1f}٪"]
+    lines += [f"• {n * 100 / prof.samples:.1f}٪ {leaf}" for leaf, n in prof.top_leaves()]
+    name = f"loop_{time.strftime('%Y%m%d_%H%M%S')}.folded"
+    await update.effective_message.reply_document(
+        InputFile(io.BytesIO(prof.collapsed().encode()), filename=name),
+        caption="\n".join(lines)[:1000],
+    )
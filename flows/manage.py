@@ -1,17 +1,24 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
-import os, json, zipfile, pathlib
+import asyncio, os, json, zipfile, pathlib
 from typing import Optional
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CallbackQueryHandler
 from telegram.constants import ParseMode
-from database import SessionLocal
+import jobs
+from database import session_scope
+from metrics import export_timer
 from models import Campaign, Report, ReportItem,Unit
 from crud import (
-    is_admin, is_superadmin, list_campaigns_for_admin_units, get_campaign,
-    update_campaign_field, delete_campaign, stats_for_campaign, platforms_from_json, share_scope,list_campaigns_for_admin_unit_tree
+    list_campaigns_for_admin_units, get_campaign,
+    update_campaign_field, delete_campaign, stats_for_campaign, platforms_from_mask, list_campaigns_for_admin_unit_tree,
+    platforms_to_mask, set_campaign_platforms
 )
 from utils import safe_answer
+from actor import ActorContext, get_actor
+from paging import KeysetPager, apply_page
+from cache import totals
+from search import apply_campaign_search
 from keyboards import platforms_keyboard, PLATFORM_KEYS, PLATFORM_LABEL
 from keyboards import UNIT_TYPE_LABELS
 from sqlalchemy import select, func, or_
@@ -62,42 +69,28 @@ CAMP_PAGE_SIZE = 8
 
 def _fmt_platforms(c: Campaign) -> str:
 
-    keys = platforms_from_json(c.platforms)
+    keys = platforms_from_mask(c.platforms_mask)
     return ", ".join(PLATFORM_LABEL.get(k, k) for k in keys) or "-"
 
 
-async def _descendant_unit_ids(session, root_id: int) -> list[int]:
-    out = []; queue = [root_id]
-    while queue:
-        cur = queue.pop(0)
-        rows = (await session.execute(select(Unit.id).where(Unit.parent_id == cur))).all()
-        kids = [x for (x,) in rows]
-        out.extend(kids); queue.extend(kids)
-    return out
-
-
-async def _scope_for_admin(session, admin_id: int) -> tuple[bool, Optional[int], Optional[list[int]]]:
-    """برمی‌گرداند (is_super, root_unit_id, allowed_unit_ids)"""
-    if await is_superadmin(session, admin_id):
+async def _scope_for_admin(session, actor: ActorContext) -> tuple[bool, Optional[int], Optional[list[int]]]:
+    """برمی‌گرداند (is_super, root_unit_id, allowed_unit_ids)؛ سوپر: (True, None, None)"""
+    if actor.is_super:
         return True, None, None
-    # ریشهٔ دامنه ادمین
-    from crud import get_primary_unit_for_admin
-    root = await get_primary_unit_for_admin(session, admin_id)
-    if not root:
-        return False, None, []
-    ids = [root] + await _descendant_unit_ids(session, root)
-    return False, root, ids
+    return False, actor.primary_unit_id, await actor.unit_scope(session)
 
 def _camp_order(sort_key: str):
-    if sort_key == "name":   return Campaign.name.asc()
-    if sort_key == "unit":   return Unit.name.asc()
-    if sort_key == "status": return Campaign.active.desc(), Campaign.name.asc()
+    # آخرین ستون همیشه id است تا ترتیب یکتا و cursor پایدار باشد
+    if sort_key == "name":   return [(Campaign.name, False), (Campaign.id, False)]
+    if sort_key == "unit":   return [(Unit.name, False), (Campaign.id, False)]
+    if sort_key == "status": return [(Campaign.active, True), (Campaign.name, False), (Campaign.id, False)]
     # پیش‌فرض جدیدترین
-    return Campaign.id.desc()
+    return [(Campaign.id, True)]
 
 async def _fetch_campaigns_page(
     session, *, admin_id: int, page: int, q: Optional[str],
-    sort_key: str, filters: dict, scope_root: Optional[int], allowed_units: Optional[list[int]]
+    sort_key: str, filters: dict, scope_root: Optional[int], allowed_units: Optional[list[int]],
+    pager: Optional[KeysetPager] = None,
 ):
     """
     filters = {
@@ -114,10 +107,9 @@ async def _fetch_campaigns_page(
     if allowed_units is not None and allowed_units != []:
         base = base.where(Campaign.unit_id_owner.in_(allowed_units))
 
-    # فقط کمپین‌های واحدِ ریشهٔ خودم؟
-    if not await is_superadmin(session, admin_id) and filters.get("only_owner_root"):
-        if scope_root:
-            base = base.where(Campaign.unit_id_owner == scope_root)
+    # فقط کمپین‌های واحدِ ریشهٔ خودم؟ (برای سوپر scope_root خالی است)
+    if filters.get("only_owner_root") and scope_root:
+        base = base.where(Campaign.unit_id_owner == scope_root)
 
     # سازندهٔ من
     if filters.get("only_created_by_me"):
@@ -144,31 +136,29 @@ async def _fetch_campaigns_page(
     except Exception:
         pass
 
-    # پلتفرم‌ها (جستجو داخل JSON-Text)
+    # پلتفرم‌ها (هرکدام از پلتفرم‌های انتخابی = AND بیتی روی ماسک)
     plats = filters.get("plats") or []
     if plats:
-        conds = [Campaign.platforms.like(f'%"{p}"%') for p in plats]
-        base = base.where(or_(*conds))
+        base = base.where(Campaign.platforms_mask.op("&")(platforms_to_mask(plats)) != 0)
 
-    # جستجو: نام/شهر/هشتگ
+    # جستجو: نام/شهر/هشتگ/توضیحات (FTS در صورت وجود، وگرنه LIKE)
+    rank = None
     if q:
-        like = f"%{q}%"
-        base = base.where(
-            or_(
-                func.lower(Campaign.name).like(func.lower(like)),
-                func.lower(Campaign.city).like(func.lower(like)),
-                func.lower(Campaign.hashtag).like(func.lower(like)),
-            )
-        )
+        base, rank = apply_campaign_search(base, q, session.bind.dialect.name, Campaign)
 
-    # شمارش کل
-    total = (await session.execute(select(func.count()).select_from(base.subquery()))).scalar_one()
+    # شمارش کل (تا نوشتن بعدی روی این جدول‌ها از کش)
+    total = await totals.count(session, base)
 
+    if sort_key == "rank" and rank is not None:
+        order = [(rank, False), (Campaign.id, True)]
+    else:
+        order = _camp_order(sort_key)
+    cursor = pager.cursor(page) if pager else None
     rows = (await session.execute(
-        base.order_by(*(_camp_order(sort_key) if isinstance(_camp_order(sort_key), tuple) else (_camp_order(sort_key),)))
-            .limit(CAMP_PAGE_SIZE)
-            .offset(page * CAMP_PAGE_SIZE)
-    )).all()  # [(Campaign, Unit), ...]
+        apply_page(base, order, page=page, size=CAMP_PAGE_SIZE, cursor=cursor)
+    )).all()  # [(Campaign, Unit[, rank]), ...]
+    if pager:
+        pager.remember(page, rows, order)
 
     return rows, total
 
@@ -193,11 +183,14 @@ async def _render_campaigns_list(target_message, context: ContextTypes.DEFAULT_T
     sort_key = st.get("sort", "new")
     filters  = st.get("filters", {"only_created_by_me": False, "only_owner_root": False, "status": "all", "origin": "all", "plats": []})
 
-    async with SessionLocal() as s:
-        is_super, root_unit, allowed_units = await _scope_for_admin(s, admin_id)
+    pager = KeysetPager(st, "ks", (admin_id, q, sort_key, filters))
+
+    async with session_scope() as s:
+        actor = await get_actor(context, s, admin_id)
+        is_super, root_unit, allowed_units = await _scope_for_admin(s, actor)
         rows, total = await _fetch_campaigns_page(
             s, admin_id=admin_id, page=page, q=q, sort_key=sort_key,
-            filters=filters, scope_root=root_unit, allowed_units=allowed_units
+            filters=filters, scope_root=root_unit, allowed_units=allowed_units, pager=pager
         )
 
     # هدر
@@ -210,7 +203,7 @@ async def _render_campaigns_list(target_message, context: ContextTypes.DEFAULT_T
 
     # آیتم‌ها
     kb_rows: list[list[InlineKeyboardButton]] = []
-    for (c, u) in rows:
+    for c, u, *_ in rows:
         plats = _fmt_platforms(c)
         # root/copy badge (اگر ستون وجود دارد)
         try:
@@ -280,6 +273,8 @@ async def campaigns_search_receiver(update: Update, context: ContextTypes.DEFAUL
     st = context.user_data.setdefault("cl", {})
     st["q"] = txt if txt else None
     st["page"] = 0
+    # با جستجوی تازه پیش‌فرض مرتب‌سازی «مرتبط‌ترین» است
+    st["sort"] = "rank" if st["q"] else ("new" if st.get("sort") == "rank" else st.get("sort", "new"))
     context.user_data.pop("cl_wait_q", None)
     await _render_campaigns_list(update.message, context, edit=False)
 
@@ -295,7 +290,7 @@ async def campaigns_browse_cb(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     if data.startswith("cl:sort:"):
         cur = data.split(":")[2]
-        order = ("new","name","unit","status")
+        order = ("new","name","unit","status") + (("rank",) if st.get("q") else ())
         try:
             i = order.index(cur)
             st["sort"] = order[(i+1)%len(order)]
@@ -306,10 +301,11 @@ async def campaigns_browse_cb(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     if data == "cl:search":
         context.user_data["cl_wait_q"] = True
-        return await q.edit_message_text("عبارت جستجو را بفرستید (نام/شهر/هشتگ):")
+        return await q.edit_message_text("عبارت جستجو را بفرستید (نام/شهر/هشتگ/توضیحات):")
 
     if data == "cl:clear":
         st["q"] = None; st["page"]=0
+        if st.get("sort") == "rank": st["sort"] = "new"
         st["filters"] = {"only_created_by_me": False, "only_owner_root": False, "status": "all", "origin": "all", "plats": []}
         return await _render_campaigns_list(q.message, context, edit=True)
 
@@ -357,8 +353,8 @@ def manage_keyboard(campaign_id: int) -> InlineKeyboardMarkup:
 
 async def campaigns_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     admin_id = update.effective_user.id
-    async with SessionLocal() as s:
-        if not (await is_admin(s, admin_id) or await is_superadmin(s, admin_id)):
+    async with session_scope() as s:
+        if not (await get_actor(context, s, admin_id)).is_admin:
             return
     # state اولیه برای لیست
     context.user_data["cl"] = {
@@ -371,27 +367,29 @@ async def campaigns_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await _render_campaigns_list(target, context, edit=False)
 
 async def manage_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query; await safe_answer(q)
+    # هر شاخه دقیقاً یک answerCallbackQuery می‌فرستد (بعد از چک دسترسی، تا alertها واقعاً نمایش داده شوند)
+    q = update.callback_query
     data = q.data; admin_id = q.from_user.id
 
-    async with SessionLocal() as s:
-        if not await is_admin(s, admin_id):
+    async with session_scope() as s:
+        actor = await get_actor(context, s, admin_id)
+        if not actor.is_admin:
             return await safe_answer(q, "اجازه ندارید.", show_alert=True)
 
         async def ensure_manageable_campaign(cid: int) -> Campaign | None:
             c = await get_campaign(s, cid)
             if not c: return None
-            owner = c.admin_id
-            if await share_scope(s, admin_id, owner):
+            if actor.share_scope(c.admin_id):
                 return c
             return None
 
         if data.startswith("camp:") and data.endswith(":manage"):
             cid = int(data.split(":")[1])
             camp = await ensure_manageable_campaign(cid)
+            await safe_answer(q)
             if not camp:
                 return await q.edit_message_text("پیدا نشد یا متعلق به شما نیست.")
-            plats = ", ".join(platforms_from_json(camp.platforms)) or "-"
+            plats = ", ".join(platforms_from_mask(camp.platforms_mask)) or "-"
             text = (
                 f"#{camp.id} | {camp.name} {'🟢' if camp.active else '🔴'}\n"
                 f"هشتگ: {camp.hashtag or '-'}\n"
@@ -405,12 +403,13 @@ async def manage_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
             _, cid_str, field = data.split(":")
             cid = int(cid_str)
             camp = await ensure_manageable_campaign(cid)
+            await safe_answer(q)
             if not camp:
                 return await q.edit_message_text("پیدا نشد یا متعلق به شما نیست.")
             context.user_data["edit_field"] = (cid, field)
 
             if field == "platforms":
-                cur = platforms_from_json(camp.platforms)  # list[str]
+                cur = platforms_from_mask(camp.platforms_mask)  # list[str]
                 context.user_data["edit_platforms"] = {"cid": cid, "picked": cur}
                 return await q.edit_message_text(
                     "پلتفرم‌ها را ویرایش کنید و در پایان «💾 ثبت» را بزنید:",
@@ -429,14 +428,16 @@ async def manage_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 return await safe_answer(q, "اجازه ندارید.", show_alert=True)
             camp.active = not camp.active
             await s.commit()
-            await q.answer("انجام شد")
-            return await campaigns_cmd(update, context)
+            await safe_answer(q, "انجام شد")
+            # همان پیام به لیست (با صفحه/فیلتر قبلی) ویرایش می‌شود، نه پیام تازه
+            return await _render_campaigns_list(q.message, context, edit=True)
 
         if data.startswith("delete:"):
             cid = int(data.split(":")[1])
             camp = await ensure_manageable_campaign(cid)
             if not camp:
                 return await safe_answer(q, "اجازه ندارید.", show_alert=True)
+            await safe_answer(q)
             await q.edit_message_reply_markup(InlineKeyboardMarkup([
                 [InlineKeyboardButton("❌ انصراف", callback_data=f"camp:{cid}:manage")],
                 [InlineKeyboardButton("🗑️ تأیید حذف", callback_data=f"delok:{cid}")],
@@ -449,14 +450,15 @@ async def manage_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if not camp:
                 return await safe_answer(q, "اجازه ندارید.", show_alert=True)
             await delete_campaign(s, cid); await s.commit()
-            await q.answer("حذف شد")
-            return await campaigns_cmd(update, context)
+            await safe_answer(q, "حذف شد")
+            return await _render_campaigns_list(q.message, context, edit=True)
 
         if data.startswith("stats:"):
             cid = int(data.split(":")[1])  # دریافت campaign_id از callback_data
             camp = await ensure_manageable_campaign(cid)  # اطمینان از این که کمپین قابل مدیریت است
             if not camp:
                 return await safe_answer(q, "اجازه ندارید.", show_alert=True)
+            await safe_answer(q)
 
             # استخراج آمار
             from crud import stats_by_unit_platform
@@ -478,41 +480,39 @@ async def manage_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
             camp = await ensure_manageable_campaign(cid)
             if not camp:
                 return await safe_answer(q, "اجازه ندارید.", show_alert=True)
-            zippath = await export_zip(cid)
-            if not zippath:
-                return await safe_answer(q, "چیزی برای خروجی نیست", show_alert=True)
-            await q.message.reply_document(InputFile(open(zippath, 'rb'), filename=os.path.basename(zippath)))
-            return
+            # ساخت ZIP در صف کارهای پس‌زمینه؛ پیام وضعیت جدا تا پنل مدیریت بماند
+            run = jobs.export_job(lambda on_progress, out_dir: export_zip(cid, out_dir), "چیزی برای خروجی نیست.")
+            return await jobs.submit_for_callback(q, context, jobs.EXPORT, "export:campaign",
+                                                  f"خروجی ZIP کمپین #{cid}", run)
 
 async def edit_platforms_toggle(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query
-    await safe_answer(q)
+    q = update.callback_query  # یک answer در هر شاخه، مثل manage_cb
     payload = q.data.split(":", 1)[1]  # بعد از "epf:"
     st = context.user_data.get("edit_platforms")
     if not st:
-        return await q.answer("جلسهٔ ویرایش یافت نشد. دوباره «🧩 ویرایش پلتفرم‌ها» را بزنید.", show_alert=True)
+        return await safe_answer(q, "جلسهٔ ویرایش یافت نشد. دوباره «🧩 ویرایش پلتفرم‌ها» را بزنید.", show_alert=True)
 
     picked: list[str] = st.get("picked", [])
     cid: int = st.get("cid")
 
     if payload == "done":
         admin_id = q.from_user.id
-        async with SessionLocal() as s:
+        async with session_scope() as s:
             camp = await get_campaign(s, cid)
-            if not camp or not await share_scope(s, admin_id, camp.admin_id):
-                return await q.answer("اجازه ندارید.", show_alert=True)
+            if not camp or not (await get_actor(context, s, admin_id)).share_scope(camp.admin_id):
+                return await safe_answer(q, "اجازه ندارید.", show_alert=True)
 
-            # ✅ اینجا JSON می‌کنیم تا خطای «type list is not supported» رفع شود
-            camp.platforms = json.dumps(picked, ensure_ascii=False)
+            # ✅ JSON و بیت‌ماسک با هم ذخیره می‌شوند
+            set_campaign_platforms(camp, picked)
             s.add(camp)
             try:
                 await s.commit()
             except Exception as e:
                 await s.rollback()
-                return await q.answer(f"ذخیره نشد: {e}", show_alert=True)
+                return await safe_answer(q, f"ذخیره نشد: {e}", show_alert=True)
 
             # کارت مدیریت به‌روز
-            plats = ", ".join(platforms_from_json(camp.platforms)) or "-"
+            plats = ", ".join(platforms_from_mask(camp.platforms_mask)) or "-"
             text = (
                 f"#{camp.id} | {camp.name} {'🟢' if camp.active else '🔴'}\n"
                 f"هشتگ: {camp.hashtag or '-'}\n"
@@ -524,10 +524,12 @@ async def edit_platforms_toggle(update: Update, context: ContextTypes.DEFAULT_TY
         # پاکسازی حالت ویرایش
         context.user_data.pop("edit_platforms", None)
         context.user_data.pop("edit_field", None)
+        await safe_answer(q, "ثبت شد")
         return await q.edit_message_text(text, reply_markup=manage_keyboard(cid))
 
     # تاگل آیتم‌ها
     if payload in PLATFORM_KEYS:
+        await safe_answer(q)
         if payload in picked:
             picked.remove(payload)
         else:
@@ -538,23 +540,24 @@ async def edit_platforms_toggle(update: Update, context: ContextTypes.DEFAULT_TY
             reply_markup=platforms_keyboard(picked, prefix="epf", done_label="💾 ثبت")
         )
 
-    return await q.answer("گزینه نامعتبر.", show_alert=True)
+    return await safe_answer(q, "گزینه نامعتبر.", show_alert=True)
 
 async def edit_text_receiver(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.user_data.get("edit_field"): return
     cid, field = context.user_data.get("edit_field")
     text = (update.message.text or "").strip()
     admin_id = update.effective_user.id
-    async with SessionLocal() as s:
-        if not await is_admin(s, admin_id): return await update.message.reply_text("اجازه ندارید.")
+    async with session_scope() as s:
+        actor = await get_actor(context, s, admin_id)
+        if not actor.is_admin: return await update.message.reply_text("اجازه ندارید.")
         c = await get_campaign(s, cid)
-        if not c or not await share_scope(s, admin_id, c.admin_id):
+        if not c or not actor.share_scope(c.admin_id):
             return await update.message.reply_text("اجازه ندارید.")
         if field == "platforms":
             # انتظار JSON لیست
             try:
                 arr = json.loads(text); assert isinstance(arr, list)
-                c.platforms = json.dumps(arr, ensure_ascii=False)
+                set_campaign_platforms(c, arr)
             except Exception:
                 return await update.message.reply_text("فرمت JSON معتبر نیست. مثال: [\"telegram\",\"instagram\"]")
         elif field in ("name","hashtag","city","description"):
@@ -578,7 +581,12 @@ def _fa_platform_dir(platform: str) -> str:
     return label or "نامشخص"
 
 
-async def export_zip(campaign_id: int) -> Optional[str]:
+@export_timer("campaign")
+async def export_zip(campaign_id: int, out_dir=DATA_DIR) -> Optional[str]:
+    # rglob و فشرده‌سازی همگام‌اند؛ در thread تا loop آزاد بماند
+    return await asyncio.to_thread(_build_campaign_zip, campaign_id, out_dir)
+
+def _build_campaign_zip(campaign_id: int, out_dir=DATA_DIR) -> Optional[str]:
     bases = [p for p in DATA_DIR.glob(f"*/c{campaign_id}") if p.is_dir()]
     if not bases:
         return None
@@ -600,7 +608,7 @@ async def export_zip(campaign_id: int) -> Optional[str]:
     if not files:
         return None
 
-    zip_name = DATA_DIR / f"c{campaign_id}_export.zip"
+    zip_name = pathlib.Path(out_dir) / f"c{campaign_id}_export.zip"
     if zip_name.exists():
         zip_name.unlink()
 
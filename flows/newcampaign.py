@@ -4,7 +4,8 @@ from telegram import Update, ReplyKeyboardRemove
 from telegram.ext import ContextTypes, ConversationHandler, CommandHandler, MessageHandler, CallbackQueryHandler, filters
 from telegram.constants import ParseMode
 from keyboards import platforms_keyboard, PLATFORM_LABEL, PLATFORM_KEYS, admin_reply_kb, superadmin_reply_kb
-from crud import create_campaign_v2, get_primary_unit_for_admin, is_admin
+from crud import create_campaign_v2
+from actor import get_actor
 from utils import now_iso
 from flows.common import cancel_cmd
 
@@ -12,10 +13,10 @@ from flows.common import cancel_cmd
 NEWCAMP_NAME, NEWCAMP_HASHTAG, NEWCAMP_CITY, NEWCAMP_PLATFORMS, NEWCAMP_DESC, NEWCAMP_CONFIRM = range(6)
 
 async def newcampaign(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    from database import SessionLocal
+    from database import session_scope
     u = update.effective_user
-    async with SessionLocal() as s:
-        if not await is_admin(s, u.id):
+    async with session_scope() as s:
+        if not (await get_actor(context, s, u.id)).is_admin:
             await update.effective_message.reply_text("⛔️ فقط ادمین‌ها می‌توانند کمپین بسازند.")
             return ConversationHandler.END
     context.user_data["_in_conversation"] = True
@@ -49,7 +50,7 @@ async def newcamp_city(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return NEWCAMP_PLATFORMS
 
 async def skip(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    from database import SessionLocal
+    from database import session_scope
     state = context.user_data.get("state")
     tmp = context.user_data.get("tmp", {})
     if context.user_data.get("conv") == "newcamp":
@@ -118,13 +119,13 @@ async def newcamp_desc(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return NEWCAMP_CONFIRM
 
 async def newcamp_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    from database import SessionLocal
+    from database import session_scope
     admin_id = update.effective_user.id
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         d = context.user_data.pop("tmp", {})
         if not d or not d.get("name") or not d.get("platforms"):
             await update.message.reply_text("اطلاعات ناقص است."); return ConversationHandler.END
-        owner_unit_id = await get_primary_unit_for_admin(s, admin_id)
+        owner_unit_id = (await get_actor(context, s, admin_id)).primary_unit_id
         if not owner_unit_id:
             await update.message.reply_text("برای شما واحدی تعریف نشده. ابتدا واحد/نقش شما را بسازید.")
             return ConversationHandler.END
@@ -9,16 +9,18 @@ from keyboards import PLATFORM_LABEL, BTN_REPORT
 from crud import (
     list_reportable_campaigns_for_user,
     get_campaign, get_user_admin, get_or_create_open_report, add_report_item,
-    is_admin, is_superadmin, get_user_unit_id  
+    get_user_unit_id, platforms_from_mask
 )
+from actor import get_actor
 from datetime import datetime
 
-from database import SessionLocal
+from database import session_scope
 from models import Report
 from sqlalchemy import select
 from models import ReportItem
 
 from utils import safe_answer
+from metrics import timed_download
 
 REPORT_PICK_CAMPAIGN, REPORT_PICK_PLATFORM, REPORT_WAIT_PHOTOS = range(3)
 DATA_DIR = pathlib.Path("storage").absolute()
@@ -107,19 +109,18 @@ def campaigns_inline_keyboard(camps, manage: bool=False) -> InlineKeyboardMarkup
 async def report_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data["_in_conversation"] = True
     uid = update.effective_user.id
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         camps = await list_reportable_campaigns_for_user(s, uid, active_only=True)
+        if not camps:
+            if (await get_actor(context, s, uid)).is_admin:
+                msg = "کمپین فعالی از والدِ واحد شما در دسترس نیست."
+            elif await get_user_admin(s, uid) is None:
+                msg = "شما هنوز به واحدی متصل نشده‌اید."
+            else:
+                msg = "کمپین فعالی از واحدِ بالادست وجود ندارد."
 
     if not camps:
-        async with SessionLocal() as s:
-            if await is_admin(s, uid) or await is_superadmin(s, uid):
-                await update.effective_message.reply_text("کمپین فعالی از والدِ واحد شما در دسترس نیست.")
-            else:
-                admin_id = await get_user_admin(s, uid)
-                if admin_id is None:
-                    await update.effective_message.reply_text("شما هنوز به واحدی متصل نشده‌اید.")
-                else:
-                    await update.effective_message.reply_text("کمپین فعالی از واحدِ بالادست وجود ندارد.")
+        await update.effective_message.reply_text(msg)
         return ConversationHandler.END
 
     context.user_data["report_cids"] = {c.id for c in camps}
@@ -139,14 +140,14 @@ async def report_pick_campaign(update: Update, context: ContextTypes.DEFAULT_TYP
         return ConversationHandler.END
 
     # کمپین را می‌خوانیم تا پلتفرم‌ها را نشان دهیم
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         camp = await get_campaign(s, cid)
     if not camp or not camp.active:
         await q.edit_message_text("کمپین نامعتبر/غیرفعال است.")
         return ConversationHandler.END
 
     context.user_data["report_campaign_id"] = cid
-    plats = __import__("json").loads(camp.platforms)
+    plats = platforms_from_mask(camp.platforms_mask)
     rows = [[InlineKeyboardButton(PLATFORM_LABEL.get(p, p), callback_data=f"rpf:{p}")] for p in plats]
     await q.edit_message_text("پلتفرم هدف را انتخاب کنید:", reply_markup=InlineKeyboardMarkup(rows))
     return REPORT_PICK_PLATFORM
@@ -185,7 +186,7 @@ async def receive_photos(update: Update, context: ContextTypes.DEFAULT_TYPE):
     tg_file = await update.get_bot().get_file(best.file_id)
     file_name = tg_file.file_path.split("/")[-1]  # مثلا "file_28.jpg"
 
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         # کمپین معتبر؟
         camp = await get_campaign(s, cid)
         if not camp or not camp.active:
@@ -198,13 +199,7 @@ async def receive_photos(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("⛔️ شما به هیچ واحدی متصل نیستید.")
             return
 
-        # گزارش باز را بگیر/بساز
-        report_id = await get_or_create_open_report(s, uid, cid, platform, None)
-        rep = await s.get(Report, report_id)
-        rep.unit_id_owner = current_unit_id
-        rep.platform = platform
-
-        # چک تکراری داخل همین گزارش، بر اساس نام فایل
+        # چک تکراری داخل همین کمپین/واحد، بر اساس نام فایل
         exists = await s.execute(
             select(ReportItem.id)
             .join(Report, ReportItem.report_id == Report.id)
@@ -219,14 +214,20 @@ async def receive_photos(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text(f"⚠️ این فایل قبلاً در همین کمپین/واحد (صرف‌نظر از پلتفرم) ثبت شده: {file_name}")
             return
 
-
-        # مسیر نهایی
-        base_dir = get_storage_path("ir", cid, platform, current_unit_id, report_id)
+        # مسیر نهایی (به شناسهٔ گزارش وابسته نیست)
+        base_dir = get_storage_path("ir", cid, platform, current_unit_id, None)
         base_dir.mkdir(parents=True, exist_ok=True)
         final_path = base_dir / file_name
 
-        # دانلود و ثبت
-        await tg_file.download_to_drive(final_path)
+        # دانلود قبل از اولین نوشتن: صف نویسندهٔ SQLite (database.SQLiteWriterSession) از flush تا commit
+        # گرفته می‌شود و نباید در طول I/O شبکه نگه داشته شود
+        await timed_download(tg_file, final_path)
+
+        # گزارش باز را بگیر/بساز و ثبت کن
+        report_id = await get_or_create_open_report(s, uid, cid, platform, None)
+        rep = await s.get(Report, report_id)
+        rep.unit_id_owner = current_unit_id
+        rep.platform = platform
         await add_report_item(s, report_id, best.file_id, str(final_path), platform, file_name)
         await s.commit()
 
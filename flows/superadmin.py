@@ -1,8 +1,9 @@
 # flows/superadmin.py
 from telegram import Update
 from telegram.ext import ContextTypes
-from database import SessionLocal
-from crud import is_admin, is_superadmin, get_primary_unit_for_admin  # ← اضافه شد
+from database import session_scope
+from crud import get_primary_unit_for_admin  # ← اضافه شد
+from actor import get_actor
 from keyboards import (
     sa_main_menu, sa_units_menu, sa_admins_menu, sa_campaigns_menu, sa_reports_menu, sa_back_home,
     adm_main_menu, adm_units_menu, adm_campaigns_menu,  
@@ -16,10 +17,11 @@ from flows.report import report_cmd
 
 async def dashboard_entry(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
-    async with SessionLocal() as s:
-        if await is_superadmin(s, uid):
+    async with session_scope() as s:
+        actor = await get_actor(context, s, uid)
+        if actor.is_super:
             return await update.effective_message.reply_text("داشبورد مدیریت:", reply_markup=sa_main_menu())
-        if await is_admin(s, uid):
+        if actor.is_admin:
             return await update.effective_message.reply_text("داشبورد مدیریت (ادمین):", reply_markup=adm_main_menu())
     return await update.effective_message.reply_text("⛔️ فقط ادمین‌ها و سوپرادمین‌ها دسترسی دارند.")
 
@@ -29,8 +31,8 @@ async def adm_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not q:
         return
     uid = q.from_user.id
-    async with SessionLocal() as s:
-        if not await is_admin(s, uid):
+    async with session_scope() as s:
+        if not (await get_actor(context, s, uid)).is_admin:
             return await q.answer("⛔️ فقط ادمین.", show_alert=True)
 
     data = q.data
@@ -90,8 +92,8 @@ async def adm_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def superadmin_dashboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    async with SessionLocal() as s:
-        if not await is_superadmin(s, update.effective_user.id):
+    async with session_scope() as s:
+        if not (await get_actor(context, s, update.effective_user.id)).is_super:
             return await update.effective_message.reply_text("⛔️ فقط سوپرادمین.")
     await update.effective_message.reply_text("داشبورد مدیریت:", reply_markup=sa_main_menu())
 
@@ -99,8 +101,8 @@ async def sa_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     if not q:
         return
-    async with SessionLocal() as s:
-        if not await is_superadmin(s, q.from_user.id):
+    async with session_scope() as s:
+        if not (await get_actor(context, s, q.from_user.id)).is_super:
             return await q.answer("⛔️ فقط سوپرادمین.", show_alert=True)
 
     data = q.data
@@ -177,8 +179,8 @@ async def report_submit_to_dashboard(update: Update, context: ContextTypes.DEFAU
     # await safe_answer(q)  # پاسخ به callback query
 
     uid = update.effective_user.id
-    async with SessionLocal() as s:
-        if await is_superadmin(s, uid) or await is_admin(s, uid):
+    async with session_scope() as s:
+        if (await get_actor(context, s, uid)).is_admin:
             # هدایت به ویزارد گزارش برای سوپرادمین و ادمین
             return await report_cmd(update, context)  # فراخوانی مستقیم تابع report_cmd برای شروع ویزارد
 
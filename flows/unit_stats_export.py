@@ -1,15 +1,18 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
-import os, zipfile, pathlib
+import asyncio, os, zipfile, pathlib
 from typing import Optional
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, InputFile, Update
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import ContextTypes
-from database import SessionLocal
+import jobs
+from utils import safe_answer
+from database import session_scope
+from metrics import export_timer
 from keyboards import UNIT_TYPE_LABELS, PLATFORM_LABEL
 from crud import (
     is_superadmin, list_units_for_actor,
     list_campaigns_reported_by_unit, stats_for_unit_campaign, stats_for_unit_all_campaigns,
-    fetch_unit_campaign_items, fetch_unit_all_items, get_campaign
+    iter_unit_items, get_campaign
 )
 
 DATA_DIR = pathlib.Path("storage").absolute()
@@ -43,24 +46,24 @@ def _fa_platform_dir(platform: str) -> str:
             label = label[len(junk):]
     return label.replace("/", "／").strip() or "نامشخص"
 
-async def _send_stats_for_unit_campaign(q, unit_id: int, campaign_id: int):
-    async with SessionLocal() as s:
+async def _stats_text_unit_campaign(unit_id: int, campaign_id: int) -> str:
+    async with session_scope() as s:
         rows = await stats_for_unit_campaign(s, unit_id, campaign_id)
         camp = await get_campaign(s, campaign_id)
     if not camp:
-        return await q.edit_message_text("کمپین یافت نشد.")
+        return "کمپین یافت نشد."
     if not rows:
-        return await q.edit_message_text(f"برای این واحد در کمپین #{campaign_id} گزارشی ثبت نشده.")
+        return f"برای این واحد در کمپین #{campaign_id} گزارشی ثبت نشده."
     lines = [f"📊 آمار واحد #{unit_id} در کمپین #{campaign_id} — {camp.name}"]
     for plat, cnt in rows:
         lines.append(f"• {PLATFORM_LABEL.get(plat, plat)}: {cnt}")
-    await q.edit_message_text("\n".join(lines))
+    return "\n".join(lines)
 
-async def _send_stats_for_unit_all(q, unit_id: int):
-    async with SessionLocal() as s:
+async def _stats_text_unit_all(unit_id: int) -> str:
+    async with session_scope() as s:
         rows = await stats_for_unit_all_campaigns(s, unit_id)
     if not rows:
-        return await q.edit_message_text("برای این واحد گزارشی ثبت نشده.")
+        return "برای این واحد گزارشی ثبت نشده."
     # گروه‌بندی بر اساس کمپین
     by_camp = {}
     for r in rows:
@@ -71,42 +74,60 @@ async def _send_stats_for_unit_all(q, unit_id: int):
         lines.append(f"\n#{cid} — {cname}:")
         for plat, cnt in items:
             lines.append(f"• {PLATFORM_LABEL.get(plat, plat)}: {cnt}")
-    await q.edit_message_text("\n".join(lines))
+    return "\n".join(lines)[:4000]
 
-async def _export_zip_unit_campaign(unit_id: int, campaign_id: int) -> Optional[str]:
-    async with SessionLocal() as s:
-        items = await fetch_unit_campaign_items(s, unit_id, campaign_id)
-        camp = await get_campaign(s, campaign_id)
-    if not items or not camp:
-        return None
-    zip_name = DATA_DIR / f"unit_{unit_id}__campaign_{campaign_id}.zip"
+def _add_to_zip(zf: zipfile.ZipFile, file_path: str, arcname: str) -> bool:
+    """در thread اجرا می‌شود (فشرده‌سازی/خواندن دیسک loop را قفل نکند)."""
+    if not file_path or not os.path.exists(file_path):
+        return False
+    zf.write(file_path, arcname=arcname)
+    return True
+
+async def _zip_progress(on_progress, seen: int):
+    if on_progress is not None and seen % 200 == 0:
+        await on_progress(seen)
+
+@export_timer("unit_campaign")
+async def _export_zip_unit_campaign(unit_id: int, campaign_id: int, on_progress=None,
+                                    out_dir=DATA_DIR) -> Optional[str]:
+    zip_name = pathlib.Path(out_dir) / f"unit_{unit_id}__campaign_{campaign_id}.zip"
     if zip_name.exists(): zip_name.unlink()
-    with zipfile.ZipFile(zip_name, "w", zipfile.ZIP_DEFLATED) as zf:
-        for file_path, platform, user_id, cid, cname in items:
-            if not file_path or not os.path.exists(file_path):
-                continue
-            plat_dir = _fa_platform_dir(platform)
-            filename = os.path.basename(file_path)
-            arcname = f"{plat_dir}/user_{user_id}__{filename}"
-            zf.write(file_path, arcname=arcname)
+    seen = 0
+    async with session_scope() as s:
+        if not await get_campaign(s, campaign_id):
+            return None
+        # ردیف‌ها جریانی از DB می‌آیند و همان لحظه در ZIP نوشته می‌شوند
+        with zipfile.ZipFile(zip_name, "w", zipfile.ZIP_DEFLATED) as zf:
+            async for file_path, platform, user_id, cid, cname in iter_unit_items(s, unit_id, campaign_id):
+                seen += 1
+                plat_dir = _fa_platform_dir(platform)
+                filename = os.path.basename(file_path or "")
+                arcname = f"{plat_dir}/user_{user_id}__{filename}"
+                await asyncio.to_thread(_add_to_zip, zf, file_path, arcname)
+                await _zip_progress(on_progress, seen)
+    if not seen:
+        zip_name.unlink(missing_ok=True)
+        return None
     return str(zip_name)
 
-async def _export_zip_unit_all(unit_id: int) -> Optional[str]:
-    async with SessionLocal() as s:
-        items = await fetch_unit_all_items(s, unit_id)
-    if not items:
-        return None
-    zip_name = DATA_DIR / f"unit_{unit_id}__all_campaigns.zip"
+@export_timer("unit_all")
+async def _export_zip_unit_all(unit_id: int, on_progress=None, out_dir=DATA_DIR) -> Optional[str]:
+    zip_name = pathlib.Path(out_dir) / f"unit_{unit_id}__all_campaigns.zip"
     if zip_name.exists(): zip_name.unlink()
-    with zipfile.ZipFile(zip_name, "w", zipfile.ZIP_DEFLATED) as zf:
-        for file_path, platform, user_id, cid, cname in items:
-            if not file_path or not os.path.exists(file_path):
-                continue
-            plat_dir = _fa_platform_dir(platform)
-            safe_camp_dir = f"کمپین #{cid} - {cname}".replace("/", "／")
-            filename = os.path.basename(file_path)
-            arcname = f"{safe_camp_dir}/{plat_dir}/user_{user_id}__{filename}"
-            zf.write(file_path, arcname=arcname)
+    seen = 0
+    async with session_scope() as s:
+        with zipfile.ZipFile(zip_name, "w", zipfile.ZIP_DEFLATED) as zf:
+            async for file_path, platform, user_id, cid, cname in iter_unit_items(s, unit_id):
+                seen += 1
+                plat_dir = _fa_platform_dir(platform)
+                safe_camp_dir = f"کمپین #{cid} - {cname}".replace("/", "／")
+                filename = os.path.basename(file_path or "")
+                arcname = f"{safe_camp_dir}/{plat_dir}/user_{user_id}__{filename}"
+                await asyncio.to_thread(_add_to_zip, zf, file_path, arcname)
+                await _zip_progress(on_progress, seen)
+    if not seen:
+        zip_name.unlink(missing_ok=True)
+        return None
     return str(zip_name)
 
 async def unit_stats_export_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -122,7 +143,8 @@ async def unit_stats_export_cb(update: Update, context: ContextTypes.DEFAULT_TYP
 
     # مرحله 1: انتخاب واحد (اگر نیاز باشد)
     if len(parts) == 3:
-        async with SessionLocal() as s:
+        await safe_answer(q)
+        async with session_scope() as s:
             units = await list_units_for_actor(s, q.from_user.id)
         if not units:
             return await q.edit_message_text("هیچ واحدی برای شما در دسترس نیست.")
@@ -130,7 +152,7 @@ async def unit_stats_export_cb(update: Update, context: ContextTypes.DEFAULT_TYP
         if len(units) == 1:
             unit_id = units[0].id
             # برو مرحلهٔ انتخاب کمپین/گزینه‌ها
-            async with SessionLocal() as s:
+            async with session_scope() as s:
                 camps = await list_campaigns_reported_by_unit(s, unit_id, active_only=False)
             if feature == "stats":
                 kb = _campaigns_keyboard(camps, f"{role}:unit:stats", unit_id, True, "📊 مجموع همهٔ کمپین‌ها")
@@ -144,8 +166,9 @@ async def unit_stats_export_cb(update: Update, context: ContextTypes.DEFAULT_TYP
 
     # مرحله 2:  انتخاب کمپین    
     if len(parts) >= 4 and parts[3] == "pickunit":
+        await safe_answer(q)
         unit_id = int(parts[4])
-        async with SessionLocal() as s:
+        async with session_scope() as s:
             camps = await list_campaigns_reported_by_unit(s, unit_id, active_only=False)
         if feature == "stats":
             kb = _campaigns_keyboard(camps, f"{role}:unit:stats", unit_id, True, "📊 مجموع همهٔ کمپین‌ها")
@@ -154,32 +177,32 @@ async def unit_stats_export_cb(update: Update, context: ContextTypes.DEFAULT_TYP
             kb = _campaigns_keyboard(camps, f"{role}:unit:export", unit_id, True, "🗂️ خروجی همهٔ کمپین‌ها")
             return await q.edit_message_text("یک کمپین انتخاب کنید:", reply_markup=kb)
 
-    # مرحله 3: عمل روی انتخاب کمپین/یا همه
+    # مرحله 3: عمل روی انتخاب کمپین/یا همه — در صف کارهای پس‌زمینه (jobs)
     if feature == "stats":
         if len(parts) >= 6 and parts[3] == "camp":
-            unit_id = int(parts[4])
-            campaign_id = int(parts[5])
-            return await _send_stats_for_unit_campaign(q, unit_id, campaign_id)
+            unit_id, campaign_id = int(parts[4]), int(parts[5])
+            run = lambda job: _stats_text_unit_campaign(unit_id, campaign_id)
+            return await jobs.submit_for_callback(q, context, jobs.STATS, "stats:unit_campaign", "آمار واحد",
+                                                  run, in_place=True)
         if len(parts) >= 5 and parts[3] == "all":
             unit_id = int(parts[4])
-            return await _send_stats_for_unit_all(q, unit_id)
+            run = lambda job: _stats_text_unit_all(unit_id)
+            return await jobs.submit_for_callback(q, context, jobs.STATS, "stats:unit_all", "آمار کلی واحد",
+                                                  run, in_place=True)
 
     if feature == "export":
         if len(parts) >= 6 and parts[3] == "camp":
-            unit_id = int(parts[4])
-            campaign_id = int(parts[5])
-            zippath = await _export_zip_unit_campaign(unit_id, campaign_id)
-            if not zippath:
-                return await q.edit_message_text("برای این واحد در این کمپین فایلی یافت نشد.")
-            await q.message.reply_document(InputFile(open(zippath, "rb"), filename=os.path.basename(zippath)))
-            return
+            unit_id, campaign_id = int(parts[4]), int(parts[5])
+            run = jobs.export_job(lambda on_progress, out_dir: _export_zip_unit_campaign(unit_id, campaign_id, on_progress, out_dir),
+                                  "برای این واحد در این کمپین فایلی یافت نشد.")
+            return await jobs.submit_for_callback(q, context, jobs.EXPORT, "export:unit_campaign", "خروجی ZIP واحد",
+                                                  run, in_place=True)
         if len(parts) >= 5 and parts[3] == "all":
             unit_id = int(parts[4])
-            zippath = await _export_zip_unit_all(unit_id)
-            if not zippath:
-                return await q.edit_message_text("برای این واحد فایلی یافت نشد.")
-            await q.message.reply_document(InputFile(open(zippath, "rb"), filename=os.path.basename(zippath)))
-            return
+            run = jobs.export_job(lambda on_progress, out_dir: _export_zip_unit_all(unit_id, on_progress, out_dir),
+                                  "برای این واحد فایلی یافت نشد.")
+            return await jobs.submit_for_callback(q, context, jobs.EXPORT, "export:unit_all",
+                                                  "خروجی ZIP همهٔ کمپین‌های واحد", run, in_place=True)
 
     # پیش‌فرض
-    await q.answer()
+    await safe_answer(q)
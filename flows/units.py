@@ -12,9 +12,13 @@ from telegram.ext import (
 )
 from sqlalchemy import select, func
 
-from database import SessionLocal
-from crud import is_admin, is_superadmin, get_primary_unit_for_admin
+from database import session_scope
+from crud import unit_subtree_ids
 from utils import now_iso
+from actor import get_actor, forget_actor
+from paging import KeysetPager, apply_page
+from cache import totals
+from search import FUZZY_MIN_CHARS, normalize_fa, search_key_filter, unit_index
 from models import Unit, UnitAdmin, Admin
 from keyboards import sa_units_menu, adm_units_menu
 
@@ -56,12 +60,12 @@ TEXT_TYPE_LABELS = {
 
 
 # ---- Scope helpers ----
-async def _get_scope_info(session, user_id: int):
+async def _get_scope_info(session, user_id: int, context=None):
     """برمی‌گرداند: (is_super, scope_root_id, scope_root_type)"""
-    is_super = await is_superadmin(session, user_id)
-    if is_super:
+    actor = await get_actor(context, session, user_id)
+    if actor.is_super:
         return True, None, None
-    root_id = await get_primary_unit_for_admin(session, user_id)
+    root_id = actor.primary_unit_id
     if not root_id:
         return False, None, None
     ru = await session.get(Unit, root_id)
@@ -99,12 +103,17 @@ async def _unit_has_ancestor(session, unit: Unit, ancestor_id: int) -> bool:
         cur = await session.get(Unit, cur.parent_id)
     return False
 
+async def _unit_in_actor_scope(session, context, user_id: int, unit: Unit) -> bool:
+    """مثل _unit_has_ancestor با ریشهٔ دامنهٔ خود کاربر، ولی از محدودهٔ memo‌شدهٔ ActorContext."""
+    scope = await (await get_actor(context, session, user_id)).unit_scope(session)
+    return scope is None or unit.id in scope
+
 
 # -------------------- دستورات CLI --------------------
 async def unit_add_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         uid = update.effective_user.id
-        if not await is_admin(s, uid):
+        if not (await get_actor(context, s, uid)).is_admin:
             return await update.message.reply_text("⛔️ شما ادمین نیستید.")
 
         parts = (update.message.text or "").split(maxsplit=3)
@@ -118,7 +127,7 @@ async def unit_add_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parent_id = int(parts[3]) if len(parts) >= 4 and parts[3].isdigit() else None
 
         # محدودیت‌های دسترسی
-        is_super, scope_root_id, root_type = await _get_scope_info(s, uid)
+        is_super, scope_root_id, root_type = await _get_scope_info(s, uid, context)
         allowed_types = _allowed_types_for_user(is_super, root_type)
         if utype not in allowed_types:
             return await update.message.reply_text("⛔️ شما مجاز به ساخت این نوع واحد نیستید.")
@@ -135,7 +144,7 @@ async def unit_add_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if not p or p.type != expected_parent_type:
                 return await update.message.reply_text("parent_id معتبر نیست.")
             if not is_super and scope_root_id:
-                if not await _unit_has_ancestor(s, p, scope_root_id):
+                if not await _unit_in_actor_scope(s, context, uid, p):
                     return await update.message.reply_text("⛔️ والد انتخابی خارج از محدودهٔ دسترسی شماست.")
 
         u = Unit(name=name, type=utype, parent_id=parent_id, created_at=now_iso())
@@ -144,6 +153,7 @@ async def unit_add_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         s.add(UnitAdmin(unit_id=u.id, admin_id=uid, role="OWNER"))
         await s.commit()
+        forget_actor(context, uid)
 
         await update.message.reply_text(
             f"✅ واحد #{u.id} ({utype}) با نام «{name}» ایجاد شد" +
@@ -156,7 +166,7 @@ async def unit_list_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if context.args and len(context.args) >= 1 and str(context.args[0]).isdigit():
         parent_id = int(context.args[0])
 
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         if parent_id is not None:
             rows = (await s.execute(
                 select(Unit).where(Unit.parent_id == parent_id).order_by(Unit.type, Unit.name)
@@ -179,8 +189,8 @@ async def unit_list_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def unit_attach_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    async with SessionLocal() as s:
-        if not await is_admin(s, update.effective_user.id):
+    async with session_scope() as s:
+        if not (await get_actor(context, s, update.effective_user.id)).is_admin:
             return await update.message.reply_text("⛔️ شما ادمین نیستید.")
 
         parts = (update.message.text or "").split()
@@ -211,20 +221,21 @@ async def unit_attach_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
             s.add(UnitAdmin(unit_id=unit_id, admin_id=admin_id, role=role))
 
         await s.commit()
+        forget_actor(context, admin_id)
         await update.message.reply_text(f"✅ admin {admin_id} به واحد #{unit_id} با نقش {role} وصل شد.")
 
 
 # -------------------- ویزارد --------------------
 async def unit_wizard_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         uid = update.effective_user.id
-        if not await is_admin(s, uid):
+        if not (await get_actor(context, s, uid)).is_admin:
             if update.message:
                 return await update.message.reply_text("⛔️ شما ادمین نیستید.")
             elif update.callback_query:
                 return await update.callback_query.answer("⛔️ شما ادمین نیستید.", show_alert=True)
 
-        is_super, scope_root_id, root_type = await _get_scope_info(s, uid)
+        is_super, scope_root_id, root_type = await _get_scope_info(s, uid, context)
         if not is_super and not scope_root_id:
             msg = "برای شما واحد اصلی ثبت نشده. از سوپرادمین بخواهید شما را به یک واحد وصل کند."
             if update.message:
@@ -312,6 +323,7 @@ async def unit_wiz_receive_name(update: Update, context: ContextTypes.DEFAULT_TY
         edit=False,
         scope_root_id=context.user_data.get("uw_scope_root"),
         is_super=context.user_data.get("uw_is_super", False),
+        state=context.user_data,
     )
     return UNIT_WIZ_PARENT
 
@@ -340,7 +352,7 @@ async def unit_wiz_parent_router(update: Update, context: ContextTypes.DEFAULT_T
     # انتخاب والد
     if data.startswith("uw:pp:pick:"):
         parent_id = int(data.split(":")[3])
-        async with SessionLocal() as s:
+        async with session_scope() as s:
             p = await s.get(Unit, parent_id)
 
         if not p or p.type != parent_type:
@@ -350,19 +362,20 @@ async def unit_wiz_parent_router(update: Update, context: ContextTypes.DEFAULT_T
                 parent_type=parent_type, page=page, q=qtext, sort_key=sort_key, edit=True,
                 scope_root_id=context.user_data.get("uw_scope_root"),
                 is_super=context.user_data.get("uw_is_super", False),
+                state=context.user_data,
             )
             return UNIT_WIZ_PARENT
 
         # ✅ این‌جاست: محدودیت محدوده
         scope_root_id = context.user_data.get("uw_scope_root")
         is_super = context.user_data.get("uw_is_super", False)
-        async with SessionLocal() as s2:
-            if not is_super and scope_root_id and not await _unit_has_ancestor(s2, p, scope_root_id):
+        async with session_scope() as s2:
+            if not is_super and scope_root_id and not await _unit_in_actor_scope(s2, context, q.from_user.id, p):
                 await q.edit_message_text("⛔️ این والد خارج از محدودهٔ دسترسی شماست.")
                 await _pp_render_parent_list(
                     q.message,
                     parent_type=parent_type, page=page, q=qtext, sort_key=sort_key, edit=True,
-                    scope_root_id=scope_root_id, is_super=is_super
+                    scope_root_id=scope_root_id, is_super=is_super, state=context.user_data,
                 )
                 return UNIT_WIZ_PARENT
 
@@ -398,6 +411,7 @@ async def unit_wiz_parent_router(update: Update, context: ContextTypes.DEFAULT_T
             parent_type=parent_type, page=page, q=qtext, sort_key=sort_key, edit=True,
             scope_root_id=context.user_data.get("uw_scope_root"),
             is_super=context.user_data.get("uw_is_super", False),
+            state=context.user_data,
         )
         return UNIT_WIZ_PARENT
 
@@ -411,6 +425,7 @@ async def unit_wiz_parent_router(update: Update, context: ContextTypes.DEFAULT_T
             parent_type=parent_type, page=0, q=qtext, sort_key=sort_key, edit=True,
             scope_root_id=context.user_data.get("uw_scope_root"),
             is_super=context.user_data.get("uw_is_super", False),
+            state=context.user_data,
         )
         return UNIT_WIZ_PARENT
 
@@ -434,6 +449,7 @@ async def unit_wiz_parent_search_input(update: Update, context: ContextTypes.DEF
         edit=False,
         scope_root_id=context.user_data.get("uw_scope_root"),
         is_super=context.user_data.get("uw_is_super", False),
+        state=context.user_data,
     )
     return UNIT_WIZ_PARENT
 
@@ -441,16 +457,14 @@ async def unit_wiz_parent_search_input(update: Update, context: ContextTypes.DEF
 async def _fetch_parents_page(session, parent_type: str, page: int, q: str | None):
     query = select(Unit).where(Unit.type == parent_type)
     if q:
-        like = f"%{q}%"
-        query = query.where(func.lower(Unit.name).like(func.lower(like)))
+        query = query.where(search_key_filter(Unit.search_key, q))
     query = query.order_by(Unit.name).limit(PAGE_SIZE).offset(page * PAGE_SIZE)
     rows = (await session.execute(query)).scalars().all()
 
     # شمارش کل برای ساخت دکمه‌های صفحه‌بندی
     count_q = select(func.count()).select_from(Unit).where(Unit.type == parent_type)
     if q:
-        like = f"%{q}%"
-        count_q = count_q.where(func.lower(Unit.name).like(func.lower(like)))
+        count_q = count_q.where(search_key_filter(Unit.search_key, q))
     total = (await session.execute(count_q)).scalar_one()
 
     return rows, total
@@ -491,8 +505,8 @@ async def unit_wiz_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # اعتبارسنجی نهایی سلسله‌مراتب + محدوده
     expected_parent_type = PARENT_ALLOWED.get(utype)
 
-    async with SessionLocal() as s:
-        is_super, scope_root_id, root_type = await _get_scope_info(s, q.from_user.id)
+    async with session_scope() as s:
+        is_super, scope_root_id, root_type = await _get_scope_info(s, q.from_user.id, context)
         allowed_types = _allowed_types_for_user(is_super, root_type)
         if utype not in allowed_types:
             await q.edit_message_text("⛔️ شما مجاز به ساخت این نوع واحد نیستید.")
@@ -510,7 +524,7 @@ async def unit_wiz_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if not p or p.type != expected_parent_type:
                 await q.edit_message_text("❗️ نوع والد انتخابی معتبر نیست. دوباره تلاش کنید.")
                 return ConversationHandler.END
-            if not is_super and scope_root_id and not await _unit_has_ancestor(s, p, scope_root_id):
+            if not is_super and scope_root_id and not await _unit_in_actor_scope(s, context, q.from_user.id, p):
                 await q.edit_message_text("⛔️ والد انتخابی خارج از محدودهٔ شماست.")
                 return ConversationHandler.END
 
@@ -519,6 +533,7 @@ async def unit_wiz_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await s.flush()
         s.add(UnitAdmin(unit_id=u.id, admin_id=q.from_user.id, role="OWNER"))
         await s.commit()
+        forget_actor(context, q.from_user.id)
 
     await q.edit_message_text(f"✅ واحد #{u.id} ({UNIT_TYPE_LABELS.get(utype, utype)}) با نام «{name}» ساخته شد.")
     return ConversationHandler.END
@@ -576,13 +591,13 @@ def _pp_next_sort(cur: str) -> str:
     except ValueError:
         return "name_asc"
 
-def _pp_order_clause(sort_key: str):
-    # از sqlalchemy import func
+def _pp_order(sort_key: str):
+    # id به‌عنوان ستون آخر تا ترتیب یکتا باشد (لازمهٔ cursor)
     if sort_key == "name_desc":
-        return Unit.name.desc()
+        return [(Unit.name, True), (Unit.id, True)]
     if sort_key == "new":
-        return Unit.id.desc()
-    return Unit.name.asc()
+        return [(Unit.id, True)]
+    return [(Unit.name, False), (Unit.id, False)]
 
 async def _pp_counts_for_units(session, unit_ids: list[int]) -> tuple[dict[int,int], dict[int,int]]:
     """
@@ -614,24 +629,23 @@ async def _pp_counts_for_units(session, unit_ids: list[int]) -> tuple[dict[int,i
 
     return child_counts, admin_counts
 
-async def _pp_fetch_parents_page(session, parent_type: str, page: int, q: str | None, sort_key: str):
+async def _pp_fetch_parents_page(session, parent_type: str, page: int, q: str | None, sort_key: str,
+                                 pager: KeysetPager | None = None):
     """
     لیست والدهای مجاز (فقط نوع parent_type)، با جستجو و مرتب‌سازی و صفحه‌بندی.
     """
     base = select(Unit).where(Unit.type == parent_type)
     if q:
-        like = f"%{q}%"
-        base = base.where(func.lower(Unit.name).like(func.lower(like)))
+        base = base.where(search_key_filter(Unit.search_key, q))
 
-    total = (await session.execute(
-        select(func.count()).select_from(base.subquery())
-    )).scalar_one()
+    total = await totals.count(session, base)
 
+    order = _pp_order(sort_key)
     rows = (await session.execute(
-        base.order_by(_pp_order_clause(sort_key))
-            .limit(PP_PAGE_SIZE)
-            .offset(page * PP_PAGE_SIZE)
+        apply_page(base, order, page=page, size=PP_PAGE_SIZE, cursor=pager.cursor(page) if pager else None)
     )).scalars().all()
+    if pager:
+        pager.remember(page, rows, order)
 
     # شمارنده‌ها
     ids = [u.id for u in rows]
@@ -674,22 +688,34 @@ async def _pp_render_parent_list(
     edit: bool,
     scope_root_id: int | None = None,
     is_super: bool = False,
+    state: dict | None = None,
 ):
     """
     رندر صفحه‌ی انتخاب والد با احترام به محدوده‌ی ادمین.
+    state: user_data برای نگه‌داری cursor صفحه‌ها (بدون آن OFFSET).
     """
-    async with SessionLocal() as s:
-        if not is_super and scope_root_id:
+    pager = None
+    if state is not None:
+        pager = KeysetPager(state, "pp_ks", (parent_type, q, sort_key, scope_root_id, is_super))
+
+    # عبارت خیلی کوتاه: LIKE روی search_key (زیررشتهٔ وسط کلمه را هم پیدا می‌کند)
+    fuzzy = bool(q) and unit_index.ready and len(normalize_fa(q)) >= FUZZY_MIN_CHARS
+    async with session_scope() as s:
+        if fuzzy:
+            rows, total, child_map, admin_map = await _pp_fuzzy_parents_page(
+                s, parent_type, page, q, None if is_super else scope_root_id
+            )
+        elif not is_super and scope_root_id:
             rows, total, child_map, admin_map = await _pp_fetch_parents_page_scoped(
-                s, parent_type, page, q, sort_key, scope_root_id
+                s, parent_type, page, q, sort_key, scope_root_id, pager=pager
             )
         else:
             rows, total, child_map, admin_map = await _pp_fetch_parents_page(
-                s, parent_type, page, q, sort_key
+                s, parent_type, page, q, sort_key, pager=pager
             )
 
     header = f"انتخاب والد (نوع مجاز: {parent_type}) | نتایج: {total}"
-    meta = f"مرتب‌سازی: {sort_key} | صفحه: {page+1}/{max(1,(total+PP_PAGE_SIZE-1)//PP_PAGE_SIZE)}"
+    meta = f"مرتب‌سازی: {'شباهت' if fuzzy else sort_key} | صفحه: {page+1}/{max(1,(total+PP_PAGE_SIZE-1)//PP_PAGE_SIZE)}"
     if q:
         meta += f' | جستجو: "{q}"'
 
@@ -713,31 +739,40 @@ async def _pp_render_parent_list(
 
 
 
-async def _pp_fetch_parents_page_scoped(session, parent_type: str, page: int, q: str | None, sort_key: str, scope_root_id: int):
+async def _pp_fetch_parents_page_scoped(session, parent_type: str, page: int, q: str | None, sort_key: str,
+                                        scope_root_id: int, pager: KeysetPager | None = None):
     """
     مثل _pp_fetch_parents_page اما والدها را به محدودهٔ scope محدود می‌کند.
-    برای سادگی، همه را می‌خوانیم و در پایتون فیلتر می‌کنیم (عمق درخت کم است).
+    محدوده با CTE بازگشتی در خود SQL اعمال می‌شود تا شمارش و صفحه‌بندی هم در DB بماند.
     """
-    base = select(Unit).where(Unit.type == parent_type)
+    base = select(Unit).where(Unit.type == parent_type, Unit.id.in_(unit_subtree_ids(scope_root_id)))
     if q:
-        like = f"%{q}%"
-        base = base.where(func.lower(Unit.name).like(func.lower(like)))
-
-    all_rows = (await session.execute(base.order_by(_pp_order_clause(sort_key)))).scalars().all()
+        base = base.where(search_key_filter(Unit.search_key, q))
 
-    scoped = []
-    for u in all_rows:
-        if await _unit_has_ancestor(session, u, scope_root_id):
-            scoped.append(u)
+    total = await totals.count(session, base)
 
-    total = len(scoped)
-    rows = scoped[page * PP_PAGE_SIZE: (page + 1) * PP_PAGE_SIZE]
+    order = _pp_order(sort_key)
+    rows = (await session.execute(
+        apply_page(base, order, page=page, size=PP_PAGE_SIZE, cursor=pager.cursor(page) if pager else None)
+    )).scalars().all()
+    if pager:
+        pager.remember(page, rows, order)
 
     ids = [u.id for u in rows]
     child_map, admin_map = await _pp_counts_for_units(session, ids)
     return rows, total, child_map, admin_map
 
 
+async def _pp_fuzzy_parents_page(session, parent_type: str, page: int, q: str, scope_root_id: int | None):
+    """
+    جستجوی فازی والد از ایندکس trigram در حافظه (غلط تایپی هم پیدا می‌شود)؛ مرتب بر اساس شباهت.
+    فقط شمارنده‌های صفحهٔ جاری از DB خوانده می‌شوند.
+    """
+    hits = unit_index.search(q, utype=parent_type, scope_root=scope_root_id, limit=None)
+    rows = hits[page * PP_PAGE_SIZE: (page + 1) * PP_PAGE_SIZE]
+    child_map, admin_map = await _pp_counts_for_units(session, [u.id for u in rows])
+    return rows, len(hits), child_map, admin_map
+
 # ===================== Browse (Read-Only Unit List) =====================
 
 # State های گفتگو (از 100 شروع می‌کنیم تا با ویزارد ساخت تداخل نکند)
@@ -762,7 +797,7 @@ CHILD_TYPE_OF = {
 BROWSE_PAGE_SIZE = 8  # اندازه صفحه در مرور فقط-نمایش
 
 async def _ul_fetch_page(session, *, parent_id: int | None, page: int, q: str | None,
-                         type_filter: str, sort_key: str):
+                         type_filter: str, sort_key: str, pager: KeysetPager | None = None):
     # تعیین نوع فرزند بر مبنای مکان فعلی در درخت
     if parent_id is None:
         parent_type = None
@@ -804,16 +839,16 @@ async def _ul_fetch_page(session, *, parent_id: int | None, page: int, q: str |
     # ---------------------------------------------------
 
     if q:
-        like = f"%{q}%"
-        base = base.where(func.lower(Unit.name).like(func.lower(like)))
+        base = base.where(search_key_filter(Unit.search_key, q))
 
-    total = (await session.execute(select(func.count()).select_from(base.subquery()))).scalar_one()
+    total = await totals.count(session, base)
 
+    order = _ul_order(sort_key)
     rows = (await session.execute(
-        base.order_by(_ul_order_clause(sort_key))
-            .limit(UL_PAGE_SIZE)
-            .offset(page * UL_PAGE_SIZE)
+        apply_page(base, order, page=page, size=UL_PAGE_SIZE, cursor=pager.cursor(page) if pager else None)
     )).scalars().all()
+    if pager:
+        pager.remember(page, rows, order)
 
     ids = [u.id for u in rows]
     child_map, admin_map = await _ul_counts_for_units(session, ids)
@@ -883,11 +918,12 @@ async def _render_unit_list(target_message, context: ContextTypes.DEFAULT_TYPE,
                             parent_id: int | None, page: int, q: str | None,
                             sort_key: str, type_filter: str, edit: bool):
     scope_root = context.user_data.get("ul_scope_root")  # None=سوپر، عدد=ادمین
+    pager = KeysetPager(context.user_data, "ul_ks", (parent_id, q, type_filter, sort_key))
 
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         rows, total, child_map, admin_map = await _ul_fetch_page(
             s, parent_id=parent_id, page=page, q=q,
-            type_filter=type_filter, sort_key=sort_key
+            type_filter=type_filter, sort_key=sort_key, pager=pager
         )
         breadcrumb = await _build_breadcrumb(s, parent_id, scope_root)
 
@@ -927,18 +963,19 @@ async def _render_unit_list(target_message, context: ContextTypes.DEFAULT_TYPE,
     else:    await target_message.reply_text(text, reply_markup=kb)
 
 async def ul_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         uid = update.effective_user.id
-        if not await is_admin(s, uid):
+        actor = await get_actor(context, s, uid)
+        if not actor.is_admin:
             if update.message:
                 return await update.message.reply_text("⛔️ شما ادمین نیستید.")
             elif update.callback_query:
                 return await update.callback_query.answer("⛔️ شما ادمین نیستید.", show_alert=True)
 
-        is_super = await is_superadmin(s, uid)
+        is_super = actor.is_super
         root_id = None
         if not is_super:
-            root_id = await get_primary_unit_for_admin(s, uid)
+            root_id = actor.primary_unit_id
             if not root_id:
                 # اگر واحد اصلی ندارد، یک پیام راهنما بده
                 msg = "برای شما واحد اصلی ثبت نشده. از سوپرادمین بخواهید شما را به یک واحد وصل کند."
@@ -997,8 +1034,8 @@ async def ul_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # دکمهٔ بازگشت به منوی اصلیِ نقش
     if data == "ul:back":
-        async with SessionLocal() as s:
-            if await is_superadmin(s, qobj.from_user.id):
+        async with session_scope() as s:
+            if (await get_actor(context, s, qobj.from_user.id)).is_super:
                 return await qobj.edit_message_text("مدیریت واحدها:", reply_markup=sa_units_menu())
             else:
                 return await qobj.edit_message_text("مدیریت واحدها:", reply_markup=adm_units_menu())
@@ -1120,12 +1157,12 @@ def _ul_next_sort(cur: str) -> str:
     except ValueError:
         return "name_asc"
 
-def _ul_order_clause(sort_key: str):
+def _ul_order(sort_key: str):
     if sort_key == "name_desc":
-        return Unit.name.desc()
+        return [(Unit.name, True), (Unit.id, True)]
     if sort_key == "new":
-        return Unit.id.desc()
-    return Unit.name.asc()
+        return [(Unit.id, True)]
+    return [(Unit.name, False), (Unit.id, False)]
 
 def _type_label_no_emoji(t: str) -> str:
     return TEXT_TYPE_LABELS.get(t, t)
@@ -1216,8 +1253,8 @@ def _ua_init_ctx(context: ContextTypes.DEFAULT_TYPE):
 # ---------- Entry ----------
 async def ua_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # کنترل دسترسی
-    async with SessionLocal() as s:
-        if not await is_admin(s, update.effective_user.id):
+    async with session_scope() as s:
+        if not (await get_actor(context, s, update.effective_user.id)).is_admin:
             if update.message:
                 return await update.message.reply_text("⛔️ شما ادمین نیستید.")
             elif update.callback_query:
@@ -1282,15 +1319,17 @@ async def _ua_render_unit_tree(target_message, context: ContextTypes.DEFAULT_TYP
     page = int(ctx.get("unit_page", 0))
     q = ctx.get("unit_q")
     sort_key = ctx.get("unit_sort", "name_asc")
+    pager = KeysetPager(ctx, "unit_ks", ("tree", parent_id, q, sort_key))
 
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         rows, total, child_map, admin_map = await _ul_fetch_page(
             s,
             parent_id=parent_id,
             page=page,
             q=q,
             type_filter="ALL",  # درخت بر اساس CHILD_TYPE_OF حرکت می‌کند
-            sort_key=sort_key
+            sort_key=sort_key,
+            pager=pager,
         )
         breadcrumb = await _build_breadcrumb(s, parent_id)
 
@@ -1355,15 +1394,17 @@ async def _ua_render_unit_list(target_message, context: ContextTypes.DEFAULT_TYP
     q = ctx.get("unit_q")
     sort_key = ctx.get("unit_sort", "name_asc")
     type_filter = ctx.get("unit_type", "ALL")
+    pager = KeysetPager(ctx, "unit_ks", ("list", parent_id, q, type_filter, sort_key))
 
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         rows, total, child_map, admin_map = await _ul_fetch_page(
             s,
             parent_id=parent_id,
             page=page,
             q=q,
             type_filter=type_filter,
-            sort_key=sort_key
+            sort_key=sort_key,
+            pager=pager,
         )
         breadcrumb = await _build_breadcrumb(s, parent_id)
 
@@ -1492,7 +1533,7 @@ async def ua_unit_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if data.startswith("ua:pick_unit:"):
         uid = int(data.split(":")[2])
         # بررسی صحت واحد
-        async with SessionLocal() as s:
+        async with session_scope() as s:
             u = await s.get(Unit, uid)
             if not u:
                 await q.answer("واحد پیدا نشد.", show_alert=True)
@@ -1514,7 +1555,8 @@ async def ua_unit_search_input(update: Update, context: ContextTypes.DEFAULT_TYP
 # ---------- انتخاب ادمین ----------
 # لیست ادمین‌ها + ورودی شناسه + فوروارد پیام
 
-async def _ua_fetch_admins_page(session, *, page: int, q: str | None, sort_key: str):
+async def _ua_fetch_admins_page(session, *, page: int, q: str | None, sort_key: str,
+                                pager: KeysetPager | None = None):
     """
     sort_key: "new" (admin_id DESC) | "id_asc" | "id_desc"
     q: اگر رقم بود و طول >= 3 → فیلتر برابر/یا like ساده
@@ -1525,20 +1567,16 @@ async def _ua_fetch_admins_page(session, *, page: int, q: str | None, sort_key:
         # جستجوی دقیق (می‌تونی خواستی like کنی، ولی برای int بهتره دقیق)
         base = base.where(Admin.admin_id == int(q))
 
-    # مرتب‌سازی
-    if sort_key == "id_asc":
-        base = base.order_by(Admin.admin_id.asc())
-    elif sort_key == "id_desc":
-        base = base.order_by(Admin.admin_id.desc())
-    else:
-        # new
-        base = base.order_by(Admin.admin_id.desc())
+    # مرتب‌سازی (new و id_desc هر دو admin_id نزولی)
+    order = [(Admin.admin_id, sort_key != "id_asc")]
 
-    total = (await session.execute(select(func.count()).select_from(base.subquery()))).scalar_one()
+    total = await totals.count(session, base)
 
     rows = (await session.execute(
-        base.limit(UL_PAGE_SIZE).offset(page * UL_PAGE_SIZE)
+        apply_page(base, order, page=page, size=UL_PAGE_SIZE, cursor=pager.cursor(page) if pager else None)
     )).scalars().all()
+    if pager:
+        pager.remember(page, rows, order)
 
     # شمارنده: چند واحد متصل
     # select admin_id, count(*) from UnitAdmin group by admin_id
@@ -1560,13 +1598,14 @@ async def _ua_render_admin_picker(target_message, context: ContextTypes.DEFAULT_
     # خلاصه انتخاب واحد
     unit_line = "واحد: —"
     if ctx.get("selected_unit_id"):
-        async with SessionLocal() as s:
+        async with session_scope() as s:
             u = await s.get(Unit, ctx["selected_unit_id"])
             if u:
                 unit_line = f"واحد: #{u.id} | {_type_label_no_emoji(u.type)} {u.name}"
 
-    async with SessionLocal() as s:
-        rows, total, ua_counts = await _ua_fetch_admins_page(s, page=page, q=q, sort_key=sort_key)
+    pager = KeysetPager(ctx, "admin_ks", (q, sort_key))
+    async with session_scope() as s:
+        rows, total, ua_counts = await _ua_fetch_admins_page(s, page=page, q=q, sort_key=sort_key, pager=pager)
 
     header = f"انتخاب ادمین — نتایج: {total}"
     if q: header += f' | جستجو: "{q}"'
@@ -1676,11 +1715,12 @@ async def ua_admin_search_input(update: Update, context: ContextTypes.DEFAULT_TY
         return UA_ADMIN_SEARCH
 
     # اگر Admin وجود ندارد، ثبت اولیه کنیم (نقش سیستمی پیش‌فرض: L1)
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         adm = await s.get(Admin, aid)
         if not adm:
             s.add(Admin(admin_id=aid, role="L1"))
             await s.commit()
+            forget_actor(context, aid)
 
     ctx["selected_admin_id"] = aid
     return await _ua_render_role_picker(update.message, context, edit=False)
@@ -1696,7 +1736,7 @@ async def _ua_render_role_picker(target_message, context: ContextTypes.DEFAULT_T
         return await _ua_render_unit_picker(target_message, context, edit=edit)
 
     # خلاصه‌ها
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         u = await s.get(Unit, uid)
     unit_line = f"واحد: #{u.id} | {_type_label_no_emoji(u.type)} {u.name}" if u else f"واحد: #{uid}"
 
@@ -1748,12 +1788,12 @@ async def _ua_render_confirm(target_message, context: ContextTypes.DEFAULT_TYPE,
     role = ctx.get("role", "ASSISTANT")
 
     # اطلاعات واحد برای نمایش
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         u = await s.get(Unit, uid)
     unit_line = f"واحد: #{u.id} | {_type_label_no_emoji(u.type)} {u.name}" if u else f"واحد: #{uid}"
 
     # آیا اتصال موجود است؟
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         existing = await s.get(UnitAdmin, {"unit_id": uid, "admin_id": aid})
     exists_text = "⚠️ اتصال موجود است؛ با تأیید، نقش به‌روزرسانی می‌شود." if existing else "اتصال جدید ثبت می‌شود."
 
@@ -1786,7 +1826,7 @@ async def ua_confirm_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await q.edit_message_text("❌ عملیات لغو شد.")
         return ConversationHandler.END
     if data == "ua:save":
-        async with SessionLocal() as s:
+        async with session_scope() as s:
             u = await s.get(Unit, uid)
             if not u:
                 await q.edit_message_text("❗️ واحد در دسترس نیست. دوباره تلاش کنید.")
@@ -1803,6 +1843,7 @@ async def ua_confirm_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
             else:
                 s.add(UnitAdmin(unit_id=uid, admin_id=aid, role=role))
             await s.commit()
+            forget_actor(context, aid)
 
         await q.edit_message_text(f"✅ اتصال انجام شد: ادمین #{aid} → واحد #{uid} با نقش {role}")
         return ConversationHandler.END
@@ -1908,8 +1949,8 @@ def build_unit_admins_manager_conversation():
 
 async def uam_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # دسترسی: هر ادمینی که به هر نحو اجازه دارد (فعلاً همان is_admin)
-    async with SessionLocal() as s:
-        if not await is_admin(s, update.effective_user.id):
+    async with session_scope() as s:
+        if not (await get_actor(context, s, update.effective_user.id)).is_admin:
             if update.message:
                 return await update.message.reply_text("⛔️ شما ادمین نیستید.")
             else:
@@ -1955,10 +1996,11 @@ async def _uam_render_unit_picker(target_message, context: ContextTypes.DEFAULT_
     ctx = context.user_data["uam"]
     parent_id = ctx["unit_parent"]; page = ctx["unit_page"]
     q = ctx["unit_q"]; sort_key = ctx["unit_sort"]; type_filter = ctx["unit_type"]
+    pager = KeysetPager(ctx, "unit_ks", (parent_id, q, type_filter, sort_key))
 
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         rows, total, child_map, admin_map = await _ul_fetch_page(
-            s, parent_id=parent_id, page=page, q=q, type_filter=type_filter, sort_key=sort_key
+            s, parent_id=parent_id, page=page, q=q, type_filter=type_filter, sort_key=sort_key, pager=pager
         )
         breadcrumb = await _build_breadcrumb(s, parent_id)
 
@@ -2041,7 +2083,7 @@ async def uam_unit_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if data.startswith("uam:pick_unit:"):
         uid = int(data.split(":")[2])
-        async with SessionLocal() as s:
+        async with session_scope() as s:
             if not await s.get(Unit, uid):
                 await q.answer("واحد پیدا نشد.", show_alert=True); return UAM_PICK_UNIT
         ctx["selected_unit_id"]=uid; ctx["list_page"]=0
@@ -2058,7 +2100,7 @@ async def uam_unit_search_input(update: Update, context: ContextTypes.DEFAULT_TY
 
 async def _uam_fetch_admins_for_unit(session, unit_id: int, *, page: int):
     base = select(UnitAdmin).where(UnitAdmin.unit_id == unit_id)
-    total = (await session.execute(select(func.count()).select_from(base.subquery()))).scalar_one()
+    total = await totals.count(session, base)
     rows = (await session.execute(
         base.order_by(UnitAdmin.role.desc(), UnitAdmin.admin_id.asc())
             .limit(UAM_PAGE_SIZE).offset(page * UAM_PAGE_SIZE)
@@ -2078,7 +2120,7 @@ async def _uam_fetch_admins_for_unit(session, unit_id: int, *, page: int):
 async def _uam_render_admins(target_message, context: ContextTypes.DEFAULT_TYPE, *, edit: bool):
     ctx = context.user_data["uam"]; uid = ctx["selected_unit_id"]; page = ctx["list_page"]
 
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         rows, total, owners_count, u = await _uam_fetch_admins_for_unit(s, uid, page=page)
 
     header = f"👤 ادمین‌های واحد #{uid} | {TEXT_TYPE_LABELS.get(u.type,u.type)} {u.name}\nنتایج: {total}"
@@ -2178,7 +2220,7 @@ async def uam_confirm_router(update: Update, context: ContextTypes.DEFAULT_TYPE)
     _, _, kind, uid_s, aid_s, role = data.split(":")
     uid = int(uid_s); aid = int(aid_s)
 
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         # شمارش OWNERها (برای محافظت)
         owners_count = (await s.execute(
             select(func.count()).select_from(UnitAdmin).where(UnitAdmin.unit_id==uid, UnitAdmin.role=="OWNER")
@@ -2195,6 +2237,7 @@ async def uam_confirm_router(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 await q.edit_message_text("⛔️ نمی‌توان آخرین OWNER را حذف کرد. ابتدا یک OWNER دیگر تعیین کنید.")
                 return ConversationHandler.END
             await s.delete(ua); await s.commit()
+            forget_actor(context, aid)
             await q.edit_message_text(f"✅ ادمین #{aid} از واحد #{uid} حذف شد.")
             return ConversationHandler.END
 
@@ -2205,6 +2248,7 @@ async def uam_confirm_router(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 return ConversationHandler.END
             ua.role = new_role
             await s.commit()
+            forget_actor(context, aid)
             await q.edit_message_text(f"✅ نقش ادمین #{aid} در واحد #{uid} به «{new_role}» تغییر کرد.")
             return ConversationHandler.END
 
@@ -2228,11 +2272,12 @@ async def uam_add_admin_input(update: Update, context: ContextTypes.DEFAULT_TYPE
         return UAM_ADD_ADMIN
 
     # اگر Admin نبود، بساز
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         adm = await s.get(Admin, aid)
         if not adm:
             s.add(Admin(admin_id=aid, role="L1"))
             await s.commit()
+            forget_actor(context, aid)
 
     ctx["adding_admin_id"] = aid
 
@@ -2281,7 +2326,7 @@ async def uam_add_confirm_router(update: Update, context: ContextTypes.DEFAULT_T
 
     if q.data == "uam:add:confirm":
         uid = ctx["selected_unit_id"]; aid = ctx["adding_admin_id"]; role = ctx.get("adding_role","ASSISTANT")
-        async with SessionLocal() as s:
+        async with session_scope() as s:
             u = await s.get(Unit, uid)
             if not u:
                 await q.edit_message_text("❗️واحد نامعتبر است."); return ConversationHandler.END
@@ -2291,6 +2336,7 @@ async def uam_add_confirm_router(update: Update, context: ContextTypes.DEFAULT_T
             else:
                 s.add(UnitAdmin(unit_id=uid, admin_id=aid, role=role))
             await s.commit()
+            forget_actor(context, aid)
         await q.edit_message_text(f"✅ ادمین #{aid} با نقش {role} به واحد #{uid} متصل شد.")
         return ConversationHandler.END
 
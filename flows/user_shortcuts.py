@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
-import os, zipfile, pathlib
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile
+import asyncio, os, zipfile, pathlib
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CallbackQueryHandler, CommandHandler
-from database import SessionLocal
+import jobs
+from database import session_scope
+from metrics import export_timer
 from crud import list_campaigns_for_user, get_campaign, stats_for_user_campaign, get_user_admin
 from keyboards import PLATFORM_LABEL
+from utils import safe_answer
 
 DATA_DIR = pathlib.Path("storage").absolute()
 
@@ -20,7 +23,7 @@ def user_campaigns_keyboard(campaigns, purpose: str) -> InlineKeyboardMarkup:
 
 async def mystats_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         camps = await list_campaigns_for_user(s, uid, active_only=False)
     if not camps:
         return await update.effective_message.reply_text("هیچ کمپینی برای شما یافت نشد.")
@@ -29,7 +32,7 @@ async def mystats_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def myexport_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         camps = await list_campaigns_for_user(s, uid, active_only=False)
     if not camps:
         return await update.effective_message.reply_text("هیچ کمپینی برای شما یافت نشد.")
@@ -37,10 +40,11 @@ async def myexport_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
                                               reply_markup=user_campaigns_keyboard(camps, "uexport"))
 
 async def user_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query; data = q.data
+    q = update.callback_query; data = q.data  # یک answer در هر شاخه (خروجی: submit_for_callback)
     uid = q.from_user.id
-    async with SessionLocal() as s:
+    async with session_scope() as s:
         if data.startswith("ustats:"):
+            await safe_answer(q)
             cid = int(data.split(":")[1])
             camp = await get_campaign(s, cid)
             if not camp or (await get_user_admin(s, uid)) != camp.admin_id:
@@ -56,13 +60,16 @@ async def user_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
             cid = int(data.split(":")[1])
             camp = await get_campaign(s, cid)
             if not camp or (await get_user_admin(s, uid)) != camp.admin_id:
+                await safe_answer(q)
                 return await q.edit_message_text("اجازه ندارید.")
-    zippath = await export_zip_user(cid, uid)
-    if not zippath:
-        return await q.edit_message_text("برای این کمپین فایلی از شما یافت نشد.")
-    await q.message.reply_document(InputFile(open(zippath, 'rb'), filename=os.path.basename(zippath)))
+    run = jobs.export_job(lambda on_progress, out_dir: export_zip_user(cid, uid, out_dir), "برای این کمپین فایلی از شما یافت نشد.")
+    await jobs.submit_for_callback(q, context, jobs.EXPORT, "export:user", f"خروجی ZIP کمپین #{cid}", run, in_place=True)
 
-async def export_zip_user(campaign_id: int, user_id: int):
+@export_timer("user")
+async def export_zip_user(campaign_id: int, user_id: int, out_dir=DATA_DIR):
+    return await asyncio.to_thread(_build_user_zip, campaign_id, user_id, out_dir)
+
+def _build_user_zip(campaign_id: int, user_id: int, out_dir=DATA_DIR):
     base = DATA_DIR / f"campaign_{campaign_id}"
     if not base.exists(): return None
     files = []
@@ -72,7 +79,7 @@ async def export_zip_user(campaign_id: int, user_id: int):
             if len(parts) >= 3 and parts[1] == f"user_{user_id}":
                 platform = parts[0]; files.append((str(file), platform))
     if not files: return None
-    zip_name = DATA_DIR / f"campaign_{campaign_id}_user_{user_id}.zip"
+    zip_name = pathlib.Path(out_dir) / f"campaign_{campaign_id}_user_{user_id}.zip"
     if zip_name.exists(): zip_name.unlink()
     with zipfile.ZipFile(zip_name, 'w', zipfile.ZIP_DEFLATED) as zf:
         for file_path, platform in files:
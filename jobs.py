@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+کارهای سنگین پس‌زمینه (خروجی ZIP، آمار بزرگ) با صف اولویت‌دار.
+
+handler فقط درخواست را ثبت می‌کند (submit) و برمی‌گردد؛ اجرای کار روی workerهای همین loop است.
+- سه کلاس اولویت: INTERACTIVE > STATS > EXPORT. هر کلاس pool محدود خودش را دارد
+  (JOBS_INTERACTIVE_WORKERS، JOBS_STATS_WORKERS، JOBS_EXPORT_WORKERS)؛ workerِ کلاس سنگین‌تر اگر
+  بیکار باشد کارهای سبک‌ترِ منتظر را هم برمی‌دارد، اما برعکس نه — پس چند خروجی بزرگ هیچ‌وقت همهٔ
+  workerها را نمی‌گیرند.
+- انصاف: داخل هر کلاس، صف به‌ازای درخواست‌کننده است و نوبت دوره‌ای (round-robin) می‌چرخد؛ هر نفر حداکثر
+  JOBS_MAX_PER_REQUESTER کار منتظر/در حال اجرا دارد و درخواست تکراری (همان key) دوباره ثبت نمی‌شود.
+- پیشرفت: اگر کار باید منتظر بماند پیام «در صف» می‌آید؛ Job.progress همان پیام را (با فاصلهٔ حداقل
+  JOBS_PROGRESS_SECONDS) ویرایش می‌کند و نتیجه را خود تابع کار می‌فرستد.
+
+کارها بیرون از آپدیت اجرا می‌شوند، پس هر session_scope داخلشان session تازهٔ خودش را دارد.
+"""
+from __future__ import annotations
+import asyncio
+import logging
+import os
+import pathlib
+import shutil
+import tempfile
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+from telegram import InputFile
+from telegram.error import TelegramError
+
+import querystats
+from database import _env_int
+from metrics import Counter, Gauge, Histogram
+from utils import safe_answer
+
+log = logging.getLogger(__name__)
+
+INTERACTIVE, STATS, EXPORT = 0, 1, 2
+CLASS_NAMES = {INTERACTIVE: "interactive", STATS: "stats", EXPORT: "export"}
+WORKERS = {
+    INTERACTIVE: _env_int("JOBS_INTERACTIVE_WORKERS", 4),
+    STATS: _env_int("JOBS_STATS_WORKERS", 2),
+    EXPORT: _env_int("JOBS_EXPORT_WORKERS", 1),
+}
+MAX_PER_REQUESTER = _env_int("JOBS_MAX_PER_REQUESTER", 3)
+PROGRESS_SECONDS = _env_int("JOBS_PROGRESS_SECONDS", 3)
+# پوشهٔ موقت هر کار خروجی زیر این مسیر ساخته و بعد از ارسال پاک می‌شود
+SCRATCH_DIR = pathlib.Path(os.getenv("JOBS_SCRATCH_DIR", "storage/.jobs")).absolute()
+
+queue_depth = Gauge("bot_jobs_queued", "Background jobs waiting, by priority class", ("priority",))
+jobs_running = Gauge("bot_jobs_running", "Background jobs running, by priority class", ("priority",))
+job_wait_seconds = Histogram("bot_job_wait_seconds", "Time from submit to start", ("kind",),
+                             buckets=(0.01, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+job_run_seconds = Histogram("bot_job_run_seconds", "Background job run time", ("kind",),
+                            buckets=(0.05, 0.25, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+job_failures = Counter("bot_job_failures_total", "Background jobs that raised", ("kind",))
+
+
+@dataclass(eq=False)
+class Job:
+    kind: str                                   # برچسب متریک/لاگ، مثلاً export:campaign
+    priority: int
+    requester: int                              # کاربر تلگرام؛ واحد انصاف و سقف
+    chat_id: int
+    run: Callable[["Job"], Awaitable[Any]]      # نتیجه را خودش می‌فرستد؛ متن برگشتی ← پیام وضعیت
+    key: Any = None                             # درخواست‌های هم‌key ـِ یک نفر یکی می‌شوند
+    title: str = ""
+    message_id: Optional[int] = None            # پیام وضعیت (مثلاً همان پیام دکمه‌ها)؛ None = در صورت نیاز ساخته می‌شود
+    bot: Any = field(default=None, repr=False)
+    submitted: float = field(default_factory=time.monotonic)
+    _last_progress: float = field(default=0.0, repr=False)
+    _status_sent: bool = field(default=False, repr=False)  # پیام وضعیت را خودِ Job فرستاده
+
+    async def progress(self, text: str, *, force: bool = False, **kwargs):
+        """ویرایش/ارسال پیام وضعیت؛ بدون force حداکثر هر PROGRESS_SECONDS یک بار."""
+        now = time.monotonic()
+        if not force and now - self._last_progress < PROGRESS_SECONDS:
+            return
+        self._last_progress = now
+        try:
+            if self.message_id is None:
+                msg = await self.bot.send_message(self.chat_id, text, **kwargs)
+                self.message_id, self._status_sent = msg.message_id, True
+            else:
+                await self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.message_id, **kwargs)
+        except TelegramError:
+            pass  # «message is not modified» و مشابه؛ پیشرفت حیاتی نیست
+
+    async def send_file(self, path: str, **kwargs):
+        with open(path, "rb") as f:
+            await self.bot.send_document(self.chat_id, InputFile(f, filename=os.path.basename(path)), **kwargs)
+
+
+@dataclass
+class Submitted:
+    job: Job
+    created: bool        # False: همین کار از قبل در صف/اجرا بود
+    position: int = 0    # تعداد کارهای جلوتر در همین کلاس
+    rejected: bool = False  # سقف JOBS_MAX_PER_REQUESTER
+
+
+class JobManager:
+    def __init__(self, workers: dict[int, int] = WORKERS):
+        self.workers = workers
+        self._pending: dict[int, OrderedDict[int, deque[Job]]] = {p: OrderedDict() for p in workers}
+        self._running: set[Job] = set()
+        self._idle: dict[int, int] = {p: 0 for p in workers}
+        self._cond: Optional[asyncio.Condition] = None
+        self._tasks: list[asyncio.Task] = []
+        self._bot = None
+
+    # --- وضعیت ---
+    def _queued(self, p: int) -> int:
+        return sum(len(dq) for dq in self._pending[p].values())
+
+    def _owned(self, requester: int) -> list[Job]:
+        out = [j for j in self._running if j.requester == requester]
+        for per in self._pending.values():
+            out.extend(per.get(requester, ()))
+        return out
+
+    def stats(self) -> dict:
+        return {CLASS_NAMES[p]: f"{self._queued(p)} queued / "
+                                f"{sum(j.priority == p for j in self._running)} running / {n} workers"
+                for p, n in self.workers.items()}
+
+    # --- ثبت ---
+    async def submit(self, job: Job) -> Submitted:
+        owned = self._owned(job.requester)
+        if job.key is not None:
+            for other in owned:
+                if other.key == job.key:
+                    return Submitted(other, created=False)
+        if len(owned) >= MAX_PER_REQUESTER:
+            return Submitted(job, created=False, rejected=True)
+
+        job.bot = job.bot or self._bot
+        if self._cond is None:  # workerها راه نیفتاده‌اند (اسکریپت بدون on_startup): همین‌جا اجرا شود
+            self._running.add(job)
+            await self._execute(job)
+            return Submitted(job, created=True)
+
+        position = self._queued(job.priority)
+        idle = sum(n for p, n in self._idle.items() if p >= job.priority)
+        self._pending[job.priority].setdefault(job.requester, deque()).append(job)
+        queue_depth.inc(CLASS_NAMES[job.priority])
+        async with self._cond:
+            self._cond.notify_all()
+        if position >= idle:
+            await job.progress(f"⏳ {job.title or 'درخواست'} در صف است (نفر {position + 1}).", force=True)
+        return Submitted(job, created=True, position=position)
+
+    # --- workerها ---
+    def _take(self, own: int) -> Optional[Job]:
+        """کلاس‌های هم‌اولویت یا سبک‌تر از own، به ترتیب اولویت؛ داخل کلاس نوبت دوره‌ای بین درخواست‌کننده‌ها."""
+        for p in sorted(self._pending):
+            if p > own:
+                break
+            per = self._pending[p]
+            if not per:
+                continue
+            requester, dq = next(iter(per.items()))
+            job = dq.popleft()
+            if dq:
+                per.move_to_end(requester)
+            else:
+                del per[requester]
+            queue_depth.dec(CLASS_NAMES[p])
+            return job
+        return None
+
+    async def _worker(self, own: int):
+        while True:
+            async with self._cond:
+                self._idle[own] += 1
+                try:
+                    await self._cond.wait_for(lambda: any(self._pending[p] for p in self._pending if p <= own))
+                finally:
+                    self._idle[own] -= 1
+                job = self._take(own)
+                if job is None:
+                    continue
+                self._running.add(job)  # داخل قفل، تا join بین برداشتن و شروع خالی نبیند
+            await self._execute(job)
+
+    async def _execute(self, job: Job):
+        cls = CLASS_NAMES[job.priority]
+        jobs_running.inc(cls)
+        job_wait_seconds.observe(time.monotonic() - job.submitted, job.kind)
+        t = time.perf_counter()
+        try:
+            with querystats.track(f"job:{job.kind}"):
+                result = await job.run(job)
+            if isinstance(result, str):
+                await job.progress(result, force=True)
+            elif job._status_sent:
+                await job.progress(f"✅ {job.title or 'درخواست'} انجام شد.", force=True)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            job_failures.inc(job.kind)
+            log.exception("job %s for %s failed", job.kind, job.requester)
+            await job.progress(f"❌ {job.title or 'درخواست'} انجام نشد؛ دوباره تلاش کنید.", force=True)
+        finally:
+            job_run_seconds.observe(time.perf_counter() - t, job.kind)
+            jobs_running.dec(cls)
+            self._running.discard(job)
+            if self._cond is not None:
+                async with self._cond:
+                    self._cond.notify_all()
+
+    def start(self, bot):
+        if self._tasks:
+            return
+        self._bot = bot
+        self._cond = asyncio.Condition()
+        for p, n in self.workers.items():
+            for i in range(n):
+                self._tasks.append(asyncio.get_running_loop().create_task(
+                    self._worker(p), name=f"jobs:{CLASS_NAMES[p]}:{i}"))
+
+    async def join(self):
+        """تا خالی شدن صف‌ها و پایان کارهای در حال اجرا صبر می‌کند (برای اسکریپت‌ها/بنچمارک‌ها)."""
+        if self._cond is None:
+            return
+        async with self._cond:
+            await self._cond.wait_for(lambda: not self._running and not any(self._pending.values()))
+
+    async def stop(self):
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        self._cond = None
+
+
+manager = JobManager()
+
+
+def _scratch_dir() -> str:
+    SCRATCH_DIR.mkdir(parents=True, exist_ok=True)
+    return tempfile.mkdtemp(prefix="export_", dir=SCRATCH_DIR)
+
+def export_job(build, empty_text: str):
+    """
+    تابع Job برای خروجی ZIP: build(on_progress, out_dir) فایل ZIP را داخل out_dir می‌سازد و مسیرش
+    (یا None) را برمی‌گرداند و می‌تواند on_progress(تعداد فایل) را صدا بزند؛ پیام وضعیت در طول ساخت
+    به‌روز و بعد فایل فرستاده می‌شود. out_dir مال همین کار است (دو خروجی هم‌زمان از یک واحد/کمپین
+    فایل هم را پاک یا بازنویسی نمی‌کنند) و در پایان، موفق یا ناموفق، پاک می‌شود.
+    """
+    async def run(job: Job):
+        await job.progress(f"⚙️ {job.title}: در حال ساخت…", force=True)
+        out_dir = await asyncio.to_thread(_scratch_dir)
+        try:
+            zippath = await build(lambda n: job.progress(f"⚙️ {job.title}: {n} فایل…"), out_dir)
+            if not zippath:
+                return empty_text
+            await job.send_file(zippath)
+        finally:
+            await asyncio.to_thread(shutil.rmtree, out_dir, True)
+        return f"✅ {job.title} ارسال شد."
+    return run
+
+async def submit_for_callback(q, context, priority: int, kind: str, title: str, run, *, in_place: bool = False):
+    """
+    کارِ یک دکمه را در صف می‌گذارد و callback را همین‌جا یک بار answer می‌کند. in_place: پیام وضعیت
+    همان پیام دکمه‌هاست (ویرایش می‌شود)؛ وگرنه در صورت نیاز پیام تازه.
+    """
+    res = await submit(Job(
+        kind=kind, priority=priority, requester=q.from_user.id, chat_id=q.message.chat_id, run=run,
+        key=q.data, title=title, message_id=q.message.message_id if in_place else None, bot=context.bot,
+    ))
+    if res.rejected:
+        return await safe_answer(q, "⏳ چند درخواست دیگر از شما در صف است؛ کمی بعد دوباره امتحان کنید.", show_alert=True)
+    await safe_answer(q, None if res.created else "این درخواست در صف است.")
+    return res
+
+async def submit(job: Job) -> Submitted:
+    return await manager.submit(job)
+
+def start(app):
+    manager.start(app.bot)
+
+async def stop(app=None):
+    await manager.stop()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+نگهبان تأخیر event loop: کار همگامی که loop را قفل می‌کند (نوشتن zipfile، rglob، open/mkdir روی
+دیسک کند، …) همهٔ کاربرها را معطل می‌کند و جایی خطا نمی‌دهد.
+
+یک task روی loop هر LOOP_LAG_INTERVAL_MS می‌خوابد و دیرکردِ بیدار شدنش (lag) را در متریک
+bot_event_loop_lag_seconds ثبت می‌کند؛ هم‌زمان یک thread جدا ضربان آن task را می‌پاید و اگر
+بیش از LOOP_LAG_WARN_MS عقب بیفتد، stack همان لحظهٔ thread ـِ loop را برمی‌دارد — یعنی خودِ کد
+مسدودکننده، نه جایی که loop بعداً به آن برگشت. وقتی loop آزاد شد یک رویداد JSON (lag، task،
+اولین frame پروژه و stack) log می‌شود و bot_event_loop_blocked_total{site} یکی بالا می‌رود.
+
+LOOP_WATCH=0 خاموشش می‌کند.
+"""
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Optional
+
+from database import _env_int
+from metrics import Counter, Histogram
+
+log = logging.getLogger(__name__)
+
+ENABLED = os.getenv("LOOP_WATCH", "1") != "0"
+INTERVAL = _env_int("LOOP_LAG_INTERVAL_MS", 50) / 1000
+THRESHOLD = _env_int("LOOP_LAG_WARN_MS", 150) / 1000
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+_OWN_FILE = os.path.abspath(__file__)
+
+lag_seconds = Histogram("bot_event_loop_lag_seconds", "Event loop scheduling lag",
+                        buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+blocked_total = Counter("bot_event_loop_blocked_total", "Event loop stalls over LOOP_LAG_WARN_MS by first project frame",
+                        ("site",))
+
+
+def _project_frame(stack: traceback.StackSummary) -> Optional[traceback.FrameSummary]:
+    """داخلی‌ترین frame ـِ کد خود ربات (نه کتابخانه‌ها/venv)."""
+    for fs in reversed(stack):
+        path = os.path.abspath(fs.filename)
+        if (path.startswith(PROJECT_ROOT) and path != _OWN_FILE
+                and "site-packages" not in path and os.sep + "venv" + os.sep not in path):
+            return fs
+    return None
+
+
+class LoopWatch:
+    def __init__(self, threshold: float = THRESHOLD, interval: float = INTERVAL):
+        self.threshold, self.interval = threshold, interval
+        self.events: deque = deque(maxlen=50)
+        self._beat = 0.0              # زمانی که task آخرین بار به خواب رفت
+        self._seq = 0                 # شمارهٔ ضربان؛ برای جفت کردن stack با همان خواب
+        self._captured: Optional[tuple[int, traceback.StackSummary, str]] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread = 0
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+
+    # --- سمت loop ---
+    async def _tick(self):
+        while True:
+            self._seq += 1
+            seq = self._seq
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - self._beat - self.interval)
+            lag_seconds.observe(lag)
+            if lag >= self.threshold:
+                captured, self._captured = self._captured, None
+                if captured is not None and captured[0] != seq:
+                    captured = None
+                self._emit(lag, captured)
+
+    def _emit(self, lag: float, captured):
+        stack, task = (captured[1], captured[2]) if captured else (None, "")
+        top = _project_frame(stack) if stack else None
+        site = f"{os.path.relpath(top.filename, PROJECT_ROOT)}:{top.lineno} {top.name}" if top else "(unknown)"
+        blocked_total.inc(site)
+        event = {
+            "event": "loop_blocked", "lag_ms": round(lag * 1000, 1), "site": site, "task": task,
+            "stack": [f"{os.path.relpath(f.filename, PROJECT_ROOT) if f.filename.startswith(PROJECT_ROOT) else f.filename}"
+                      f":{f.lineno} {f.name}" for f in (stack or [])][-15:],
+        }
+        self.events.append((time.time(), event))
+        log.warning("event loop blocked %s", json.dumps(event, ensure_ascii=False))
+
+    # --- سمت thread نگهبان ---
+    def _sample(self):
+        while not self._stop.wait(self.threshold / 4):
+            seq, beat = self._seq, self._beat
+            if not beat or time.monotonic() - beat - self.interval < self.threshold:
+                continue
+            if self._captured is not None and self._captured[0] == seq:
+                continue  # همین توقف قبلاً ثبت شده
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            # فقط از callback ـِ loop به داخل (frameهای runner/run_forever چیزی نمی‌گویند)
+            runs = [i for i, fs in enumerate(stack) if fs.name == "_run" and fs.filename.endswith(os.path.join("asyncio", "events.py"))]
+            if runs:
+                stack = traceback.StackSummary.from_list(stack[runs[-1] + 1:])
+            try:
+                task = asyncio.current_task(self._loop)
+                name = task.get_name() if task else ""
+            except RuntimeError:
+                name = ""
+            if seq == self._seq:  # loop در این فاصله راه نیفتاده
+                self._captured = (seq, stack, name)
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._stop.clear()
+        self._task = self._loop.create_task(self._tick(), name="loopwatch")
+        threading.Thread(target=self._sample, name="loopwatch", daemon=True).start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+watch = LoopWatch()
+
+def start():
+    """روی loop جاری (داخل post_init ـِ PTB)."""
+    if ENABLED:
+        watch.start()
+
+async def stop(app=None):
+    await watch.stop()
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""
+متریک‌های کارایی ربات با فرمت متنی Prometheus روی یک endpoint محلی ‎/metrics.
+
+- bot_handler_seconds{handler,pattern}      تأخیر هر handler (instrument_handlers همهٔ handlerها را می‌پیچد)
+- bot_handler_errors_total{handler,pattern}
+- bot_update_db_seconds / bot_update_queries{handler}   زمان و تعداد کوئری هر آپدیت (از querystats)
+- bot_telegram_api_seconds{method}          زمان فراخوانی‌های Bot API (MetricsRequest)
+- bot_telegram_api_errors_total{method,error}   RetryAfter (flood، یعنی retry)، TimedOut، NetworkError، …
+- bot_export_seconds / bot_export_bytes{kind}   ساخت ZIPها (export_timer)
+- bot_downloads_in_flight، bot_download_seconds   دانلود عکس‌های گزارش
+- bot_update_queue_depth                    آپدیت‌های منتظر در update_queue ـِ Application
+
+سرور فقط وقتی METRICS_PORT ست شده بالا می‌آید (METRICS_HOST پیش‌فرض 127.0.0.1). کتابخانهٔ
+prometheus_client لازم نیست؛ نوع‌ها همین‌جا با حداقلِ لازم پیاده شده‌اند.
+"""
+from __future__ import annotations
+import functools
+import inspect
+import itertools
+import logging
+import os
+import time
+from typing import Callable, Optional
+
+from telegram.error import RetryAfter, TelegramError
+from telegram.ext import CallbackQueryHandler, CommandHandler, ConversationHandler
+from telegram.request import HTTPXRequest
+
+import querystats
+
+log = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = tuple(2 ** p for p in range(16, 32, 2))  # 64KiB … 1GiB
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _num(v: float) -> str:
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labels: tuple[str, ...] = ()):
+        self.name, self.doc, self.label_names = name, doc, labels
+        _registry.append(self)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *a, **kw):
+        super().__init__(*a, **kw)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        return [f"{self.name}{_labels(self.label_names, k)} {_num(v)}" for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    """مقدار لحظه‌ای؛ با fn هنگام scrape محاسبه می‌شود."""
+    kind = "gauge"
+
+    def __init__(self, *a, fn: Optional[Callable[[], float]] = None, **kw):
+        super().__init__(*a, **kw)
+        self._values: dict[tuple, float] = {}
+        self.fn = fn
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def render(self) -> list[str]:
+        if self.fn is not None:
+            try:
+                return [f"{self.name} {_num(self.fn())}"]
+            except Exception:
+                return []
+        return [f"{self.name}{_labels(self.label_names, k)} {_num(v)}" for k, v in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *a, buckets: tuple = LATENCY_BUCKETS, **kw):
+        super().__init__(*a, **kw)
+        self.buckets = tuple(sorted(buckets))
+        self._values: dict[tuple, list] = {}  # labels → [شمار هر bucket…, sum, count]
+
+    def observe(self, value: float, *labels):
+        row = self._values.get(labels)
+        if row is None:
+            row = self._values[labels] = [0] * (len(self.buckets) + 2)
+        for i, le in enumerate(self.buckets):
+            if value <= le:
+                row[i] += 1
+        row[-2] += value
+        row[-1] += 1
+
+    def render(self) -> list[str]:
+        out = []
+        les = [f'le="{_num(le)}"' for le in self.buckets] + ['le="+Inf"']
+        for k, row in self._values.items():
+            for le, n in zip(les, [*row[:-2], row[-1]]):
+                out.append(f"{self.name}_bucket{_labels(self.label_names, k, le)} {n}")
+            out.append(f"{self.name}_sum{_labels(self.label_names, k)} {_num(row[-2])}")
+            out.append(f"{self.name}_count{_labels(self.label_names, k)} {row[-1]}")
+        return out
+
+
+_registry: list[_Metric] = []
+
+def render() -> str:
+    lines = []
+    for m in _registry:
+        body = m.render()
+        if body:
+            lines += m.header() + body
+    return "\n".join(lines) + "\n"
+
+
+handler_seconds = Histogram("bot_handler_seconds", "Handler callback latency", ("handler", "pattern"))
+handler_errors = Counter("bot_handler_errors_total", "Handler callbacks that raised", ("handler", "pattern"))
+update_db_seconds = Histogram("bot_update_db_seconds", "DB time per update", ("handler",))
+update_queries = Histogram("bot_update_queries", "SQL statements per update", ("handler",), buckets=COUNT_BUCKETS)
+api_seconds = Histogram("bot_telegram_api_seconds", "Bot API request latency", ("method",))
+api_errors = Counter("bot_telegram_api_errors_total", "Failed Bot API requests (RetryAfter = flood wait/retry)",
+                     ("method", "error"))
+export_seconds = Histogram("bot_export_seconds", "ZIP export build time", ("kind",), buckets=LATENCY_BUCKETS + (60, 120))
+export_bytes = Histogram("bot_export_bytes", "ZIP export size", ("kind",), buckets=SIZE_BUCKETS)
+downloads_in_flight = Gauge("bot_downloads_in_flight", "Report photo downloads in progress")
+download_seconds = Histogram("bot_download_seconds", "Report photo download time")
+update_queue_depth = Gauge("bot_update_queue_depth", "Updates waiting in Application.update_queue")
+
+
+# ---------- handlerها ----------
+def _pattern(h) -> str:
+    if isinstance(h, CommandHandler):
+        return " ".join(f"/{c}" for c in sorted(h.commands))
+    if isinstance(h, CallbackQueryHandler) and h.pattern is not None:
+        return getattr(h.pattern, "pattern", str(h.pattern))
+    return type(h).__name__
+
+def instrument_handlers(app):
+    """
+    callback هر handler (و handlerهای داخل ConversationHandler) را می‌پیچد: تأخیر/خطا در متریک‌ها و
+    نام handler روی رکورد querystats آپدیت جاری.
+    """
+    def wrap(h):
+        cb = h.callback
+        if getattr(cb, "__instrumented__", False):
+            return
+        name = getattr(cb, "__qualname__", repr(cb))
+        pattern = _pattern(h)
+
+        @functools.wraps(cb)
+        async def instrumented(update, context):
+            rec = querystats.current()
+            if rec is not None:
+                rec.handlers.append(name)
+            t = time.perf_counter()
+            try:
+                return await cb(update, context)
+            except Exception:
+                handler_errors.inc(name, pattern)
+                raise
+            finally:
+                handler_seconds.observe(time.perf_counter() - t, name, pattern)
+        instrumented.__instrumented__ = True
+        h.callback = instrumented
+
+    def walk(h):
+        if isinstance(h, ConversationHandler):
+            for inner in (*h.entry_points, *itertools.chain.from_iterable(h.states.values()), *h.fallbacks):
+                walk(inner)
+        elif inspect.iscoroutinefunction(getattr(h, "callback", None)):
+            wrap(h)
+
+    for group in app.handlers.values():
+        for h in group:
+            walk(h)
+
+
+def _observe_update(rec: querystats.UpdateQueries):
+    update_db_seconds.observe(rec.db_ms / 1000, rec.name)
+    update_queries.observe(rec.count, rec.name)
+
+querystats.on_finish.append(_observe_update)
+
+
+# ---------- Bot API ----------
+class MetricsRequest(HTTPXRequest):
+    """HTTPXRequest که زمان و خطای هر متد Bot API (و دانلود فایل با متد «file») را ثبت می‌کند."""
+
+    async def _timed(self, method: str, call):
+        t = time.perf_counter()
+        try:
+            return await call
+        except RetryAfter:
+            api_errors.inc(method, "RetryAfter")
+            raise
+        except TelegramError as e:
+            api_errors.inc(method, type(e).__name__)
+            raise
+        finally:
+            api_seconds.observe(time.perf_counter() - t, method)
+
+    async def post(self, url, request_data=None, *args, **kwargs):
+        return await self._timed(url.rsplit("/", 1)[-1], super().post(url, request_data, *args, **kwargs))
+
+    async def retrieve(self, url, *args, **kwargs):
+        return await self._timed("file", super().retrieve(url, *args, **kwargs))
+
+
+# ---------- خروجی‌ها و دانلودها ----------
+def export_timer(kind: str):
+    """برای تابع async ـی که مسیر ZIP ساخته‌شده (یا None) برمی‌گرداند."""
+    def deco(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            t = time.perf_counter()
+            path = await fn(*args, **kwargs)
+            export_seconds.observe(time.perf_counter() - t, kind)
+            if path:
+                try:
+                    export_bytes.observe(os.path.getsize(path), kind)
+                except OSError:
+                    pass
+            return path
+        return wrapper
+    return deco
+
+async def timed_download(tg_file, path):
+    downloads_in_flight.inc()
+    t = time.perf_counter()
+    try:
+        return await tg_file.download_to_drive(path)
+    finally:
+        downloads_in_flight.dec()
+        download_seconds.observe(time.perf_counter() - t)
+
+
+# ---------- سرور HTTP ----------
+_runner = None
+
+async def start_server(app) -> None:
+    """endpoint ‎/metrics را (اگر METRICS_PORT ست شده) روی loop خودِ PTB بالا می‌آورد."""
+    global _runner
+    port = os.getenv("METRICS_PORT", "").strip()
+    if not port or _runner is not None:
+        return
+    from aiohttp import web
+
+    update_queue_depth.fn = app.update_queue.qsize
+
+    async def handle(_request):
+        return web.Response(body=render().encode(),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    web_app = web.Application()
+    web_app.router.add_get("/metrics", handle)
+    _runner = web.AppRunner(web_app, access_log=None)
+    await _runner.setup()
+    host = os.getenv("METRICS_HOST", "127.0.0.1")
+    await web.TCPSite(_runner, host, int(port)).start()
+    log.info("metrics on http://%s:%s/metrics", host, port)
+
+async def stop_server(app=None) -> None:
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Unit of work برای هر آپدیت تلگرام.
+
+UpdateSessionApplication هر آپدیت را داخل یک UnitOfWork پردازش می‌کند: اولین
+`async with session_scope()` یک AsyncSession می‌سازد و بقیهٔ handlerها/helperهای همان آپدیت
+همان را می‌گیرند (یک اتصال، یک identity map). فقط commitهای صریح handlerها ماندگارند؛
+آخر آپدیت هر چیز commit‌نشده rollback و session بسته می‌شود (مثل قبل که هر session با بسته شدن
+تغییرات commit‌نشده‌اش را دور می‌ریخت).
+
+handlerهای block=False در task جدا اجرا می‌شوند و ممکن است بعد از پایان آپدیت کار کنند؛
+برای همین هر کدام UnitOfWork خودش را می‌گیرد.
+
+کوئری‌های هر آپدیت (و taskهای block=False آن) با querystats شمرده می‌شوند.
+"""
+from __future__ import annotations
+import inspect
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from telegram.ext import Application
+
+import querystats
+from database import SessionLocal, update_session
+
+
+class UnitOfWork:
+    def __init__(self):
+        self._session: Optional[AsyncSession] = None
+
+    @property
+    def session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = SessionLocal()
+        return self._session
+
+    async def finish(self):
+        s = self._session
+        if s is None:
+            return
+        self._session = None
+        try:
+            # هر چه handler صریحاً commit نکرده (مثلاً گزارش flush‌شده در مسیر return زودهنگام) دور ریخته
+            # می‌شود؛ تراکنش خواندنی هم همین‌جا بسته می‌شود
+            await s.rollback()
+        finally:
+            await s.close()
+
+
+async def _in_own_unit_of_work(coroutine, queries=None):
+    uow = UnitOfWork()
+    token = update_session.set(uow)
+    try:
+        return await coroutine
+    finally:
+        update_session.reset(token)
+        await uow.finish()
+        querystats.release(queries)
+
+
+def _describe(update) -> str:
+    """callback data یا دستور آپدیت (متن آزاد/نام‌ها نه) برای slow-query log."""
+    q = getattr(update, "callback_query", None)
+    if q is not None:
+        return f"cb:{q.data}"
+    msg = getattr(update, "effective_message", None)
+    if msg is None:
+        return type(update).__name__
+    if msg.text and msg.text.startswith("/"):
+        return msg.text.split()[0][:64]
+    if msg.photo:
+        return "<photo>"
+    return "<text>" if msg.text else "<message>"
+
+
+class UpdateSessionApplication(Application):
+    """Application با یک session برای هر آپدیت؛ با ApplicationBuilder().application_class(...)"""
+
+    async def process_update(self, update: object) -> None:
+        with querystats.track(data=_describe(update)):
+            uow = UnitOfWork()
+            token = update_session.set(uow)
+            try:
+                await super().process_update(update)
+            finally:
+                update_session.reset(token)
+                await uow.finish()
+
+    def create_task(self, coroutine, update=None, *, name=None):
+        if update_session.get() is not None and inspect.iscoroutine(coroutine):
+            coroutine = _in_own_unit_of_work(coroutine, querystats.retain())
+        return super().create_task(coroutine, update=update, name=name)
@@ -3,8 +3,10 @@ from __future__ import annotations
 from sqlalchemy import (
     Integer, BigInteger, String, Text, Boolean, ForeignKey, UniqueConstraint, Index
 )
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import DDL, event, inspect
+from sqlalchemy.orm import Mapped, Session, mapped_column, object_session, relationship
 from database import Base
+from search import FTS_COLUMNS, campaign_tsvector, normalize_fa, sync_campaign_fts, unit_index
 
 class Campaign(Base):
     __tablename__ = "campaigns"
@@ -13,7 +15,11 @@ class Campaign(Base):
     hashtag: Mapped[str | None] = mapped_column(String(255))
     city: Mapped[str | None] = mapped_column(String(255))
     platforms: Mapped[str] = mapped_column(Text, nullable=False)  # JSON list (string)
+    # همان پلتفرم‌ها به‌صورت بیت‌ماسک (crud.PLATFORM_BITS) برای فیلتر و نمایش بدون json.loads
+    platforms_mask: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
     description: Mapped[str | None] = mapped_column(Text)
+    # نام/شهر/هشتگ/توضیحات نرمال‌شده (search.normalize_fa)؛ خودکار در before_insert/update
+    search_key: Mapped[str | None] = mapped_column(Text)
     active: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True)
 
     # این‌ها به آیدی‌های تلگرام/ادمین مربوط می‌شوند → BigInteger
@@ -86,6 +92,7 @@ class User(Base):
     admin_id: Mapped[int] = mapped_column(BigInteger, nullable=False, index=True)
 
     display_name: Mapped[str | None] = mapped_column(String(255))
+    search_key: Mapped[str | None] = mapped_column(String(255))  # display_name نرمال‌شده
     city_id: Mapped[int | None] = mapped_column(Integer)
     unit_id_paygah: Mapped[int | None] = mapped_column(Integer)
 
@@ -117,6 +124,7 @@ class Unit(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     name: Mapped[str] = mapped_column(String(255), nullable=False)
     type: Mapped[str] = mapped_column(String(16), nullable=False)  # COUNTRY|OSTAN|SHAHR|HOZE|PAYGAH
+    search_key: Mapped[str | None] = mapped_column(String(255))  # name نرمال‌شده
     parent_id: Mapped[int | None] = mapped_column(Integer, index=True)
     created_at: Mapped[str] = mapped_column(String(50), nullable=False)
     __table_args__ = (Index("idx_units_parent", "parent_id"),)
@@ -140,3 +148,114 @@ class CampaignCopy(Base):
     copied_by_admin_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
 
     copied_at: Mapped[str] = mapped_column(String(50), nullable=False)
+
+
+# ---------- ایندکس‌های ترکیبی کوئری‌های پرتکرار ----------
+# هر کدام دقیقاً شرط/ترتیب یک کوئری crud/flows را پوشش می‌دهد (scripts/bench_indexes.py)
+
+HOT_INDEXES = (
+    # campaigns_owned_by_units: unit_id_owner IN (...) [AND active] ORDER BY id DESC
+    Index("ix_campaigns_unit_active_id", Campaign.unit_id_owner, Campaign.active, Campaign.id.desc()),
+    # list_campaigns_for_admin / list_campaigns_for_user: admin_id IN (خوشهٔ ادمین) [AND active] ORDER BY id DESC
+    Index("ix_campaigns_admin_active_id", Campaign.admin_id, Campaign.active, Campaign.id.desc()),
+    # services.copy_campaign_one_level / submit_report_up: نسخهٔ همان root روی واحد مقصد
+    Index("ix_campaigns_root_unit", Campaign.root_campaign_id, Campaign.unit_id_owner),
+    # stats_for_unit_campaign / stats_by_unit_platform / آمار واحد
+    Index("ix_reports_campaign_unit", Report.campaign_id, Report.unit_id_owner),
+    # get_or_create_open_report: گزارش باز همین کاربر/کمپین/پلتفرم/شهر
+    Index("ix_reports_user_campaign_platform_city", Report.user_id, Report.campaign_id, Report.platform, Report.city_id),
+    # چک فایل تکراری در report.py
+    Index("ix_report_items_report_file", ReportItem.report_id, ReportItem.file_name),
+    # انتخاب والد / لیست واحدها: WHERE type ORDER BY name، و child_units: WHERE parent_id, type ORDER BY name
+    Index("ix_units_type_name", Unit.type, Unit.name),
+    Index("ix_units_parent_type_name", Unit.parent_id, Unit.type, Unit.name),
+)
+
+
+# ---------- کلید جستجو (search_key) ----------
+
+def _campaign_search_text(c: Campaign) -> str:
+    return " ".join(x for x in (c.name, c.city, c.hashtag, c.description) if x)
+
+_SEARCH_KEY_SOURCES = {
+    Unit: lambda u: u.name,
+    Campaign: _campaign_search_text,
+    User: lambda u: u.display_name,
+}
+
+def _set_search_key(mapper, connection, target):
+    target.search_key = normalize_fa(_SEARCH_KEY_SOURCES[type(target)](target)) or None
+
+for _model in _SEARCH_KEY_SOURCES:
+    event.listen(_model, "before_insert", _set_search_key)
+    event.listen(_model, "before_update", _set_search_key)
+
+# PostgreSQL: LIKE '%q%' روی search_key با ایندکس trigram (B-tree به LIKE با % اول نمی‌خورد؛
+# روی SQLite این جستجوها scan هستند؛ انتخاب والد از search.unit_index در حافظه می‌خواند)
+event.listen(Base.metadata, "before_create",
+             DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"))
+for _table in (Unit.__table__, User.__table__):
+    Index(
+        f"ix_{_table.name}_search_key_trgm", _table.c.search_key,
+        postgresql_using="gin", postgresql_ops={"search_key": "gin_trgm_ops"},
+    ).ddl_if(dialect="postgresql")
+
+
+# ---------- جستجوی متنی کمپین‌ها (search.py) ----------
+
+# PostgreSQL: ایندکس GIN روی همان tsvector که کوئری جستجو می‌سازد
+Index(
+    "ix_campaigns_fts",
+    campaign_tsvector(Campaign.__table__.c.search_key),
+    postgresql_using="gin",
+).ddl_if(dialect="postgresql")
+
+def _campaign_fts_values(target: Campaign) -> dict:
+    return {c: getattr(target, c) for c in FTS_COLUMNS}
+
+# SQLite: جدول FTS5 با رویدادهای mapper همگام می‌ماند (همان connection و تراکنش flush)
+@event.listens_for(Campaign, "after_insert")
+def _campaign_fts_insert(mapper, connection, target):
+    sync_campaign_fts(connection, target.id, _campaign_fts_values(target))
+
+@event.listens_for(Campaign, "after_update")
+def _campaign_fts_update(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[c].history.has_changes() for c in FTS_COLUMNS):
+        sync_campaign_fts(connection, target.id, _campaign_fts_values(target))
+
+@event.listens_for(Campaign, "after_delete")
+def _campaign_fts_delete(mapper, connection, target):
+    sync_campaign_fts(connection, target.id, None)
+
+
+# ---------- ایندکس فازی نام واحدها (search.unit_index) ----------
+# تغییرات تا commit در session.info می‌مانند تا rollback ایندکس را خراب نکند
+
+def _queue_unit_index(target: Unit, op: str):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("_unit_index", []).append(
+            (op, target.id, target.name, target.type, target.parent_id)
+        )
+
+@event.listens_for(Unit, "after_insert")
+@event.listens_for(Unit, "after_update")
+def _unit_index_upsert(mapper, connection, target):
+    _queue_unit_index(target, "upsert")
+
+@event.listens_for(Unit, "after_delete")
+def _unit_index_remove(mapper, connection, target):
+    _queue_unit_index(target, "remove")
+
+@event.listens_for(Session, "after_commit")
+def _unit_index_apply(session):
+    for op, uid, name, utype, parent_id in session.info.pop("_unit_index", ()):
+        if op == "upsert":
+            unit_index.upsert(uid, name, utype, parent_id)
+        else:
+            unit_index.remove(uid)
+
+@event.listens_for(Session, "after_rollback")
+def _unit_index_discard(session):
+    session.info.pop("_unit_index", None)
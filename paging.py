@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+صفحه‌بندی کلیدی (keyset) برای لیست‌های دکمه‌ای.
+
+ترتیب هر لیست به‌صورت [(ستون, نزولی؟), ...] تعریف می‌شود و آخرین ستون باید یکتا باشد (مثلاً id).
+cursor هر صفحه (کلید آخرین ردیفِ صفحهٔ قبل) در state کاربر (user_data) نگه داشته می‌شود؛
+پس رفتن به صفحهٔ N به‌جای OFFSET فقط یک «WHERE کلید > cursor LIMIT n» است.
+اگر cursor صفحه‌ای در دست نباشد (مثلاً callback قدیمی) به OFFSET برمی‌گردیم.
+"""
+from __future__ import annotations
+from typing import Any, Optional, Sequence
+from sqlalchemy import and_, or_, literal
+
+OrderSpec = Sequence[tuple[Any, bool]]
+
+def order_clauses(order: OrderSpec) -> list:
+    return [col.desc() if desc else col.asc() for col, desc in order]
+
+def keyset_after(order: OrderSpec, cursor: Sequence):
+    """شرط «بعد از cursor» با رعایت جهت هر ستون."""
+    # مقدارها bind می‌شوند تا ستون‌های Boolean (active) هم با < و > مقایسه شوند
+    vals = [literal(v, col.type) for (col, _), v in zip(order, cursor)]
+    clauses = []
+    for i, (col, desc) in enumerate(order):
+        eqs = [c == v for (c, _), v in zip(order[:i], vals[:i])]
+        clauses.append(and_(*eqs, col < vals[i] if desc else col > vals[i]))
+    return or_(*clauses)
+
+def row_key(order: OrderSpec, row) -> list:
+    """کلید یک ردیف (entity یا Row شامل چند entity/ستون) برای ترتیب داده‌شده."""
+    ents = (row,) if hasattr(row, "__mapper__") else tuple(row)
+    key = []
+    for col, _ in order:
+        cls = getattr(col, "class_", None)
+        if cls is None:
+            # ستون محاسبه‌شده‌ای که خودش در select آمده (مثل rank جستجو)
+            key.append(row._mapping[col])
+            continue
+        ent = next(e for e in ents if isinstance(e, cls))
+        key.append(getattr(ent, col.key))
+    return key
+
+def apply_page(stmt, order: OrderSpec, *, page: int, size: int, cursor: Optional[Sequence] = None):
+    stmt = stmt.order_by(*order_clauses(order))
+    if cursor is not None:
+        return stmt.where(keyset_after(order, cursor)).limit(size)
+    return stmt.limit(size).offset(page * size)
+
+
+class KeysetPager:
+    """
+    cursorهای یک لیست را در state (dict کاربر) نگه می‌دارد.
+    signature = هر چیزی که نتیجه را عوض می‌کند (جستجو/فیلتر/مرتب‌سازی/والد)؛ اگر عوض شود cursorها دور ریخته می‌شوند.
+    """
+
+    def __init__(self, state: dict, name: str, signature):
+        sig = repr(signature)
+        ks = state.get(name)
+        if not ks or ks.get("sig") != sig:
+            ks = {"sig": sig, "after": {}}
+            state[name] = ks
+        self._after: dict[int, list] = ks["after"]
+
+    def cursor(self, page: int) -> Optional[list]:
+        if page <= 0:
+            return None
+        return self._after.get(page)
+
+    def remember(self, page: int, rows: Sequence, order: OrderSpec):
+        if rows:
+            self._after[page + 1] = row_key(order, rows[-1])
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+شمارش کوئری‌های SQL به‌ازای هر آپدیت تلگرام و تشخیص N+1.
+
+listenerهای before/after_cursor_execute روی engineها تعداد statementها و زمان DB را روی رکورد
+آپدیت جاری (ContextVar) می‌نویسند؛ handlerها (metrics.instrument_handlers) نام خودشان را روی
+همان رکورد ثبت می‌کنند. statementها به «شکل» (متن بدون فهرست پارامترهای IN) خلاصه می‌شوند؛ اگر یک شکل در یک
+آپدیت بیش از QUERY_REPEAT_WARN بار تکرار شود یعنی حلقه‌ای کوئری می‌زند (N+1).
+
+آخر هر آپدیت آمار به‌ازای handler جمع می‌شود و اگر از آستانه‌ها (QUERY_WARN_COUNT،
+QUERY_WARN_MS) رد شده باشد هشدار log می‌شود. /querystats خلاصه را به سوپرادمین نشان می‌دهد.
+QUERY_STATS=0 همه را خاموش می‌کند.
+"""
+from __future__ import annotations
+import logging
+import os
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+from sqlalchemy import event
+
+from database import _env_int, set_query_origin, statement_shape
+
+log = logging.getLogger(__name__)
+
+ENABLED = os.getenv("QUERY_STATS", "1") != "0"
+WARN_COUNT = _env_int("QUERY_WARN_COUNT", 30)
+WARN_MS = _env_int("QUERY_WARN_MS", 500)
+REPEAT_WARN = _env_int("QUERY_REPEAT_WARN", 5)
+
+
+class UpdateQueries:
+    """کوئری‌های یک آپدیت؛ taskهای block=False همان آپدیت هم روی همین رکورد می‌نویسند."""
+    __slots__ = ("label", "data", "handlers", "count", "db_ms", "shapes", "refs")
+
+    def __init__(self, label: str = "", data: str = ""):
+        self.label = label
+        self.data = data  # callback data / دستورِ آپدیت (برای slow-query log)
+        self.handlers: list[str] = []
+        self.count = 0
+        self.db_ms = 0.0
+        self.shapes: Counter = Counter()
+        self.refs = 0
+
+    @property
+    def name(self) -> str:
+        return "+".join(dict.fromkeys(self.handlers)) or self.label or "(no handler)"
+
+    def repeated(self) -> list[tuple[str, int]]:
+        return [(sh, n) for sh, n in self.shapes.most_common() if n > REPEAT_WARN]
+
+
+_current: ContextVar[Optional[UpdateQueries]] = ContextVar("update_queries", default=None)
+
+
+def current() -> Optional[UpdateQueries]:
+    return _current.get()
+
+def origin() -> dict:
+    """handler و دادهٔ آپدیت جاری برای database.set_query_origin (slow-query log)."""
+    rec = _current.get()
+    return {"handler": rec.name, "update": rec.data} if rec is not None else {}
+
+
+# ---------- listenerها ----------
+# زمان شروع روی execution context (مثل slow-query log ـِ database)؛ statement ناموفق چیزی جا نمی‌گذارد
+def _before(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _current.get() is not None:
+        context._querystats_t0 = time.perf_counter()
+
+def _after(conn, cursor, statement, parameters, context, executemany):
+    rec = _current.get()
+    if rec is None:
+        return
+    t0 = getattr(context, "_querystats_t0", None)
+    if t0 is not None:
+        rec.db_ms += (time.perf_counter() - t0) * 1000
+    rec.count += 1
+    rec.shapes[statement_shape(statement)] += 1
+
+def install(*engines):
+    """listenerها را (یک بار برای هر engine؛ engine خواندنی ممکن است همان اصلی باشد) وصل می‌کند."""
+    if not ENABLED:
+        return
+    set_query_origin(origin)
+    for e in {id(e.sync_engine): e for e in engines}.values():
+        if not event.contains(e.sync_engine, "before_cursor_execute", _before):
+            event.listen(e.sync_engine, "before_cursor_execute", _before)
+            event.listen(e.sync_engine, "after_cursor_execute", _after)
+
+
+# ---------- جمع‌بندی ----------
+class HandlerStats:
+    __slots__ = ("updates", "queries", "max_queries", "db_ms", "max_db_ms", "n_plus_one")
+
+    def __init__(self):
+        self.updates = self.queries = self.max_queries = self.n_plus_one = 0
+        self.db_ms = self.max_db_ms = 0.0
+
+    def add(self, rec: UpdateQueries, repeated: bool):
+        self.updates += 1
+        self.queries += rec.count
+        self.max_queries = max(self.max_queries, rec.count)
+        self.db_ms += rec.db_ms
+        self.max_db_ms = max(self.max_db_ms, rec.db_ms)
+        self.n_plus_one += repeated
+
+
+_by_handler: dict[str, HandlerStats] = {}
+_repeats: Counter = Counter()      # (handler, شکل) → تعداد آپدیت‌هایی که در آن‌ها تکرار شده
+_offenders: deque = deque(maxlen=20)  # آخرین آپدیت‌های بالای آستانه
+on_finish: list[Callable[[UpdateQueries], None]] = []  # مثلاً هیستوگرام‌های metrics
+
+def _finish(rec: UpdateQueries):
+    if not rec.count and not rec.handlers:
+        return
+    name = rec.name
+    repeated = rec.repeated()
+    _by_handler.setdefault(name, HandlerStats()).add(rec, bool(repeated))
+    for sh, _ in repeated:
+        _repeats[(name, sh)] += 1
+    for hook in on_finish:
+        hook(rec)
+
+    reasons = []
+    if rec.count > WARN_COUNT:
+        reasons.append(f"{rec.count} queries")
+    if rec.db_ms > WARN_MS:
+        reasons.append(f"{rec.db_ms:.0f}ms db")
+    if repeated:
+        reasons.append("N+1: " + "; ".join(f"{n}× {sh[:120]}" for sh, n in repeated[:3]))
+    if reasons:
+        _offenders.append((time.time(), name, rec.count, rec.db_ms, reasons))
+        log.warning("update %s: %s", name, " | ".join(reasons))
+
+
+@contextmanager
+def track(label: str = "", data: str = ""):
+    """
+    رکورد کوئری‌های یک آپدیت. اگر رکوردی از قبل فعال باشد (مثلاً بنچمارک دور process_update)
+    همان برگردانده می‌شود و جمع‌بندی با صاحب اصلی آن است.
+    """
+    rec = _current.get()
+    if not ENABLED or rec is not None:
+        yield rec
+        return
+    rec = UpdateQueries(label, data)
+    rec.refs = 1
+    token = _current.set(rec)
+    try:
+        yield rec
+    finally:
+        _current.reset(token)
+        release(rec)
+
+def retain() -> Optional[UpdateQueries]:
+    """برای taskی که بعد از پایان آپدیت هم ادامه دارد؛ جمع‌بندی تا release آخر عقب می‌افتد."""
+    rec = _current.get()
+    if rec is not None:
+        rec.refs += 1
+    return rec
+
+def release(rec: Optional[UpdateQueries]):
+    if rec is None:
+        return
+    rec.refs -= 1
+    if rec.refs <= 0:
+        _finish(rec)
+
+
+def summary(top: int = 10) -> dict:
+    rows = sorted(_by_handler.items(), key=lambda kv: -kv[1].queries)[:top]
+    return {
+        "thresholds": {"count": WARN_COUNT, "db_ms": WARN_MS, "repeat": REPEAT_WARN},
+        "handlers": [(name, st) for name, st in rows],
+        "repeats": _repeats.most_common(top),
+        "offenders": list(_offenders)[-top:],
+    }
+
+def reset():
+    _by_handler.clear()
+    _repeats.clear()
+    _offenders.clear()
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+پروفایلر نمونه‌بردار برای ربات در حال اجرا (بدون ری‌استارت یا ابزار بیرونی).
+
+یک thread جدا هر PROFILE_INTERVAL_MS (پیش‌فرض 5) frame جاری thread ـِ event loop را با
+sys._current_frames() برمی‌دارد و stackها را می‌شمارد. خروجی «collapsed stacks» است (هر خط:
+frameها از ریشه با ; جدا و بعد تعداد)، همان ورودی flamegraph.pl / speedscope / inferno.
+نمونه‌هایی که loop بیکار در select منتظر است زیر «loop;(idle)» جمع می‌شوند.
+
+نمونه وقتی گرفته می‌شود که thread ـِ loop GIL را رها کند (syscall یا هر switch interval)، پس
+فراخوانی‌های I/O کمی پررنگ‌تر از سهم واقعی‌شان دیده می‌شوند؛ برای مقایسهٔ نسبی handlerها کافی است.
+"""
+from __future__ import annotations
+import asyncio
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+from database import _env_int
+
+INTERVAL = _env_int("PROFILE_INTERVAL_MS", 5) / 1000
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+_LIB_PREFIX = re.compile(r".*?(site-packages|dist-packages|python3\.\d+)[\\/]")
+
+_lock = threading.Lock()  # در هر لحظه فقط یک نمونه‌برداری
+
+
+def _short(filename: str) -> str:
+    path = os.path.abspath(filename)
+    if path.startswith(PROJECT_ROOT + os.sep):
+        return os.path.relpath(path, PROJECT_ROOT)
+    return _LIB_PREFIX.sub("", filename)
+
+
+class Sampler:
+    def __init__(self, thread_id: int, interval: float = INTERVAL):
+        self.thread_id, self.interval = thread_id, interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._labels: dict = {}  # code object → برچسب frame (کش)
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({_short(code.co_filename)})"
+        return label
+
+    def sample_once(self):
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        codes.reverse()
+        # از callback ـِ loop (asyncio/events.py:_run) به داخل؛ اگر نبود loop در select بیکار است
+        start = None
+        for i, code in enumerate(codes):
+            if code.co_name == "_run" and code.co_filename.endswith(os.path.join("asyncio", "events.py")):
+                start = i + 1
+        if start is None:
+            key = "loop;(idle)"
+        else:
+            key = ";".join(["loop"] + [self._label(c) for c in codes[start:]])
+        self.stacks[key] += 1
+        self.samples += 1
+
+    def run(self, seconds: float):
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            self.sample_once()
+            time.sleep(self.interval)
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+    def top_leaves(self, n: int = 10) -> list[tuple[str, int]]:
+        """پرتکرارترین frameهای انتهایی (self time) بدون نمونه‌های بیکار."""
+        leaves: Counter = Counter()
+        for stack, count in self.stacks.items():
+            if stack != "loop;(idle)":
+                leaves[stack.rsplit(";", 1)[-1]] += count
+        return leaves.most_common(n)
+
+
+async def profile_loop(seconds: float, interval: float = INTERVAL) -> Optional[Sampler]:
+    """
+    event loop جاری را seconds ثانیه نمونه‌برداری می‌کند؛ loop در این مدت آزاد است (نمونه‌برداری در thread).
+    اگر نمونه‌برداری دیگری در جریان باشد None.
+    """
+    if not _lock.acquire(blocking=False):
+        return None
+    try:
+        sampler = Sampler(threading.get_ident(), interval)
+        await asyncio.to_thread(sampler.run, seconds)
+        return sampler
+    finally:
+        _lock.release()
@@ -0,0 +1,207 @@
+# scripts/api_budget.py
+# -*- coding: utf-8 -*-
+"""
+بودجهٔ فراخوانی Bot API برای هر اقدام کاربر (رگرسیون رفت‌وبرگشت‌های اضافه).
+
+Application واقعی (app.build_application) به یک Bot API جعلی روی HTTP محلی
+(scripts/fake_telegram.FakeBotAPIServer، با base_url/base_file_url) وصل می‌شود. یک سناریوی ثابت
+(گزارش، آمار، لیست/مدیریت/ویرایش/تاگل/حذف کمپین، آمار واحد) آپدیت‌به‌آپدیت اجرا و فراخوانی‌های هر آپدیت
+به تفکیک متد شمرده می‌شود. اگر آپدیتی از بودجه‌اش (کل، و answerCallbackQuery حداکثر ۱) بیشتر فراخوانی
+کند، یا callbackی اصلاً answer نشود (spinner می‌ماند)، یا مرحله‌ای رد شود چون دکمه‌اش در پیام قبلی نبود،
+خروجی با کد 1 تمام می‌شود. مرحله‌هایی که رد شدنشان عمدی است در ALLOWED_SKIPS با دلیل می‌آیند.
+
+    python scripts/api_budget.py
+    python scripts/api_budget.py --url sqlite+aiosqlite:////tmp/big.sqlite -v
+"""
+from __future__ import annotations
+import sys, os
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import argparse, asyncio, logging, re, shlex, tempfile, warnings
+from dataclasses import dataclass, field
+
+ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+ap.add_argument("--url", help="DATABASE_URL (async) یک DB پرشده؛ پیش‌فرض SQLite تازه در پوشهٔ موقت")
+ap.add_argument("--seed-args", default="--ostans 2 --shahrs 2 --hozes 2 --paygahs 3 --users 200 "
+                                       "--roots 10 --copy-ratio 1 --reports 2000 --items 1",
+                help="آرگومان‌های scripts/seed_large.py وقتی --url داده نشده")
+ap.add_argument("-v", "--verbose", action="store_true", help="فراخوانی‌های هر آپدیت را هم چاپ کن")
+ARGS = ap.parse_args()
+
+WORKDIR = tempfile.mkdtemp(prefix="api_budget_")
+os.chdir(WORKDIR)  # storage/ ـِ handlerها اینجا
+if ARGS.url:
+    os.environ["DATABASE_URL"] = ARGS.url
+else:
+    _db = os.path.join(WORKDIR, "budget.sqlite")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_db}"
+    import seed_large
+    seed_large.run(seed_large.parse_args(["--url", f"sqlite:///{_db}", *shlex.split(ARGS.seed_args)]))
+
+from sqlalchemy import select
+from telegram.ext import ApplicationBuilder
+from telegram.warnings import PTBUserWarning
+
+warnings.filterwarnings("ignore", category=PTBUserWarning)
+
+import jobs
+from app import build_application, on_startup
+from database import session_scope
+from middleware import UpdateSessionApplication
+from models import Unit, UnitAdmin, User
+from fake_telegram import FakeBotAPI, FakeBotAPIServer, UpdateFactory
+
+
+@dataclass
+class Step:
+    who: str                     # "user" | "admin"
+    kind: str                    # command | callback | click | photo
+    arg: str = ""                # متن دستور، callback_data، یا regex دکمه برای click
+    budget: int = 1              # حداکثر کل فراخوانی‌های Bot API این آپدیت
+    times: int = 1
+    limits: dict = field(default_factory=dict)  # سقف جداگانه برای متدهای خاص
+
+    @property
+    def label(self) -> str:
+        return f"{self.who}: {self.kind} {self.arg}".strip()
+
+
+# photo: getFile + دانلود + پیام تأیید.  callback: یک answer + یک ویرایش/پیام.
+# کارهای صف‌شده (jobs) تا پایانشان جزو همان آپدیت شمرده می‌شوند.
+SCENARIO = [
+    Step("user", "command", "/start"),
+    Step("user", "command", "/report"),
+    Step("user", "click", r"^camp:\d+$", 2),
+    Step("user", "click", r"^rpf:", 2),
+    Step("user", "photo", budget=3, times=3, limits={"getFile": 1, "file": 1}),
+    Step("user", "command", "/done"),
+    Step("user", "command", "/mystats"),
+    Step("user", "click", r"^ustats:", 2),
+    Step("user", "command", "/myzip"),
+    # خروجی در صف jobs: answer + «در حال ساخت» + فایل + پیام پایانی
+    Step("user", "click", r"^uexport:", 4, limits={"sendDocument": 1}),
+    Step("admin", "command", "/campaigns"),
+    Step("admin", "click", r"^cl:sort:", 2),
+    Step("admin", "click", r"^camp:\d+:manage$", 2),
+    Step("admin", "click", r"^edit:\d+:platforms$", 2),
+    Step("admin", "click", r"^epf:(?!done)", 2),
+    Step("admin", "click", r"^epf:done$", 2),
+    Step("admin", "click", r"^toggle:", 2),
+    Step("admin", "click", r"^camp:\d+:manage$", 2),
+    Step("admin", "click", r"^delete:", 2),
+    Step("admin", "click", r"^delok:", 2),
+    Step("admin", "callback", "adm:unit:stats", 2),
+    Step("admin", "click", r"^adm:unit:stats:pickunit:", 2),
+    Step("admin", "click", r"^adm:unit:stats:(camp|all):", 2),
+]
+
+# برچسب مرحله → دلیل؛ رد شدن این مرحله‌ها خطا حساب نمی‌شود
+ALLOWED_SKIPS: dict[str, str] = {}
+
+
+class BudgetApplication(UpdateSessionApplication):
+    """taskهای handlerهای block=False را نگه می‌دارد تا فراخوانی‌هایشان به همان آپدیت برسد."""
+
+    def create_task(self, coroutine, update=None, *, name=None):
+        task = super().create_task(coroutine, update=update, name=name)
+        self.budget_tasks.append(task)
+        return task
+
+
+async def pick_actors() -> tuple[int, int]:
+    async with session_scope() as s:
+        user = (await s.execute(select(User.user_id).where(User.unit_id_paygah.is_not(None))
+                                .order_by(User.user_id).limit(1))).scalar_one_or_none()
+        row = (await s.execute(select(UnitAdmin.admin_id, UnitAdmin.unit_id).join(Unit, Unit.id == UnitAdmin.unit_id)
+                               .where(Unit.type == "HOZE").order_by(UnitAdmin.admin_id).limit(1))).first()
+        if not user or not row:
+            sys.exit("⛔️ DB کاربر یا ادمین HOZE ندارد؛ با scripts/seed_large.py پر کنید.")
+        admin, hoze = row
+        # ادمین با دو واحد تا مرحلهٔ «انتخاب واحد» ـِ آمار واحد واقعاً اجرا شود (نه میان‌بر تک‌واحدی)
+        units = (await s.execute(select(UnitAdmin.unit_id).where(UnitAdmin.admin_id == admin))).scalars().all()
+        if len(units) < 2:
+            child = (await s.execute(select(Unit.id).where(Unit.parent_id == hoze, Unit.id.not_in(units))
+                                     .order_by(Unit.id).limit(1))).scalar_one_or_none()
+            if child is None:
+                sys.exit("⛔️ واحد HOZE ادمین زیرواحدی ندارد؛ seed_large را با --paygahs ≥ 1 اجرا کنید.")
+            s.add(UnitAdmin(unit_id=child, admin_id=admin, role="ASSISTANT"))
+            await s.commit()
+    return user, admin
+
+
+async def main() -> int:
+    api = FakeBotAPI()
+    failures, unanswered, skipped = [], [], []
+    async with FakeBotAPIServer(api) as srv:
+        builder = (ApplicationBuilder().token("0:budget").base_url(srv.base_url)
+                   .base_file_url(srv.base_file_url).updater(None))
+        app = build_application(builder, application_class=BudgetApplication)
+        app.budget_tasks = []
+        async with app:
+            await on_startup(app)
+            ids = dict(zip(("user", "admin"), await pick_actors()))
+            updates = UpdateFactory(app.bot)
+
+            print(f"{'#':>3} {'step':52} {'calls':>5} {'budget':>6}  methods")
+            for i, step in enumerate(SCENARIO, 1):
+                uid = ids[step.who]
+                for rep in range(step.times):
+                    if step.kind == "command":
+                        update = updates.command(uid, step.arg)
+                    elif step.kind == "callback":
+                        update = updates.callback(uid, step.arg, api.last_message_id(uid))
+                    elif step.kind == "photo":
+                        update = updates.photo(uid, f"budget{i}_{rep}")
+                    else:
+                        data = next((d for d in api.buttons(uid) if re.search(step.arg, d)), None)
+                        if data is None:
+                            skipped.append(step.label)
+                            print(f"{i:3} {step.label[:52]:52} {'—':>5} {step.budget:6}  (دکمه‌ای نبود؛ رد شد)")
+                            break
+                        update = updates.callback(uid, data, api.last_message_id(uid))
+
+                    api.tag = (i, rep)
+                    await app.process_update(update)
+                    if app.budget_tasks:
+                        await asyncio.gather(*app.budget_tasks, return_exceptions=True)
+                        app.budget_tasks.clear()
+                    await jobs.manager.join()  # خروجی/آمارِ صف‌شده هم جزو همین اقدام است
+                    api.tag = None
+
+                    calls = api.by_tag[(i, rep)]
+                    total = sum(calls.values())
+                    limits = {"answerCallbackQuery": 1, **step.limits}
+                    over = [f"{m}={calls[m]}>{n}" for m, n in limits.items() if calls[m] > n]
+                    if total > step.budget:
+                        over.insert(0, f"total={total}>{step.budget}")
+                    if update.callback_query and not calls["answerCallbackQuery"]:
+                        unanswered.append(step.label)
+                    mark = "✗" if over else "✓"
+                    print(f"{i:3} {step.label[:52]:52} {total:5} {step.budget:6}  {mark} "
+                          + ", ".join(f"{m}={n}" for m, n in sorted(calls.items())))
+                    if over:
+                        failures.append((step.label, over))
+                    if ARGS.verbose:
+                        for c in (c for c in api.calls if c.tag == (i, rep)):
+                            print(f"        {c.method} {str(c.params)[:150]}")
+
+    unanswered = list(dict.fromkeys(unanswered))
+    allowed = [label for label in skipped if label in ALLOWED_SKIPS]
+    skipped = [label for label in skipped if label not in ALLOWED_SKIPS]
+    for label in allowed:
+        print(f"\n· رد شده (مجاز): {label} — {ALLOWED_SKIPS[label]}")
+    print(f"\n{len(failures)} over-budget updates, {len(unanswered)} unanswered callbacks, {len(skipped)} skipped steps")
+    for label, over in failures:
+        print(f"  ✗ {label}: {', '.join(over)}")
+    for label in unanswered:
+        print(f"  ✗ {label}: callback بدون answerCallbackQuery")
+    for label in skipped:
+        print(f"  ✗ {label}: دکمه در پیام قبلی نبود؛ رد شد")
+    return 1 if failures or unanswered or skipped else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,171 @@
+# scripts/bench_indexes.py
+# -*- coding: utf-8 -*-
+"""
+سنجش ایندکس‌های ترکیبی (models.HOT_INDEXES) روی کوئری‌های پرتکرار.
+
+یک DB آزمایشی (پیش‌فرض: SQLite موقت) با دادهٔ مصنوعی پر می‌شود، هر کوئری یک بار بدون
+ایندکس‌های ترکیبی و یک بار با آن‌ها اجرا می‌شود و زمان میانگین + EXPLAIN هر دو حالت چاپ می‌شود.
+
+    python scripts/bench_indexes.py
+    python scripts/bench_indexes.py --campaigns 50000 --reports 300000
+    python scripts/bench_indexes.py --url postgresql+psycopg://u:p@localhost/bench   # DB خالیِ مخصوص بنچ!
+"""
+from __future__ import annotations
+import sys, os
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import argparse, random, tempfile, time
+from sqlalchemy import create_engine, func, insert, select, text
+
+from database import Base
+from models import Campaign, Report, ReportItem, Unit, HOT_INDEXES
+
+
+def seed(conn, n_campaigns: int, n_reports: int, items_per_report: int, rnd: random.Random):
+    now = "2026-01-01T00:00:00"
+    units = [{"id": 1, "name": "ایران", "type": "COUNTRY", "parent_id": None, "created_at": now}]
+    nid = 2
+    for o in range(31):
+        oid = nid; nid += 1
+        units.append({"id": oid, "name": f"استان {o}", "type": "OSTAN", "parent_id": 1, "created_at": now})
+        for c in range(12):
+            cid = nid; nid += 1
+            units.append({"id": cid, "name": f"شهر {o}-{c}", "type": "SHAHR", "parent_id": oid, "created_at": now})
+            for h in range(6):
+                units.append({"id": nid, "name": f"حوزه {o}-{c}-{h}", "type": "HOZE", "parent_id": cid, "created_at": now})
+                nid += 1
+    conn.execute(insert(Unit), units)
+    unit_ids = [u["id"] for u in units]
+
+    camps = []
+    for i in range(1, n_campaigns + 1):
+        owner = rnd.choice(unit_ids)
+        camps.append({
+            "id": i, "name": f"کمپین {i}", "platforms": "[]", "platforms_mask": 1,
+            "active": rnd.random() < 0.7, "created_at": now, "admin_id": 1000 + owner % 50,
+            "root_campaign_id": rnd.randint(1, max(1, i)), "unit_id_owner": owner, "status": "ACTIVE",
+        })
+    for k in range(0, len(camps), 5000):
+        conn.execute(insert(Campaign), camps[k:k + 5000])
+
+    reports, items = [], []
+    item_id = 1
+    for rid in range(1, n_reports + 1):
+        c = camps[rnd.randrange(n_campaigns)]
+        reports.append({
+            "id": rid, "user_id": 10_000 + rnd.randrange(5000), "campaign_id": c["id"],
+            "platform": rnd.choice(("telegram", "instagram", "group")), "created_at": now,
+            "city_id": None, "unit_id_owner": rnd.choice(unit_ids),
+        })
+        for j in range(items_per_report):
+            items.append({"id": item_id, "report_id": rid, "file_path": f"/s/{rid}/{j}.jpg",
+                          "file_name": f"{j}.jpg", "created_at": now, "platform": "telegram"})
+            item_id += 1
+    for k in range(0, len(reports), 5000):
+        conn.execute(insert(Report), reports[k:k + 5000])
+    for k in range(0, len(items), 5000):
+        conn.execute(insert(ReportItem), items[k:k + 5000])
+    return unit_ids, camps, reports
+
+
+def hot_queries(unit_ids, camps, reports, rnd: random.Random):
+    c = camps[len(camps) // 2]
+    r = reports[len(reports) // 2]
+    owner_units = tuple(sorted(rnd.sample(unit_ids, 3)))
+    return [
+        ("campaigns_owned_by_units",
+         select(Campaign).where(Campaign.unit_id_owner.in_(owner_units), Campaign.active.is_(True))
+         .order_by(Campaign.id.desc()).limit(20)),
+        ("copy duplicate check",
+         select(Campaign.id).where(Campaign.root_campaign_id == c["root_campaign_id"],
+                                   Campaign.unit_id_owner == c["unit_id_owner"])),
+        ("get_or_create_open_report",
+         select(Report.id).where(Report.user_id == r["user_id"], Report.campaign_id == r["campaign_id"],
+                                 Report.platform == r["platform"], Report.city_id.is_(None))),
+        ("report item duplicate",
+         select(ReportItem.id).where(ReportItem.report_id == r["id"], ReportItem.file_name == "0.jpg")),
+        ("stats_for_unit_campaign",
+         select(Report.platform, func.count(ReportItem.id))
+         .join(ReportItem, ReportItem.report_id == Report.id, isouter=True)
+         .where(Report.campaign_id == r["campaign_id"], Report.unit_id_owner == r["unit_id_owner"])
+         .group_by(Report.platform)),
+        ("parent picker (type, name)",
+         select(Unit.id, Unit.name).where(Unit.type == "SHAHR").order_by(Unit.name, Unit.id).limit(10)),
+        ("child_units (parent, type, name)",
+         select(Unit).where(Unit.parent_id == unit_ids[1], Unit.type == "SHAHR").order_by(Unit.name)),
+    ]
+
+
+def explain(conn, stmt) -> str:
+    sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    if conn.dialect.name == "sqlite":
+        rows = conn.execute(text("EXPLAIN QUERY PLAN " + sql)).all()
+        return " | ".join(row[-1] for row in rows)
+    rows = conn.execute(text("EXPLAIN " + sql)).all()
+    return " | ".join(row[0].strip() for row in rows)
+
+
+def measure(conn, queries, repeat: int) -> dict:
+    out = {}
+    for label, stmt in queries:
+        conn.execute(stmt).all()  # گرم کردن کش صفحات
+        t = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(stmt).all()
+        out[label] = ((time.perf_counter() - t) * 1000 / repeat, explain(conn, stmt))
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", help="URL همگام (sync) یک DB خالی؛ پیش‌فرض SQLite موقت")
+    ap.add_argument("--campaigns", type=int, default=20000)
+    ap.add_argument("--reports", type=int, default=100000)
+    ap.add_argument("--items", type=int, default=2, help="آیتم برای هر گزارش")
+    ap.add_argument("--repeat", type=int, default=30)
+    args = ap.parse_args()
+
+    tmp = None
+    url = args.url
+    if not url:
+        tmp = tempfile.NamedTemporaryFile(suffix=".sqlite", delete=False)
+        tmp.close()
+        url = f"sqlite:///{tmp.name}"
+    engine = create_engine(url)
+    rnd = random.Random(42)
+    try:
+        with engine.begin() as conn:
+            Base.metadata.create_all(conn)
+            for idx in HOT_INDEXES:
+                idx.drop(conn, checkfirst=True)
+            print(f"seeding {args.campaigns} campaigns, {args.reports} reports …", flush=True)
+            unit_ids, camps, reports = seed(conn, args.campaigns, args.reports, args.items, rnd)
+        queries = hot_queries(unit_ids, camps, reports, rnd)
+
+        with engine.connect() as conn:
+            conn.execute(text("ANALYZE"))
+            before = measure(conn, queries, args.repeat)
+        with engine.begin() as conn:
+            for idx in HOT_INDEXES:
+                idx.create(conn, checkfirst=True)
+            conn.execute(text("ANALYZE"))
+        with engine.connect() as conn:
+            after = measure(conn, queries, args.repeat)
+
+        print(f"\n{'query':36} {'before ms':>10} {'after ms':>10} {'x':>7}")
+        for label, _ in queries:
+            b, a = before[label][0], after[label][0]
+            print(f"{label:36} {b:10.3f} {a:10.3f} {b / a if a else 0:7.1f}")
+        print("\nplans:")
+        for label, _ in queries:
+            print(f"- {label}\n    before: {before[label][1]}\n    after:  {after[label][1]}")
+    finally:
+        engine.dispose()
+        if tmp:
+            os.unlink(tmp.name)
+
+
+if __name__ == "__main__":
+    main()
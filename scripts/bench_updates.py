@@ -0,0 +1,268 @@
+# scripts/bench_updates.py
+# -*- coding: utf-8 -*-
+"""
+بنچمارک سرتاسری: Update‌های مصنوعی تلگرام از همان گراف handler ـِ app.main (app.build_application)
+عبور می‌کنند؛ Bot واقعی PTB است اما transport آن scripts/fake_telegram.RecordingRequest (بدون شبکه).
+
+هر «بازیگر» یک کاربر و یک ادمین HOZE از دادهٔ scripts/seed_large.py دارد و پشت‌سرهم جلسه‌هایی از
+این سناریوها اجرا می‌کند (وزن با --mix):
+  report  /report → کمپین → پلتفرم → چند عکس (--burst) → /done
+  browse  /campaigns → ورق زدن/مرتب‌سازی/فیلتر
+  stats   /mystats → آمار یک کمپین، و آمار واحد ادمین (adm:unit:stats)
+  export  خروجی ZIP واحد (adm:unit:export) و /myzip
+دکمه‌ها از آخرین کیبورد inline که بات فرستاده انتخاب می‌شوند، پس مسیرها همان مسیر واقعی‌اند.
+
+خروجی: آپدیت بر ثانیه، p50/p95/p99 تأخیر و میانگین کوئری DB برای هر handler، و شمار فراخوانی‌های Bot API.
+Update‌ها از update_queue و fetcher خود Application رد می‌شوند (--concurrent-updates مثل ApplicationBuilder).
+
+    python scripts/bench_updates.py
+    python scripts/bench_updates.py --actors 100 --sessions 10 --mix report=6,browse=2,stats=1,export=1
+    python scripts/bench_updates.py --url sqlite+aiosqlite:////tmp/big.sqlite --workdir /tmp/bench   # DB آماده
+"""
+from __future__ import annotations
+import sys, os
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import argparse, asyncio, itertools, logging, random, shlex, tempfile, time, traceback, warnings
+from collections import defaultdict
+
+ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+ap.add_argument("--url", help="DATABASE_URL (async) یک DB پرشده؛ پیش‌فرض SQLite تازه در workdir")
+ap.add_argument("--workdir", help="پوشهٔ کاری (storage/ و DB)؛ پیش‌فرض پوشهٔ موقت")
+ap.add_argument("--seed-args", default="--ostans 4 --shahrs 4 --hozes 4 --paygahs 6 --users 2000 "
+                                       "--roots 30 --reports 20000 --items 2",
+                help="آرگومان‌های scripts/seed_large.py وقتی --url داده نشده")
+ap.add_argument("--actors", type=int, default=40, help="بازیگر هم‌زمان")
+ap.add_argument("--sessions", type=int, default=5, help="جلسه برای هر بازیگر")
+ap.add_argument("--mix", default="report=4,browse=2,stats=2,export=1")
+ap.add_argument("--burst", type=int, default=6, help="حداکثر عکس در هر جلسهٔ report")
+ap.add_argument("--concurrent-updates", type=int, default=0, help="0 = پیش‌فرض PTB (ترتیبی)")
+ap.add_argument("--latency-ms", type=float, default=0.0, help="تأخیر مصنوعی هر فراخوانی Bot API")
+ap.add_argument("--seed", type=int, default=3)
+ARGS = ap.parse_args()
+
+WORKDIR = ARGS.workdir or tempfile.mkdtemp(prefix="bench_updates_")
+os.makedirs(WORKDIR, exist_ok=True)
+os.chdir(WORKDIR)  # storage/ ـِ handlerها (مسیر نسبی، موقع import) داخل workdir ساخته می‌شود
+if ARGS.url:
+    os.environ["DATABASE_URL"] = ARGS.url
+else:
+    db = os.path.join(WORKDIR, "bench.sqlite")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{db}"
+    if not os.path.exists(db):
+        import seed_large
+        seed_large.run(seed_large.parse_args(["--url", f"sqlite:///{db}", *shlex.split(ARGS.seed_args)]))
+
+from sqlalchemy import func, select
+from telegram.ext import ApplicationBuilder
+from telegram.warnings import PTBUserWarning
+
+warnings.filterwarnings("ignore", category=PTBUserWarning)  # هشدارهای per_message ـِ ConversationHandlerها
+
+from app import build_application, on_startup
+import jobs
+import querystats
+from database import session_scope
+from middleware import UpdateSessionApplication
+from models import Unit, UnitAdmin, User
+from fake_telegram import FakeBotAPI, RecordingRequest, UpdateFactory
+
+
+class UpdateStat:
+    """زمان یک آپدیت + رکورد querystats آن (handlerها و کوئری‌ها، شامل taskهای block=False)."""
+    __slots__ = ("rec", "ms")
+
+    def __init__(self, rec: querystats.UpdateQueries):
+        self.rec = rec
+        self.ms = 0.0
+
+    @property
+    def label(self) -> str:
+        return self.rec.name
+
+    @property
+    def queries(self) -> int:
+        return self.rec.count
+
+
+class BenchApplication(UpdateSessionApplication):
+    """زمان هر آپدیت را می‌گیرد و منتظرِ آن آپدیت (Simulator.send) را بیدار می‌کند."""
+
+    async def process_update(self, update: object) -> None:
+        with querystats.track() as rec:
+            st = UpdateStat(rec)
+            t = time.perf_counter()
+            try:
+                await super().process_update(update)
+            finally:
+                st.ms = (time.perf_counter() - t) * 1000
+                self.bench_samples.append(st)
+                fut = self.bench_waiters.pop(update.update_id, None)
+                if fut is not None and not fut.done():
+                    fut.set_result(st)
+
+
+class Simulator:
+    def __init__(self, app, api: FakeBotAPI, rnd: random.Random):
+        self.app, self.api, self.rnd = app, api, rnd
+        self.updates = UpdateFactory(app.bot)
+        self.file_ids = itertools.count(1)
+
+    async def send(self, update):
+        fut = asyncio.get_running_loop().create_future()
+        self.app.bench_waiters[update.update_id] = fut
+        await self.app.update_queue.put(update)
+        return await fut
+
+    async def command(self, uid: int, text: str):
+        await self.send(self.updates.command(uid, text))
+
+    async def callback(self, uid: int, data: str):
+        await self.send(self.updates.callback(uid, data, self.api.last_message_id(uid)))
+
+    async def click(self, uid: int, prefix: str = "") -> str | None:
+        choices = self.api.buttons(uid, prefix)
+        if not choices:
+            return None
+        data = self.rnd.choice(choices)
+        await self.callback(uid, data)
+        return data
+
+    async def photo(self, uid: int):
+        await self.send(self.updates.photo(uid, f"bench{next(self.file_ids)}"))
+
+
+# ---------- سناریوها (user: کاربر عادی، admin: ادمین HOZE) ----------
+
+async def report(sim: Simulator, user: int, admin: int):
+    await sim.command(user, "/report")
+    if await sim.click(user, "camp:") and await sim.click(user, "rpf:"):
+        for _ in range(sim.rnd.randint(1, ARGS.burst)):
+            await sim.photo(user)
+    await sim.command(user, "/done")
+
+
+async def browse(sim: Simulator, user: int, admin: int):
+    await sim.command(admin, "/campaigns")
+    for prefix in ("cl:page:", "cl:page:", "cl:sort:", "cl:status:active", "cl:page:"):
+        await sim.click(admin, prefix)
+
+
+async def stats(sim: Simulator, user: int, admin: int):
+    await sim.command(user, "/mystats")
+    await sim.click(user, "ustats:")
+    await sim.callback(admin, "adm:unit:stats")
+    await sim.click(admin, "adm:unit:stats:pickunit:")
+    await sim.click(admin, "adm:unit:stats:")
+
+
+async def export(sim: Simulator, user: int, admin: int):
+    await sim.callback(admin, "adm:unit:export")
+    await sim.click(admin, "adm:unit:export:pickunit:")
+    await sim.click(admin, "adm:unit:export:")
+    await sim.command(user, "/myzip")
+    await sim.click(user, "uexport:")
+
+
+SCENARIOS = {"report": report, "browse": browse, "stats": stats, "export": export}
+
+
+def parse_mix(raw: str) -> tuple[list, list[float]]:
+    names, weights = [], []
+    for part in raw.split(","):
+        name, _, w = part.partition("=")
+        if name.strip() not in SCENARIOS:
+            sys.exit(f"سناریوی ناشناخته: {name} (یکی از {', '.join(SCENARIOS)})")
+        names.append(SCENARIOS[name.strip()])
+        weights.append(float(w or 1))
+    return names, weights
+
+
+async def pick_actors(n: int, rnd: random.Random) -> list[tuple[int, int]]:
+    async with session_scope() as s:
+        users = (await s.execute(select(User.user_id).where(User.unit_id_paygah.is_not(None))
+                                 .order_by(func.random()).limit(n))).scalars().all()
+        admins = (await s.execute(select(UnitAdmin.admin_id).join(Unit, Unit.id == UnitAdmin.unit_id)
+                                  .where(Unit.type == "HOZE").order_by(func.random()).limit(n))).scalars().all()
+    if not users or not admins:
+        sys.exit("⛔️ DB کاربر یا ادمین HOZE ندارد؛ با scripts/seed_large.py پر کنید.")
+    return [(users[i % len(users)], admins[i % len(admins)]) for i in range(n)]
+
+
+def pct(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def print_report(app, api: FakeBotAPI, wall: float, errors: list):
+    samples = app.bench_samples
+    print(f"\n{len(samples)} updates in {wall:.2f}s → {len(samples) / wall:,.1f} updates/s "
+          f"(actors={ARGS.actors}, concurrent_updates={ARGS.concurrent_updates or 'off'})")
+    by_handler = defaultdict(list)
+    for st in samples:
+        by_handler[st.label].append(st)
+    print(f"\n{'handler':48} {'n':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'q/upd':>6} {'q max':>6}")
+    rows = sorted(by_handler.items(), key=lambda kv: -sum(s.ms for s in kv[1]))
+    for label, sts in rows + [("ALL", samples)]:
+        ms = sorted(s.ms for s in sts)
+        qs = [s.queries for s in sts]
+        print(f"{label[:48]:48} {len(sts):6} {pct(ms, 50):8.2f} {pct(ms, 95):8.2f} {pct(ms, 99):8.2f} "
+              f"{ms[-1]:8.2f} {sum(qs) / len(qs):6.1f} {max(qs):6}")
+    repeats = querystats.summary()["repeats"]
+    if repeats:
+        print(f"\nN+1 (شکل تکرارشده >{querystats.REPEAT_WARN} بار در یک آپدیت، تعداد آپدیت‌ها):")
+        for (name, sh), n in repeats:
+            print(f"  {n:5} {name[:40]:40} {sh[:110]}")
+    print("\nBot API calls: " + ", ".join(f"{m}={n}" for m, n in api.counts.most_common()))
+    if errors:
+        print(f"\n⚠️ {len(errors)} handler errors; first:\n{errors[0]}")
+
+
+async def main():
+    rnd = random.Random(ARGS.seed)
+    api = FakeBotAPI(latency=ARGS.latency_ms / 1000, record=False)
+    request = RecordingRequest(api)
+    builder = ApplicationBuilder().token("0:bench").request(request).get_updates_request(request).updater(None)
+    if ARGS.concurrent_updates:
+        builder = builder.concurrent_updates(ARGS.concurrent_updates)
+    app = build_application(builder, application_class=BenchApplication)
+    app.bench_samples, app.bench_waiters = [], {}
+
+    errors: list[str] = []
+
+    async def on_error(update, context):
+        errors.append("".join(traceback.format_exception(context.error)))
+    app.add_error_handler(on_error)
+
+    scenarios, weights = parse_mix(ARGS.mix)
+    async with app:
+        await on_startup(app)  # post_init فقط در run_polling صدا زده می‌شود
+        await app.start()
+        actors = await pick_actors(ARGS.actors, rnd)
+        sim = Simulator(app, api, rnd)
+
+        # گرم کردن: هر سناریو یک بار (کش‌ها، prepared statement‌ها) و بعد صفر کردن آمار
+        for sc in scenarios:
+            await sc(sim, *actors[0])
+        app.bench_samples.clear(); api.reset(); errors.clear(); querystats.reset()
+
+        async def actor(user, admin):
+            for _ in range(ARGS.sessions):
+                await rnd.choices(scenarios, weights)[0](sim, user, admin)
+
+        t = time.perf_counter()
+        await asyncio.gather(*(actor(u, a) for u, a in actors))
+        await jobs.manager.join()  # خروجی‌ها/آمارهای صف‌شده هم تمام شوند
+        wall = time.perf_counter() - t
+        await app.stop()
+    print_report(app, api, wall, errors)
+    print(f"\nworkdir: {WORKDIR}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("querystats").setLevel(logging.ERROR)  # جمع‌بندی N+1 در گزارش آخر چاپ می‌شود
+    asyncio.run(main())
@@ -0,0 +1,250 @@
+# scripts/fake_telegram.py
+# -*- coding: utf-8 -*-
+"""
+Bot API جعلی برای بنچمارک‌ها: به‌جای شبکه، فراخوانی‌ها ضبط و پاسخ‌های معتبر ساخته می‌شوند.
+
+- FakeBotAPI: منطق پاسخ (sendMessage → Message، getFile → File، …) + ضبط همهٔ فراخوانی‌ها
+- RecordingRequest: یک telegram.request.BaseRequest که به FakeBotAPI وصل است؛ با
+  ApplicationBuilder().request(...).get_updates_request(...) همان Bot واقعی PTB (سریال‌سازی، مدل‌ها،
+  دانلود فایل) بدون شبکه کار می‌کند
+- FakeBotAPIServer: همان FakeBotAPI پشت یک سرور aiohttp محلی؛ Bot با base_url / base_file_url به آن
+  وصل می‌شود و مسیر کامل HTTP ـِ PTB (httpx، فرم/multipart، دانلود فایل) هم اجرا می‌شود
+- UpdateFactory: ساخت Update‌های دستور/متن/عکس/callback با شناسه‌های یکتا
+
+هر فراخوانی با FakeBotAPI.tag (مثلاً شناسهٔ آپدیت/اقدام جاری) برچسب می‌خورد تا شمارش به‌ازای هر اقدام ممکن باشد.
+
+آخرین کیبورد inline هر چت نگه داشته می‌شود تا سناریوها «دکمه بزنند» (FakeBotAPI.buttons).
+"""
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from telegram import Update
+from telegram.request import BaseRequest, RequestData
+
+BOT_ID = 777_000
+# کوچک‌ترین JPEG معتبر؛ محتوای هر «دانلود» فایل
+PLACEHOLDER_JPEG = b"\xff\xd8\xff\xd9"
+# متدهایی که Message برمی‌گردانند
+_MESSAGE_METHODS = {
+    "sendMessage", "sendDocument", "sendPhoto", "sendVideo", "sendMediaGroup", "copyMessage",
+    "forwardMessage", "editMessageText", "editMessageReplyMarkup", "editMessageCaption",
+}
+
+
+@dataclass
+class Call:
+    method: str
+    params: dict
+    at: float
+    tag: Any = None
+
+
+@dataclass
+class ChatState:
+    """آخرین پیام بات در هر چت (برای ساخت callback روی همان پیام)."""
+    message_id: int = 0
+    text: Optional[str] = None
+    reply_markup: Optional[dict] = None
+
+
+class FakeBotAPI:
+    """پاسخ‌ساز Bot API در حافظه؛ مستقل از transport (RecordingRequest یا سرور HTTP)."""
+
+    def __init__(self, *, latency: float = 0.0, record: bool = True):
+        self.latency = latency  # تأخیر مصنوعی هر فراخوانی (ثانیه)
+        self.record = record
+        self.calls: list[Call] = []
+        self.counts: Counter = Counter()
+        self.by_tag: defaultdict[Any, Counter] = defaultdict(Counter)
+        self.tag: Any = None  # برچسب فراخوانی‌های بعدی (مثلاً اقدام جاری)
+        self.chats: dict[int, ChatState] = {}
+        self._ids = itertools.count(1)
+
+    def reset(self):
+        self.calls.clear()
+        self.counts.clear()
+        self.by_tag.clear()
+
+    def _count(self, method: str, params: dict):
+        if self.record:
+            self.calls.append(Call(method, params, time.perf_counter(), self.tag))
+        self.counts[method] += 1
+        if self.tag is not None:
+            self.by_tag[self.tag][method] += 1
+
+    @staticmethod
+    def bot_user() -> dict:
+        return {"id": BOT_ID, "is_bot": True, "first_name": "bench", "username": "bench_bot",
+                "can_join_groups": False, "can_read_all_group_messages": False, "supports_inline_queries": False}
+
+    def _message(self, chat_id, params: dict, method: str) -> dict:
+        chat_id = int(chat_id)
+        mid = int(params.get("message_id") or next(self._ids))
+        msg: dict[str, Any] = {
+            "message_id": mid, "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"}, "from": self.bot_user(),
+        }
+        if "text" in params:
+            msg["text"] = params["text"]
+        markup = params.get("reply_markup") or {}
+        markup = json.loads(markup) if isinstance(markup, str) else markup
+        if "inline_keyboard" in markup:  # Message فقط کیبورد inline را در پاسخ دارد
+            msg["reply_markup"] = markup
+        if method == "sendDocument":
+            msg["document"] = {"file_id": f"doc{mid}", "file_unique_id": f"doc{mid}", "file_name": "export.zip"}
+        # ارسال/ویرایش بدون کیبورد inline، کیبورد قبلی را هم از بین می‌برد (مثل تلگرام)
+        self.chats[chat_id] = ChatState(mid, msg.get("text"), msg.get("reply_markup"))
+        return msg
+
+    def file(self, path: str) -> bytes:
+        """دانلود فایل (GET روی base_file_url)؛ با نام «file» شمرده می‌شود."""
+        self._count("file", {"path": path})
+        return PLACEHOLDER_JPEG
+
+    def result(self, method: str, params: dict) -> Any:
+        self._count(method, params)
+        if method == "getMe":
+            return self.bot_user()
+        if method == "getFile":
+            fid = params.get("file_id", "f")
+            return {"file_id": fid, "file_unique_id": fid, "file_size": len(PLACEHOLDER_JPEG),
+                    "file_path": f"photos/{fid}.jpg"}
+        if method == "getUpdates":
+            return []
+        if method in _MESSAGE_METHODS and params.get("chat_id") is not None:
+            return self._message(params["chat_id"], params, method)
+        return True
+
+    # --- کمک برای سناریوها ---
+    def buttons(self, chat_id: int, prefix: str = "") -> list[str]:
+        """callback_data دکمه‌های inline آخرین پیام این چت (با پیشوند اختیاری)."""
+        markup = (self.chats.get(chat_id) or ChatState()).reply_markup or {}
+        return [b["callback_data"] for row in markup.get("inline_keyboard", []) for b in row
+                if "callback_data" in b and b["callback_data"].startswith(prefix)]
+
+    def last_message_id(self, chat_id: int) -> int:
+        return (self.chats.get(chat_id) or ChatState()).message_id
+
+
+class RecordingRequest(BaseRequest):
+    """BaseRequest بدون شبکه: POST ها به FakeBotAPI و GET (دانلود فایل) به بایت‌های placeholder."""
+
+    def __init__(self, api: FakeBotAPI):
+        self.api = api
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None, pool_timeout=None):
+        if self.api.latency:
+            await asyncio.sleep(self.api.latency)
+        if method == "GET":
+            return 200, self.api.file(url)
+        endpoint = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        body = {"ok": True, "result": self.api.result(endpoint, params)}
+        return 200, json.dumps(body).encode()
+
+
+class FakeBotAPIServer:
+    """
+    FakeBotAPI روی HTTP محلی (aiohttp):  POST /bot<token>/<method>  و  GET /file/bot<token>/<path>
+
+        async with FakeBotAPIServer(api) as srv:
+            ApplicationBuilder().token(t).base_url(srv.base_url).base_file_url(srv.base_file_url)
+    """
+
+    def __init__(self, api: FakeBotAPI, host: str = "127.0.0.1", port: int = 0):
+        self.api, self.host, self.port = api, host, port
+        self._runner = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/bot"
+
+    @property
+    def base_file_url(self) -> str:
+        return f"http://{self.host}:{self.port}/file/bot"
+
+    async def _method(self, request):
+        from aiohttp import web
+        if self.api.latency:
+            await asyncio.sleep(self.api.latency)
+        # PTB پارامترها را فرم (یا multipart وقتی فایل دارد) می‌فرستد؛ مقدارهای مرکب JSON رشته‌ای‌اند
+        form = await request.post()
+        params = {k: v for k, v in form.items() if isinstance(v, str)}
+        result = self.api.result(request.match_info["method"], params)
+        return web.json_response({"ok": True, "result": result})
+
+    async def _file(self, request):
+        from aiohttp import web
+        return web.Response(body=self.api.file(request.match_info["path"]), content_type="application/octet-stream")
+
+    async def __aenter__(self) -> "FakeBotAPIServer":
+        from aiohttp import web
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._method)
+        app.router.add_get("/file/bot{token}/{path:.*}", self._file)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]  # پورت واقعی وقتی port=0
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._runner.cleanup()
+
+
+@dataclass
+class UpdateFactory:
+    """Update‌های تلگرام برای کاربر/چت خصوصی uid؛ update_id و message_id یکتا."""
+    bot: Any
+    _update_ids: itertools.count = field(default_factory=lambda: itertools.count(1))
+    _message_ids: itertools.count = field(default_factory=lambda: itertools.count(10_000_000))
+
+    def _user(self, uid: int) -> dict:
+        return {"id": uid, "is_bot": False, "first_name": f"u{uid}"}
+
+    def _message(self, uid: int, **extra) -> dict:
+        return {"message_id": next(self._message_ids), "date": int(time.time()),
+                "chat": {"id": uid, "type": "private"}, "from": self._user(uid), **extra}
+
+    def _update(self, **payload) -> Update:
+        return Update.de_json({"update_id": next(self._update_ids), **payload}, self.bot)
+
+    def command(self, uid: int, text: str) -> Update:
+        cmd = text.split()[0]
+        return self._update(message=self._message(
+            uid, text=text, entities=[{"type": "bot_command", "offset": 0, "length": len(cmd)}]))
+
+    def text(self, uid: int, text: str) -> Update:
+        return self._update(message=self._message(uid, text=text))
+
+    def photo(self, uid: int, file_id: str) -> Update:
+        sizes = [{"file_id": f"{file_id}_{w}", "file_unique_id": f"{file_id}_{w}", "width": w, "height": w,
+                  "file_size": len(PLACEHOLDER_JPEG)} for w in (90, 320, 1280)]
+        return self._update(message=self._message(uid, photo=sizes))
+
+    def callback(self, uid: int, data: str, message_id: int) -> Update:
+        msg = {"message_id": message_id, "date": int(time.time()), "chat": {"id": uid, "type": "private"},
+               "from": FakeBotAPI.bot_user(), "text": "…"}
+        return self._update(callback_query={
+            "id": str(next(self._update_ids)), "from": self._user(uid), "chat_instance": str(uid),
+            "data": data, "message": msg,
+        })
@@ -0,0 +1,227 @@
+# scripts/plan_check.py
+# -*- coding: utf-8 -*-
+"""
+هارنس رگرسیون query plan.
+
+یک DB بزرگ مصنوعی (همان seed بنچ ایندکس‌ها + ادمین/کاربر) ساخته می‌شود، بعد همهٔ توابع
+خواندنی crud.py / services.py / actor.py و helperهای _fetch_* در flows/ واقعاً اجرا می‌شوند.
+هر SELECT که به DB می‌رسد ضبط و با همان پارامترها EXPLAIN می‌شود (SQLite: EXPLAIN QUERY PLAN،
+PostgreSQL: EXPLAIN یا با --analyze EXPLAIN ANALYZE). اگر پلنی جدولی بزرگ‌تر از --min-rows را
+کامل scan کند (SQLite: «SCAN t» بدون ایندکس، PG: «Seq Scan on t») خروجی با کد 1 تمام می‌شود.
+
+    python scripts/plan_check.py
+    python scripts/plan_check.py --min-rows 5000 -v
+    python scripts/plan_check.py --url postgresql+asyncpg://u:p@localhost/plancheck --analyze   # DB خالی!
+
+scan‌هایی که عمداً کامل‌اند (مثلاً «همهٔ واحدها» برای سوپرادمین) در ALLOWED با دلیل آمده‌اند.
+"""
+from __future__ import annotations
+import sys, os
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import argparse, asyncio, random, re, tempfile
+
+ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+ap.add_argument("--url", help="URL async یک DB خالی؛ پیش‌فرض SQLite موقت")
+ap.add_argument("--min-rows", type=int, default=1000, help="جدول‌های کوچک‌تر از این نادیده گرفته می‌شوند")
+ap.add_argument("--campaigns", type=int, default=20000)
+ap.add_argument("--reports", type=int, default=60000)
+ap.add_argument("--analyze", action="store_true", help="PostgreSQL: EXPLAIN ANALYZE")
+ap.add_argument("-v", "--verbose", action="store_true", help="همهٔ پلن‌ها را چاپ کن")
+ARGS = ap.parse_args()
+
+_tmp = None
+if ARGS.url:
+    os.environ["DATABASE_URL"] = ARGS.url
+else:
+    _tmp = tempfile.NamedTemporaryFile(suffix=".sqlite", delete=False)
+    _tmp.close()
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_tmp.name}"
+os.environ["READ_DATABASE_URL"] = ""
+os.environ["SQLITE_READ_POOL"] = "0"  # همهٔ کوئری‌ها از یک engine رد شوند تا ضبط شوند
+
+from sqlalchemy import event, func, insert, select, text
+
+import crud, services
+from actor import resolve_actor
+from cache import access, queries, totals
+from database import engine, init_db, SessionLocal
+from models import Admin, AdminTree, Campaign, Report, ReportItem, Unit, UnitAdmin, User
+from flows import manage, units as unit_flows
+from bench_indexes import seed as seed_core
+
+# (برچسب، جدول) → چرا scan کامل درست است
+ALLOWED = {
+    ("list_units_for_actor[super]", "units"): "سوپرادمین همهٔ واحدها را می‌خواهد",
+    ("list_campaigns_for_admin_unit_tree[super]", "campaigns"): "سوپرادمین همهٔ کمپین‌ها را می‌خواهد",
+    ("load_unit_index", "units"): "بارگذاری کامل ایندکس فازی هنگام startup",
+    ("_fetch_campaigns_page[super]", "campaigns"): "لیست همهٔ کمپین‌ها برای سوپرادمین (LIMIT دارد)",
+}
+
+SUPER, ROOT_ADMIN = 1, 1000
+
+
+def seed_people(conn, unit_ids, rnd: random.Random):
+    conn.execute(insert(Admin), [{"admin_id": SUPER, "role": "SUPER"}] +
+                 [{"admin_id": 1000 + i, "role": "L1"} for i in range(50)])
+    conn.execute(insert(AdminTree), [{"parent_admin_id": 1000 + i // 5, "child_admin_id": 1000 + i}
+                                     for i in range(1, 50)])
+    conn.execute(insert(UnitAdmin), [{"unit_id": unit_ids[1 + i], "admin_id": 1000 + i,
+                                      "role": "OWNER"} for i in range(50)])
+    users = [{"user_id": 10_000 + i, "admin_id": 1000 + i % 50, "display_name": f"کاربر {i}",
+              "search_key": f"کاربر {i}", "unit_id_paygah": rnd.choice(unit_ids)} for i in range(5000)]
+    for k in range(0, len(users), 5000):
+        conn.execute(insert(User), users[k:k + 5000])
+
+
+def calls(unit_ids, camps, reports):
+    c = camps[len(camps) // 2]
+    r = reports[len(reports) // 2]
+    unit, camp, user = r["unit_id_owner"], r["campaign_id"], r["user_id"]
+    shahr = next(u for u in unit_ids if u > 40)
+    flt = {"status": "active", "origin": "all", "plats": []}
+    return [
+        ("is_admin", lambda s: crud.is_admin(s, ROOT_ADMIN)),
+        ("ancestors_of", lambda s: crud.ancestors_of(s, 1049)),
+        ("descendants_of", lambda s: crud.descendants_of(s, ROOT_ADMIN)),
+        ("share_scope", lambda s: crud.share_scope(s, 1003, 1040)),
+        ("primary_owner_id", lambda s: crud.primary_owner_id(s, 1049)),
+        ("resolve_actor", lambda s: resolve_actor(s, 1007)),
+        ("get_user_admin", lambda s: crud.get_user_admin(s, user)),
+        ("list_my_users", lambda s: crud.list_my_users(s, 1007)),
+        ("list_my_users[search]", lambda s: crud.list_my_users(s, 1007, "کاربر 12")),
+        ("get_admin_units", lambda s: crud.get_admin_units(s, 1007)),
+        ("child_units", lambda s: crud.child_units(s, unit_ids[1], "SHAHR")),
+        ("parent_unit_id", lambda s: crud.parent_unit_id(s, shahr)),
+        ("get_campaign", lambda s: crud.get_campaign(s, c["id"])),
+        ("list_campaigns_for_admin_units", lambda s: crud.list_campaigns_for_admin_units(s, 1007, active_only=True)),
+        # برگ درخت: خوشهٔ ۴ ادمینی؛ برای ادمین‌های بالای درخت seed یکنواخت بیش از ۱۵٪ جدول را برمی‌گرداند و scan واقعاً ارزان‌تر است
+        ("list_campaigns_for_admin", lambda s: crud.list_campaigns_for_admin(s, 1049, active_only=True)),
+        ("list_campaigns_for_user", lambda s: crud.list_campaigns_for_user(s, user)),
+        ("list_campaigns_for_admin_unit_tree", lambda s: crud.list_campaigns_for_admin_unit_tree(s, 1007)),
+        ("list_campaigns_for_admin_unit_tree[super]", lambda s: crud.list_campaigns_for_admin_unit_tree(s, SUPER)),
+        ("get_user_unit_id", lambda s: crud.get_user_unit_id(s, user)),
+        ("list_reportable_campaigns_for_user", lambda s: crud.list_reportable_campaigns_for_user(s, user)),
+        ("list_units_for_actor", lambda s: crud.list_units_for_actor(s, 1007)),
+        ("list_units_for_actor[super]", lambda s: crud.list_units_for_actor(s, SUPER)),
+        ("list_campaigns_reported_by_unit", lambda s: crud.list_campaigns_reported_by_unit(s, unit)),
+        ("stats_for_campaign", lambda s: crud.stats_for_campaign(s, camp)),
+        ("stats_for_user_campaign", lambda s: crud.stats_for_user_campaign(s, camp, user)),
+        ("stats_by_unit_platform", lambda s: crud.stats_by_unit_platform(s, camp)),
+        ("stats_for_unit_campaign", lambda s: crud.stats_for_unit_campaign(s, unit, camp)),
+        ("stats_for_unit_all_campaigns", lambda s: crud.stats_for_unit_all_campaigns(s, unit)),
+        ("fetch_unit_campaign_items", lambda s: crud.fetch_unit_campaign_items(s, unit, camp)),
+        ("fetch_unit_all_items", lambda s: crud.fetch_unit_all_items(s, unit)),
+        ("load_unit_index", lambda s: crud.load_unit_index(s)),
+        ("get_or_create_open_report", lambda s: crud.get_or_create_open_report(s, user, camp, r["platform"], None)),
+        ("services.copy_campaign_one_level", lambda s: services.copy_campaign_one_level(s, c["id"], [shahr], ROOT_ADMIN)),
+        ("services.submit_report_up", lambda s: services.submit_report_up(s, shahr, c["id"], [], [], ROOT_ADMIN, {})),
+        ("_fetch_campaigns_page", lambda s: scoped_campaigns_page(s, 1007, None, "new", flt)),
+        ("_fetch_campaigns_page[search]", lambda s: scoped_campaigns_page(s, 1007, "کمپین 123", "rank", flt)),
+        ("_fetch_campaigns_page[super]", lambda s: manage._fetch_campaigns_page(
+            s, admin_id=SUPER, page=0, q=None, sort_key="new", filters=flt, scope_root=None, allowed_units=None)),
+        ("_fetch_parents_page", lambda s: unit_flows._fetch_parents_page(s, "SHAHR", 0, None)),
+        ("_pp_fetch_parents_page", lambda s: unit_flows._pp_fetch_parents_page(s, "SHAHR", 0, None, "name")),
+        ("_pp_fetch_parents_page_scoped", lambda s: unit_flows._pp_fetch_parents_page_scoped(
+            s, "SHAHR", 0, None, "name", unit_ids[1])),
+        ("_ul_fetch_page", lambda s: unit_flows._ul_fetch_page(
+            s, parent_id=unit_ids[1], page=0, q=None, type_filter="ALL", sort_key="name")),
+        ("_ua_fetch_admins_page", lambda s: unit_flows._ua_fetch_admins_page(s, page=0, q=None, sort_key="new")),
+        ("_uam_fetch_admins_for_unit", lambda s: unit_flows._uam_fetch_admins_for_unit(s, unit_ids[3], page=0)),
+    ]
+
+
+async def scoped_campaigns_page(s, admin_id, q, sort_key, filters):
+    """مثل _render_campaigns_list: محدوده از ActorContext (واحد اصلی + زیرواحدها)."""
+    actor = await resolve_actor(s, admin_id)
+    return await manage._fetch_campaigns_page(
+        s, admin_id=admin_id, page=0, q=q, sort_key=sort_key, filters=filters,
+        scope_root=actor.primary_unit_id, allowed_units=await actor.unit_scope(s))
+
+
+_SQLITE_SCAN = re.compile(r"^SCAN (\w+)(?!.*\bUSING\b.*\bINDEX\b)")
+_PG_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+
+async def explain(stmt: str, params) -> list[str]:
+    async with engine.connect() as conn:
+        if conn.dialect.name == "sqlite":
+            rows = (await conn.exec_driver_sql("EXPLAIN QUERY PLAN " + stmt, params)).all()
+            return [row[-1] for row in rows]
+        prefix = "EXPLAIN ANALYZE " if ARGS.analyze else "EXPLAIN "
+        rows = (await conn.exec_driver_sql(prefix + stmt, params)).all()
+        return [row[0] for row in rows]
+
+
+async def main() -> int:
+    await init_db()
+    rnd = random.Random(7)
+    print(f"seeding {ARGS.campaigns} campaigns, {ARGS.reports} reports …", flush=True)
+    async with engine.begin() as conn:
+        unit_ids, camps, reports = await conn.run_sync(
+            lambda c: seed_core(c, ARGS.campaigns, ARGS.reports, 2, rnd))
+        await conn.run_sync(lambda c: seed_people(c, unit_ids, rnd))
+        await conn.execute(text("ANALYZE"))
+    async with engine.connect() as conn:
+        sizes = {t: (await conn.execute(select(func.count()).select_from(m))).scalar_one()
+                 for t, m in (("campaigns", Campaign), ("reports", Report), ("report_items", ReportItem),
+                              ("units", Unit), ("users", User), ("admins", Admin), ("unit_admins", UnitAdmin),
+                              ("admin_tree", AdminTree))}
+    big = {t for t, n in sizes.items() if n >= ARGS.min_rows}
+    print("tables ≥ min-rows:", ", ".join(f"{t}={sizes[t]}" for t in sorted(big)))
+
+    captured: list = []
+
+    def _capture(conn, cursor, statement, parameters, context, executemany):
+        head = statement.lstrip()[:6].upper()
+        if head.startswith(("SELECT", "WITH")) and not executemany:
+            captured.append((statement, parameters))
+
+    failures, checked = [], 0
+    for label, make in calls(unit_ids, camps, reports):
+        queries.clear(); totals.clear(); access.invalidate()  # کش‌ها نباید کوئری را پنهان کنند
+        captured.clear()
+        event.listen(engine.sync_engine, "before_cursor_execute", _capture)
+        try:
+            async with SessionLocal() as s:
+                await make(s)
+                await s.rollback()  # توابعی که می‌نویسند (services.*) اثری نگذارند
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", _capture)
+
+        for stmt, params in list(captured):
+            checked += 1
+            plan = await explain(stmt, params)
+            scans = set()
+            for line in plan:
+                m = (_SQLITE_SCAN.match(line.strip()) if engine.dialect.name == "sqlite"
+                     else _PG_SCAN.search(line))
+                if m and m.group(1) in big and (label, m.group(1)) not in ALLOWED:
+                    scans.add(m.group(1))
+            if scans:
+                failures.append((label, scans, stmt, plan))
+            if ARGS.verbose or scans:
+                print(f"\n[{'FAIL' if scans else 'ok'}] {label}\n  {' '.join(stmt.split())[:300]}")
+                for line in plan:
+                    print("    " + line)
+
+    print(f"\n{checked} statements from {len(calls(unit_ids, camps, reports))} call sites; "
+          f"{len(failures)} full scans over tables ≥ {ARGS.min_rows} rows")
+    for label, scans, _, _ in failures:
+        print(f"  ✗ {label}: {', '.join(sorted(scans))}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    try:
+        code = asyncio.run(main())
+    finally:
+        if _tmp:
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    os.unlink(_tmp.name + suffix)
+                except FileNotFoundError:
+                    pass
+    sys.exit(code)
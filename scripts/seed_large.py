@@ -0,0 +1,328 @@
+# scripts/seed_large.py
+# -*- coding: utf-8 -*-
+"""
+دادهٔ مصنوعیِ حجیم برای کارهای کارایی (نسخهٔ بزرگِ scripts/seed.py).
+
+درخت کامل COUNTRY→OSTAN→SHAHR→HOZE→PAYGAH، یک ادمین OWNER برای هر واحد تا سطح HOZE (درخت
+ادمین‌ها هم‌شکل درخت واحدها)، کاربران روی پایگاه‌ها، کمپین‌های ریشه روی کشور که با نسبت
+--copy-ratio سطح‌به‌سطح تا HOZE کپی شده‌اند (root_campaign_id + campaign_copies مثل
+services.copy_campaign_one_level)، و گزارش/آیتم روی کمپین‌های «واحد والد» هر کاربر (همان چیزی که
+/report نشان می‌دهد). برای هر (کاربر، کمپین، پلتفرم) حداکثر یک گزارش ساخته می‌شود تا
+get_or_create_open_report مثل دادهٔ واقعی رفتار کند.
+
+درج‌ها bulk هستند: PostgreSQL با psycopg → COPY، بقیه executemany مستقیم روی cursor. ایندکس‌های
+reports/report_items پیش از درج برداشته و بعد دوباره ساخته می‌شوند (--keep-indexes برای خاموش کردن).
+پیش‌فرض‌ها حدود ۳۳ هزار واحد، ۲۰۰ هزار کاربر، ۲ میلیون گزارش و ۸ میلیون آیتم (~۱۰ میلیون ردیف) است.
+
+    python scripts/seed_large.py                                     # DATABASE_URL (درایور async → sync)
+    python scripts/seed_large.py --url sqlite:///big.sqlite --reports 200000
+    python scripts/seed_large.py --url postgresql+psycopg://u:p@localhost/big --media   # + فایل‌های placeholder
+
+DB باید خالی باشد (id‌ها صریح‌اند).
+"""
+from __future__ import annotations
+import sys, os
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+import argparse, datetime, json, random, time
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event, func, select, text
+
+from database import Base
+from models import Admin, AdminTree, Campaign, CampaignCopy, Report, ReportItem, Unit, UnitAdmin, User
+from crud import platforms_to_mask
+from keyboards import PLATFORM_KEYS
+from search import create_search_objects, normalize_fa, rebuild_campaign_fts, sqlite_fts_ready
+from flows.report import get_storage_path
+
+load_dotenv()
+
+ADMIN_BASE = 1_000_000       # admin_id = ADMIN_BASE + unit_id
+USER_BASE = 10_000_000       # user_id = USER_BASE + i
+SUPER_ID = 1
+REPORT_PLATFORMS = ("telegram", "instagram", "group")
+# کوچک‌ترین JPEG معتبر (SOI + EOI)؛ فقط برای اینکه مسیرها روی دیسک وجود داشته باشند
+PLACEHOLDER_JPEG = b"\xff\xd8\xff\xd9"
+
+
+def sync_url(url: str) -> str:
+    """URL اپ (async) → معادل sync برای درج bulk."""
+    return url.replace("+aiosqlite", "").replace("+asyncpg", "+psycopg")
+
+
+class BulkLoader:
+    """درج دسته‌ای روی DBAPI خام: COPY در psycopg 3، وگرنه executemany با تکه‌های chunk تایی."""
+
+    def __init__(self, conn, chunk: int):
+        self.conn = conn
+        self.chunk = chunk
+        self.raw = conn.connection.dbapi_connection
+        self.use_copy = conn.dialect.name == "postgresql" and hasattr(self.raw.cursor(), "copy")
+        self.mark = "?" if conn.dialect.paramstyle in ("qmark", "numeric") else "%s"
+
+    def load(self, table, cols: tuple[str, ...], rows) -> int:
+        cur = self.raw.cursor()
+        n = 0
+        if self.use_copy:
+            with cur.copy(f"COPY {table.name} ({', '.join(cols)}) FROM STDIN") as cp:
+                for row in rows:
+                    cp.write_row(row)
+                    n += 1
+            return n
+        sql = f"INSERT INTO {table.name} ({', '.join(cols)}) VALUES ({', '.join([self.mark] * len(cols))})"
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.chunk:
+                cur.executemany(sql, batch)
+                n += len(batch)
+                batch.clear()
+        if batch:
+            cur.executemany(sql, batch)
+            n += len(batch)
+        return n
+
+
+class Tree:
+    """درخت واحدها؛ فقط id و والد و نوع در حافظه."""
+
+    def __init__(self, ostans: int, shahrs: int, hozes: int, paygahs: int):
+        self.rows: list[tuple[int, str, str, int | None]] = [(1, "ایران", "COUNTRY", None)]
+        self.by_type: dict[str, list[int]] = {"COUNTRY": [1], "OSTAN": [], "SHAHR": [], "HOZE": [], "PAYGAH": []}
+        self.children: dict[int, list[int]] = {}
+        self.parent: dict[int, int] = {}
+        nid = 2
+        for o in range(ostans):
+            oid, nid = nid, nid + 1
+            self._add(oid, f"استان {o + 1}", "OSTAN", 1)
+            for c in range(shahrs):
+                cid, nid = nid, nid + 1
+                self._add(cid, f"شهر {o + 1}-{c + 1}", "SHAHR", oid)
+                for h in range(hozes):
+                    hid, nid = nid, nid + 1
+                    self._add(hid, f"حوزه {o + 1}-{c + 1}-{h + 1}", "HOZE", cid)
+                    for p in range(paygahs):
+                        self._add(nid, f"پایگاه {o + 1}-{c + 1}-{h + 1}-{p + 1}", "PAYGAH", hid)
+                        nid += 1
+
+    def _add(self, uid: int, name: str, utype: str, parent: int):
+        self.rows.append((uid, name, utype, parent))
+        self.by_type[utype].append(uid)
+        self.children.setdefault(parent, []).append(uid)
+        self.parent[uid] = parent
+
+    def admin_units(self) -> list[int]:
+        """واحدهایی که ادمین OWNER دارند (همه به‌جز پایگاه‌ها)."""
+        return [uid for uid, _, utype, _ in self.rows if utype != "PAYGAH"]
+
+
+def iso(base: datetime.datetime, rnd: random.Random, days: int) -> str:
+    return (base - datetime.timedelta(seconds=rnd.randrange(days * 86400))).isoformat()
+
+
+def gen_campaigns(tree: Tree, roots: int, ratio: float, rnd: random.Random, base, days: int):
+    """کمپین‌های ریشه روی کشور و کپی سطح‌به‌سطح تا HOZE. خروجی: (campaign rows, copy rows, کمپین‌های هر واحد)."""
+    camps, copies = [], []
+    by_unit: dict[int, list[int]] = {}
+    plats_pool = [p for p in PLATFORM_KEYS if p in REPORT_PLATFORMS] or list(PLATFORM_KEYS)
+
+    def add(name, unit_id, root_id, created_at, plats):
+        cid = len(camps) + 1
+        admin = ADMIN_BASE + unit_id
+        desc = f"توضیحات {name}"
+        camps.append((
+            cid, name, f"#{name.replace(' ', '_')}", None, json.dumps(plats), platforms_to_mask(plats), desc,
+            normalize_fa(f"{name} #{name.replace(' ', '_')} {desc}"), rnd.random() < 0.8, admin, admin,
+            created_at, root_id or cid, unit_id, json.dumps({}), "ACTIVE",
+        ))
+        by_unit.setdefault(unit_id, []).append(cid)
+        return cid
+
+    for i in range(roots):
+        plats = rnd.sample(plats_pool, rnd.randint(1, len(plats_pool)))
+        created = iso(base, rnd, days)
+        root = add(f"کمپین {i + 1}", 1, None, created, plats)
+        frontier = [(root, 1)]
+        while frontier:
+            src, unit = frontier.pop()
+            for child in tree.children.get(unit, ()):
+                if child not in tree.children or rnd.random() >= ratio:
+                    continue  # پایگاه‌ها کمپین ندارند
+                cid = add(f"کمپین {i + 1}", child, root, created, plats)
+                copies.append((src, cid, unit, child, ADMIN_BASE + unit, created))
+                frontier.append((cid, child))
+    return camps, copies, by_unit
+
+
+def gen_reports(reporters, by_unit, n_reports: int, seed: int, base, days: int):
+    """
+    (id, user_id, campaign_id, platform, created_at, unit_id_owner) — قطعی (برای تولید دوبارهٔ آیتم‌ها).
+    گزارش j‌ام هر کاربر روی کمپین j//3 و پلتفرم j%3 از کمپین‌های واحد والدش ← (کاربر، کمپین، پلتفرم) یکتا.
+    """
+    rnd = random.Random(seed)
+    rid = 0
+    for r in range(n_reports):
+        k, j = r % len(reporters), r // len(reporters)
+        uid, paygah, hoze = reporters[k]
+        camps = by_unit[hoze]
+        if j >= len(camps) * len(REPORT_PLATFORMS):
+            continue
+        rid += 1
+        cid = camps[(j // len(REPORT_PLATFORMS) + k) % len(camps)]
+        yield rid, uid, cid, REPORT_PLATFORMS[j % len(REPORT_PLATFORMS)], iso(base, rnd, days), paygah
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", help="URL همگام (sync)؛ پیش‌فرض DATABASE_URL با درایور sync")
+    ap.add_argument("--ostans", type=int, default=31)
+    ap.add_argument("--shahrs", type=int, default=10, help="شهر در هر استان")
+    ap.add_argument("--hozes", type=int, default=8, help="حوزه در هر شهر")
+    ap.add_argument("--paygahs", type=int, default=12, help="پایگاه در هر حوزه")
+    ap.add_argument("--users", type=int, default=200_000)
+    ap.add_argument("--roots", type=int, default=200, help="کمپین ریشه روی کشور")
+    ap.add_argument("--copy-ratio", type=float, default=0.5, help="احتمال کپی هر کمپین به هر زیرواحد")
+    ap.add_argument("--reports", type=int, default=2_000_000)
+    ap.add_argument("--items", type=int, default=4, help="آیتم برای هر گزارش")
+    ap.add_argument("--days", type=int, default=180, help="بازهٔ created_at")
+    ap.add_argument("--chunk", type=int, default=20_000)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--keep-indexes", action="store_true", help="ایندکس‌های reports/report_items حین درج بمانند")
+    ap.add_argument("--media", action="store_true", help="برای هر آیتم فایل placeholder روی دیسک بنویس")
+    return ap.parse_args(argv)
+
+
+def run(args: argparse.Namespace):
+    url = args.url or sync_url(os.getenv("DATABASE_URL", "sqlite:///./bot.db"))
+    engine = create_engine(url)
+    if engine.dialect.name == "sqlite":
+        # فقط برای همین بارگذاری؛ اپ با پروفایل WAL خودش (database._sqlite_pragmas) وصل می‌شود
+        event.listen(engine, "connect", lambda dbapi_conn, _: dbapi_conn.execute("PRAGMA synchronous=OFF"))
+    rnd = random.Random(args.seed)
+    base = datetime.datetime(2026, 1, 1)
+    t0 = time.perf_counter()
+
+    def phase(label: str, n: int, started: float):
+        dt = time.perf_counter() - started
+        print(f"  {label:16} {n:>11,} rows {dt:8.1f}s {n / dt if dt else 0:>12,.0f} rows/s", flush=True)
+
+    try:
+        with engine.begin() as conn:
+            Base.metadata.create_all(conn)
+            create_search_objects(conn)
+            if conn.execute(select(func.count()).select_from(Unit)).scalar_one():
+                sys.exit("⛔️ جدول units خالی نیست؛ seed_large فقط روی DB خالی اجرا می‌شود.")
+
+        tree = Tree(args.ostans, args.shahrs, args.hozes, args.paygahs)
+        now = base.isoformat()
+        deferred = [] if args.keep_indexes else [i for t in (Report, ReportItem) for i in t.__table__.indexes]
+
+        with engine.begin() as conn:
+            bulk = BulkLoader(conn, args.chunk)
+            print(f"seeding into {engine.url.render_as_string(hide_password=True)} "
+                  f"({'COPY' if bulk.use_copy else 'executemany'})", flush=True)
+            for idx in deferred:
+                idx.drop(conn, checkfirst=True)
+
+            s = time.perf_counter()
+            n = bulk.load(Unit.__table__, ("id", "name", "type", "search_key", "parent_id", "created_at"),
+                          ((uid, name, utype, normalize_fa(name), parent, now) for uid, name, utype, parent in tree.rows))
+            phase("units", n, s)
+
+            s = time.perf_counter()
+            admin_units = tree.admin_units()
+            n = bulk.load(Admin.__table__, ("admin_id", "role"),
+                          [(SUPER_ID, "SUPER")] + [(ADMIN_BASE + u, "L1") for u in admin_units])
+            n += bulk.load(AdminTree.__table__, ("parent_admin_id", "child_admin_id"),
+                           ((ADMIN_BASE + tree.parent[u], ADMIN_BASE + u) for u in admin_units if u in tree.parent))
+            n += bulk.load(UnitAdmin.__table__, ("unit_id", "admin_id", "role"),
+                           ((u, ADMIN_BASE + u, "OWNER") for u in admin_units))
+            phase("admins", n, s)
+
+            s = time.perf_counter()
+            paygahs = tree.by_type["PAYGAH"]
+            users = [(USER_BASE + i, rnd.choice(paygahs)) for i in range(args.users)]
+            n = bulk.load(User.__table__, ("user_id", "admin_id", "display_name", "search_key", "unit_id_paygah"),
+                          ((uid, ADMIN_BASE + tree.parent[p], f"کاربر {uid - USER_BASE}",
+                            normalize_fa(f"کاربر {uid - USER_BASE}"), p) for uid, p in users))
+            phase("users", n, s)
+
+            s = time.perf_counter()
+            camps, copies, by_unit = gen_campaigns(tree, args.roots, args.copy_ratio, rnd, base, args.days)
+            n = bulk.load(Campaign.__table__, (
+                "id", "name", "hashtag", "city", "platforms", "platforms_mask", "description", "search_key",
+                "active", "created_by", "admin_id", "created_at", "root_campaign_id", "unit_id_owner",
+                "config_json", "status"), camps)
+            n += bulk.load(CampaignCopy.__table__, (
+                "from_campaign_id", "to_campaign_id", "from_unit_id", "to_unit_id",
+                "copied_by_admin_id", "copied_at"), copies)
+            if sqlite_fts_ready(conn):
+                rebuild_campaign_fts(conn)
+            phase("campaigns", n, s)
+            del camps, copies
+
+            # فقط کاربرانی که واحد والدشان کمپین دارد گزارش می‌دهند
+            reporters = [(uid, p, tree.parent[p]) for uid, p in users if by_unit.get(tree.parent[p])]
+            if not reporters:
+                sys.exit("⛔️ هیچ حوزه‌ای کمپین ندارد؛ --roots یا --copy-ratio را بیشتر کنید.")
+            rep_seed = rnd.randrange(1 << 30)
+
+            s = time.perf_counter()
+            n_reports = bulk.load(Report.__table__, (
+                "id", "user_id", "campaign_id", "platform", "created_at", "unit_id_owner"),
+                gen_reports(reporters, by_unit, args.reports, rep_seed, base, args.days))
+            phase("reports", n_reports, s)
+
+            s = time.perf_counter()
+            made_dirs: set = set()
+
+            def items():
+                iid = 0
+                for rid, _, cid, platform, created_at, unit in gen_reports(
+                        reporters, by_unit, args.reports, rep_seed, base, args.days):
+                    folder = get_storage_path("ir", cid, platform, unit, rid)
+                    if args.media and folder not in made_dirs:
+                        folder.mkdir(parents=True, exist_ok=True)
+                        made_dirs.add(folder)
+                    prefix = f"{folder}{os.sep}"
+                    for k in range(args.items):
+                        iid += 1
+                        name = f"file_{iid}.jpg"
+                        if args.media:
+                            (folder / name).write_bytes(PLACEHOLDER_JPEG)
+                        yield iid, rid, f"seed-{iid}", prefix + name, name, created_at, platform
+
+            n = bulk.load(ReportItem.__table__, (
+                "id", "report_id", "file_id", "file_path", "file_name", "created_at", "platform"), items())
+            phase("report_items", n, s)
+
+            s = time.perf_counter()
+            for idx in deferred:
+                idx.create(conn, checkfirst=True)
+            if deferred:
+                phase("indexes", len(deferred), s)
+
+            if conn.dialect.name == "postgresql":
+                # id‌ها صریح درج شدند؛ sequence‌ها باید از max(id) ادامه دهند
+                for t in (Unit, Campaign, CampaignCopy, Report, ReportItem):
+                    name = t.__tablename__
+                    conn.execute(text(
+                        f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), "
+                        f"COALESCE((SELECT MAX(id) FROM {name}), 1))"
+                    ))
+
+        with engine.connect() as conn:
+            if conn.dialect.name == "postgresql":
+                conn.execution_options(isolation_level="AUTOCOMMIT").exec_driver_sql("ANALYZE")
+            else:
+                conn.exec_driver_sql("ANALYZE")
+                conn.commit()
+    finally:
+        engine.dispose()
+    print(f"✅ done in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    run(parse_args())
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+جستجوی متنی: نرمال‌سازی فارسی + جستجوی متنی کمپین‌ها.
+
+search_key واحدها/کمپین‌ها/کاربران با normalize_fa ساخته می‌شود (رویدادهای before_insert/update در models)
+و عبارت جستجو هم با همان تابع نرمال می‌شود؛ پس «علي»، «علی» و «عَلی» یکی‌اند.
+
+SQLite: جدول مجازی FTS5 به نام campaigns_fts (rowid = campaigns.id) که با رویدادهای mapper در models.py
+        همگام می‌ماند؛ رتبه با bm25.
+PostgreSQL: ایندکس GIN روی to_tsvector('simple', search_key) (ایندکس در models تعریف شده)؛ رتبه با ts_rank.
+سایر حالت‌ها (یا SQLite بدون FTS5): LIKE روی search_key.
+
+این ماژول models را import نمی‌کند (models از آن استفاده می‌کند)؛ ستون‌ها را caller می‌دهد.
+"""
+from __future__ import annotations
+import heapq
+import math
+import re
+from collections import Counter
+from itertools import chain
+from typing import Iterable, NamedTuple, Optional
+
+from sqlalchemy import Float, Integer, func, text
+import sqlalchemy.dialects.postgresql  # noqa: F401  (ثبت to_tsvector/to_tsquery برای کامپایلر PG)
+
+FTS_TABLE = "campaigns_fts"
+FTS_COLUMNS = ("name", "city", "hashtag", "description")
+# وزن bm25 هر ستون به همان ترتیب FTS_COLUMNS (نام و هشتگ مهم‌ترند)
+FTS_WEIGHTS = (10.0, 2.0, 5.0, 1.0)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# ---------- نرمال‌سازی فارسی ----------
+
+_FA_TRANSLATE = str.maketrans({
+    "\u064a": "ی", "\u0649": "ی", "\u06d2": "ی",   # ي ى ے
+    "\u0643": "ک", "\u06a9": "ک",                   # ك
+    "\u0629": "ه", "\u06c0": "ه",                   # ة ۀ
+    "\u0623": "ا", "\u0625": "ا", "\u0622": "ا", "\u0671": "ا",  # أ إ آ ٱ
+    "\u0624": "و",                                   # ؤ
+    "\u0626": "ی",                                   # ئ
+    "\u200c": " ", "\u200d": "", "\u200f": "", "\u200e": "",  # ZWNJ → فاصله، بقیهٔ کاراکترهای جهت/اتصال حذف
+    "\u0640": "",                                    # کشیده (ـ)
+    **{chr(0x06F0 + i): str(i) for i in range(10)},  # ارقام فارسی
+    **{chr(0x0660 + i): str(i) for i in range(10)},  # ارقام عربی
+})
+_DIACRITICS_RE = re.compile("[\u064b-\u065f\u0670\u06d6-\u06ed]")
+_SPACES_RE = re.compile(r"\s+")
+
+def normalize_fa(text_: Optional[str]) -> str:
+    """کلید جستجو: یکسان‌سازی ی/ک و همزه‌ها، حذف اعراب و کشیده، ZWNJ→فاصله، ارقام لاتین، casefold."""
+    if not text_:
+        return ""
+    s = _DIACRITICS_RE.sub("", text_.translate(_FA_TRANSLATE))
+    return _SPACES_RE.sub(" ", s.casefold()).strip()
+
+def search_key_filter(column, q: str):
+    """شرط «شامل q» روی ستون search_key (عبارت هم نرمال و % و _ آن escape می‌شود)."""
+    return column.contains(normalize_fa(q), autoescape=True)
+
+def tokens(q: str) -> list[str]:
+    return _TOKEN_RE.findall(normalize_fa(q))
+
+def fts5_query(q: str) -> Optional[str]:
+    """هر کلمه به‌صورت پیشوندی و همه با AND: «تهران کمپ» → "تهران"* "کمپ"*"""
+    toks = tokens(q)
+    if not toks:
+        return None
+    return " ".join(f'"{t}"*' for t in toks)
+
+def tsquery(q: str) -> Optional[str]:
+    toks = tokens(q)
+    if not toks:
+        return None
+    return " & ".join(f"{t}:*" for t in toks)
+
+
+# ---------- PostgreSQL ----------
+
+def campaign_tsvector(*columns):
+    """عبارت tsvector روی ستون‌ها؛ ایندکس و کوئری باید دقیقاً همین عبارت را بسازند."""
+    doc = func.coalesce(columns[0], text("''"))
+    for col in columns[1:]:
+        doc = doc + text("' '") + func.coalesce(col, text("''"))
+    return func.to_tsvector(text("'simple'"), doc)
+
+
+# ---------- SQLite FTS5 ----------
+
+_sqlite_fts: Optional[bool] = None  # None = هنوز بررسی نشده
+
+def _fts_table_exists(connection) -> bool:
+    row = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:n"), {"n": FTS_TABLE}
+    ).first()
+    return row is not None
+
+def sqlite_fts_ready(connection) -> bool:
+    global _sqlite_fts
+    if connection.dialect.name != "sqlite":
+        return False
+    if _sqlite_fts is None:
+        _sqlite_fts = _fts_table_exists(connection)
+    return _sqlite_fts
+
+def create_search_objects(connection):
+    """
+    (sync؛ از init_db با run_sync) جدول FTS5 را اگر نبود می‌سازد و از روی campaigns پر می‌کند.
+    اگر SQLite بدون FTS5 کامپایل شده باشد، جستجو روی LIKE می‌ماند.
+    """
+    global _sqlite_fts
+    if connection.dialect.name != "sqlite":
+        return
+    if _fts_table_exists(connection):
+        _sqlite_fts = True
+        return
+    cols = ", ".join(FTS_COLUMNS)
+    try:
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5({cols}, tokenize='unicode61 remove_diacritics 2')"
+        ))
+    except Exception:
+        _sqlite_fts = False
+        return
+    _sqlite_fts = True
+    rebuild_campaign_fts(connection)
+
+def rebuild_campaign_fts(connection):
+    """محتوای campaigns_fts را از نو (با متن نرمال‌شده) از روی campaigns می‌سازد."""
+    cols = ", ".join(FTS_COLUMNS)
+    rows = connection.execute(text(f"SELECT id, {cols} FROM campaigns")).all()
+    connection.execute(text(f"DELETE FROM {FTS_TABLE}"))
+    if rows:
+        params = ", ".join(f":{c}" for c in FTS_COLUMNS)
+        connection.execute(
+            text(f"INSERT INTO {FTS_TABLE}(rowid, {cols}) VALUES (:id, {params})"),
+            [{"id": r[0], **{c: normalize_fa(v) for c, v in zip(FTS_COLUMNS, r[1:])}} for r in rows],
+        )
+
+def sync_campaign_fts(connection, campaign_id: int, values: Optional[dict]):
+    """values=None یعنی حذف؛ وگرنه ردیف FTS این کمپین با values جایگزین می‌شود."""
+    if not sqlite_fts_ready(connection):
+        return
+    connection.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {"id": campaign_id})
+    if values is None:
+        return
+    cols = ", ".join(FTS_COLUMNS)
+    params = ", ".join(f":{c}" for c in FTS_COLUMNS)
+    connection.execute(
+        text(f"INSERT INTO {FTS_TABLE}(rowid, {cols}) VALUES (:id, {params})"),
+        {"id": campaign_id, **{c: normalize_fa(values.get(c)) for c in FTS_COLUMNS}},
+    )
+
+
+# ---------- سمت کوئری ----------
+
+def apply_campaign_search(base, q: str, dialect_name: str, Campaign):
+    """
+    فیلتر جستجو را به base (select روی Campaign) اضافه می‌کند.
+    خروجی: (base, rank) ــ rank ستونی است که مقدار کمترش یعنی مرتبط‌تر؛ اگر رتبه‌بندی نداریم None.
+    """
+    if dialect_name == "sqlite" and _sqlite_fts:
+        match = fts5_query(q)
+        if match:
+            weights = ", ".join(str(w) for w in FTS_WEIGHTS)
+            fts = text(
+                f"SELECT rowid AS campaign_id, bm25({FTS_TABLE}, {weights}) AS rank "
+                f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :fts_q"
+            ).bindparams(fts_q=match).columns(campaign_id=Integer, rank=Float).subquery("fts")
+            base = base.join(fts, fts.c.campaign_id == Campaign.id)
+            return base.add_columns(fts.c.rank), fts.c.rank
+
+    if dialect_name == "postgresql":
+        tsq = tsquery(q)
+        if tsq:
+            vec = campaign_tsvector(Campaign.search_key)
+            query = func.to_tsquery(text("'simple'"), tsq)
+            rank = (-func.ts_rank(vec, query)).label("rank")
+            base = base.where(vec.op("@@")(query))
+            return base.add_columns(rank), rank
+
+    return base.where(search_key_filter(Campaign.search_key, q)), None
+
+
+# ---------- جستجوی فازی نام واحدها (trigram در حافظه) ----------
+
+# کوتاه‌تر از این، سه‌حرفی‌های padشده فقط ابتدای کلمه‌ها را پیدا می‌کنند نه وسطشان (LIKE بهتر است)
+FUZZY_MIN_CHARS = 3
+
+def trigrams(text_: str) -> set[str]:
+    """سه‌حرفی‌های هر کلمه با دو فاصلهٔ ابتدا و یک فاصلهٔ انتها (مثل pg_trgm)."""
+    grams: set[str] = set()
+    for word in normalize_fa(text_).split():
+        w = f"  {word} "
+        grams.update(w[i:i + 3] for i in range(len(w) - 2))
+    return grams
+
+class UnitHit(NamedTuple):
+    id: int
+    name: str
+    type: str
+    parent_id: Optional[int]
+    score: float
+
+class TrigramIndex:
+    """
+    ایندکس trigram نام واحدها در حافظه (یک بار در on_startup پر می‌شود و با رویدادهای Unit به‌روز می‌ماند).
+    جستجو هیچ کوئری DB نمی‌زند؛ نوع و محدوده (زیردرخت scope_root) هم از همین نقشه‌ها چک می‌شوند.
+    posting listها به تفکیک نوع واحد نگه داشته می‌شوند چون پیکر والد همیشه یک نوع را می‌خواهد.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self._units: dict[int, tuple[str, str, Optional[int], str]] = {}  # id → (name, type, parent_id, key)
+        self._grams: dict[int, set[str]] = {}
+        self._postings: dict[str, dict[str, set[int]]] = {}  # type → gram → ids
+
+    def rebuild(self, rows: Iterable[tuple[int, str, str, Optional[int]]]):
+        self._units.clear(); self._grams.clear(); self._postings.clear()
+        for uid, name, utype, parent_id in rows:
+            self.upsert(uid, name, utype, parent_id)
+        self.ready = True
+
+    def upsert(self, uid: int, name: str, utype: str, parent_id: Optional[int]):
+        self.remove(uid)
+        grams = trigrams(name)
+        self._units[uid] = (name, utype, parent_id, normalize_fa(name))
+        self._grams[uid] = grams
+        postings = self._postings.setdefault(utype, {})
+        for g in grams:
+            postings.setdefault(g, set()).add(uid)
+
+    def remove(self, uid: int):
+        unit = self._units.pop(uid, None)
+        grams = self._grams.pop(uid, ())
+        if unit is None:
+            return
+        postings = self._postings.get(unit[1], {})
+        for g in grams:
+            ids = postings.get(g)
+            if ids:
+                ids.discard(uid)
+                if not ids:
+                    del postings[g]
+
+    def in_scope(self, uid: int, root_id: int, memo: Optional[dict[int, bool]] = None) -> bool:
+        memo = {} if memo is None else memo
+        path = []
+        cur: Optional[int] = uid
+        result = False
+        while cur is not None:
+            if cur in memo:
+                result = memo[cur]
+                break
+            if cur == root_id:
+                result = True
+                break
+            if cur in path:  # حلقه در داده‌ها
+                break
+            path.append(cur)
+            unit = self._units.get(cur)
+            cur = unit[2] if unit else None
+        for p in path:
+            memo[p] = result
+        return result
+
+    def search(self, q: str, *, utype: Optional[str] = None, scope_root: Optional[int] = None,
+               limit: Optional[int] = 100, min_score: float = 0.3) -> list[UnitHit]:
+        """
+        امتیاز = سهم سه‌حرفی‌های عبارت که در نام هست (غلط تایپی جزئی هم پیدا می‌شود)؛
+        اگر عبارت عیناً داخل نام باشد امتیاز ۱. تساوی با شباهت Jaccard و بعد نام شکسته می‌شود.
+        limit=None: همهٔ نتایج (برای شمارش کل و صفحه‌بندی).
+        """
+        qkey = normalize_fa(q)
+        qgrams = trigrams(qkey)
+        if not qgrams:
+            return []
+        types = [utype] if utype else list(self._postings)
+        shared: Counter[int] = Counter()
+        for t in types:
+            postings = self._postings.get(t, {})
+            shared.update(chain.from_iterable(postings.get(g, ()) for g in qgrams))
+
+        nq = len(qgrams)
+        need = max(1, math.ceil(min_score * nq))
+        units, grams = self._units, self._grams
+        ranked = []
+        for uid, n in shared.items():
+            name, _, _, key = units[uid]
+            exact = qkey in key
+            if n < need and not exact:
+                continue
+            score = 1.0 if exact else n / nq
+            ranked.append((-score, -n / (nq + len(grams[uid]) - n), name, uid))
+
+        # محدوده فقط برای بهترین‌ها (به ترتیب) چک می‌شود، نه همهٔ کاندیدها
+        heapq.heapify(ranked)
+        memo: dict[int, bool] = {}
+        out: list[UnitHit] = []
+        while ranked and (limit is None or len(out) < limit):
+            neg_score, _, name, uid = heapq.heappop(ranked)
+            if scope_root is not None and not self.in_scope(uid, scope_root, memo):
+                continue
+            _, t, parent_id, _ = units[uid]
+            out.append(UnitHit(uid, name, t, parent_id, round(-neg_score, 2)))
+        return out
+
+
+unit_index = TrigramIndex()
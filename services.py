@@ -5,7 +5,7 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from models import Campaign, CampaignCopy, Report, ReportItem, ReportItemRef, Unit
 from crud import (
-    child_units, parent_unit_id, get_campaign, platforms_from_json, create_campaign_v2
+    child_units, parent_unit_id, get_campaign, platforms_from_mask, create_campaign_v2
 )
 from utils import now_iso
 
@@ -46,7 +46,7 @@ async def copy_campaign_one_level(session: AsyncSession, src_campaign_id: int, t
             owner_unit_id=tuid,
             owner_admin_id=by_admin_id,
             name=src.name,
-            platforms=platforms_from_json(src.platforms),  # ← لیست
+            platforms=platforms_from_mask(src.platforms_mask),  # ← لیست
             description=src.description,
             hashtag=src.hashtag,
             city_label=src.city,